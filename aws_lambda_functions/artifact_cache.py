@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_clients import resolve_client
+
+# Cache local e versionado dos artefatos do modelo (modelo, scaler, colunas).
+# - Cada artefato é identificado pela sua versão no repositório (VersionId/ETag no S3).
+# - A verificação de novas versões é barata (HEAD) e feita no máximo a cada refresh_interval_s.
+# - Os artefatos são baixados em paralelo e a troca para a nova versão é uma única atribuição:
+#   requisições em andamento continuam usando a versão que já tinham em mãos.
+# - O download pede exatamente a versão vista no HEAD (VersionId, ou o ETag com IfMatch em buckets
+#   sem versionamento) e registra a versão devolvida pelo GET: uma publicação entre o HEAD e o GET
+#   não grava bytes novos sob a versão antiga.
+# - Modelo, scaler e colunas devem vir da mesma publicação (metadado publish-id gravado pelo
+#   train_model.py --upload): um conjunto misto, visto no meio de uma publicação, é recusado e a
+#   versão ativa é mantida até a próxima verificação.
+# - Uma cópia válida em /tmp (versão igual à remota e checksum conferido) é reaproveitada
+#   sem novo download, inclusive quando o ambiente da Lambda é reinicializado.
+
+DEFAULT_CACHE_DIR = "/tmp/model_artifacts"
+# Metadado do objeto S3 que identifica a publicação (mesmo valor para todos os artefatos de um upload)
+PUBLISH_ID_METADATA = "publish-id"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    return _file_digest(path, hashlib.sha256(), chunk_size)
+
+
+def _file_digest(path, digest, chunk_size=1024 * 1024):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _object_version(response):
+    return response.get("VersionId") or response["ETag"].strip('"')
+
+
+class S3ArtifactStore:
+    """
+    Repositório de artefatos em um bucket S3.
+    s3_client pode ser o cliente ou uma função que o cria, chamada só no primeiro acesso.
+    """
+
+    def __init__(self, s3_client, bucket):
+        self._s3_client = s3_client
+        self.bucket = bucket
+        self._versioned = {} # chave -> se a versão do último HEAD é um VersionId
+
+    @property
+    def s3_client(self):
+        return resolve_client(self._s3_client)
+
+    def head(self, key):
+        """
+        Devolve (versão atual, publicação): a versão é o VersionId se o bucket for versionado,
+        senão o ETag; a publicação é o metadado publish-id (None se o objeto não o tiver).
+        """
+        response = self.s3_client.head_object(Bucket=self.bucket, Key=key)
+        self._versioned[key] = bool(response.get("VersionId"))
+        return _object_version(response), response.get("Metadata", {}).get(PUBLISH_ID_METADATA)
+
+    def download(self, key, path, version):
+        """Baixa exatamente a versão pedida (falha se ela não for mais a atual, sem versionamento). Devolve a versão lida."""
+        if self._versioned.get(key):
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=key, VersionId=version)
+        else:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=key, IfMatch=f'"{version}"')
+        with open(path, "wb") as f:
+            shutil.copyfileobj(response["Body"], f, 1024 * 1024)
+        return _object_version(response)
+
+    def describe(self, key):
+        return f"s3://{self.bucket}/{key}"
+
+
+class LocalArtifactStore:
+    """
+    Substituto do bucket de artefatos baseado em sistema de arquivos (testes e execução local).
+    A versão de cada arquivo é o MD5 do conteúdo, como o ETag do S3 para uploads simples. Os
+    arquivos são empacotados juntos, então não há identificador de publicação.
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self._md5_cache = {}
+
+    def _path(self, key):
+        return os.path.join(self.root_dir, key)
+
+    def head(self, key):
+        path = self._path(key)
+        stat = os.stat(path)
+        cache_key = (path, stat.st_size, stat.st_mtime_ns)
+        if cache_key not in self._md5_cache:
+            self._md5_cache[cache_key] = _file_digest(path, hashlib.md5())
+        return self._md5_cache[cache_key], None
+
+    def download(self, key, path, version):
+        """Copia o arquivo e devolve a versão (MD5) da cópia."""
+        shutil.copyfile(self._path(key), path)
+        return _file_digest(path, hashlib.md5())
+
+    def describe(self, key):
+        return self._path(key)
+
+
+class ArtifactCache:
+    """
+    Mantém a versão mais recente de um conjunto de artefatos carregada em memória.
+
+    artifacts: {nome: (chave no repositório, função que carrega o arquivo local)}
+    build: função que recebe {nome: objeto carregado} e devolve o objeto servido por get()
+           (ex: o estado de inferência com estruturas pré-computadas).
+    """
+
+    def __init__(self, store, artifacts, build, cache_dir=DEFAULT_CACHE_DIR, refresh_interval_s=300.0,
+                 max_workers=None):
+        self.store = store
+        self.artifacts = artifacts
+        self.build = build
+        self.cache_dir = cache_dir
+        self.refresh_interval_s = refresh_interval_s
+        self.max_workers = max_workers or len(artifacts)
+
+        self._current = None # objeto construído pela versão ativa
+        self._versions = {} # nome -> versão ativa
+        self._objects = {} # nome -> objeto carregado da versão ativa
+        self._last_check = 0.0
+        self._refresh_lock = threading.Lock()
+        self.stats = {"checks": 0, "downloads": 0, "local_hits": 0, "swaps": 0}
+
+    @property
+    def versions(self):
+        return dict(self._versions)
+
+    def get(self):
+        """
+        Devolve o objeto ativo. Na primeira chamada carrega os artefatos (bloqueante).
+        Depois, se o intervalo de verificação passou, checa novas versões; se outra thread
+        já estiver atualizando, devolve imediatamente a versão atual sem esperar.
+        """
+        current = self._current
+        if current is None:
+            with self._refresh_lock:
+                if self._current is None:
+                    self._refresh()
+            return self._current
+
+        if self._refresh_due():
+            if self._refresh_lock.acquire(blocking=False):
+                try:
+                    if self._refresh_due():
+                        self._refresh()
+                except Exception as e:
+                    # Falha ao checar/baixar nova versão não derruba o serviço: mantém a versão ativa
+                    print(f"Erro ao atualizar artefatos, mantendo a versão atual: {e}")
+                finally:
+                    self._refresh_lock.release()
+        return self._current
+
+    def _refresh_due(self):
+        if self.refresh_interval_s is None or self.refresh_interval_s < 0:
+            return False
+        return time.monotonic() - self._last_check >= self.refresh_interval_s
+
+    def _refresh(self):
+        names = list(self.artifacts)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            heads = dict(zip(names, executor.map(lambda n: self.store.head(self.artifacts[n][0]), names)))
+            self.stats["checks"] += 1
+            self._last_check = time.monotonic()
+            remote_versions = {n: version for n, (version, _) in heads.items()}
+            publish_ids = {n: publish_id for n, (_, publish_id) in heads.items()}
+            if len(set(publish_ids.values())) > 1:
+                # Publicação em andamento (ou artefatos publicados separadamente): não mistura versões
+                raise ValueError(f"Artefatos de publicações diferentes: {publish_ids}")
+
+            changed = [n for n in names if remote_versions[n] != self._versions.get(n)]
+            if not changed:
+                return
+            fetched = dict(zip(changed, executor.map(lambda n: self._fetch_and_load(n, remote_versions[n]), changed)))
+
+        for name, (_, origin) in fetched.items():
+            key = self.artifacts[name][0]
+            print(f"{name} carregado de {self.store.describe(key)} (versão {remote_versions[name]}, {origin})")
+        objects = {**self._objects, **{name: obj for name, (obj, _) in fetched.items()}}
+        built = self.build(objects)
+        # Troca atômica: leitores veem a versão antiga ou a nova, nunca uma mistura
+        self._objects = objects
+        self._versions = {**self._versions, **{n: remote_versions[n] for n in changed}}
+        self._current = built
+        self.stats["swaps"] += 1
+        print(f"Artefatos ativos: {self._versions}")
+
+    def _paths(self, name):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, name)
+        return path, path + ".manifest.json"
+
+    def _local_copy_valid(self, name, version):
+        path, manifest_path = self._paths(name)
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return manifest.get("version") == version and os.path.exists(path) and file_sha256(path) == manifest.get("sha256")
+
+    def _fetch_and_load(self, name, version):
+        """Garante uma cópia local válida da versão pedida e a carrega. Devolve (objeto, origem)."""
+        key, loader = self.artifacts[name]
+        path, manifest_path = self._paths(name)
+        if self._local_copy_valid(name, version):
+            self.stats["local_hits"] += 1
+            origin = "cópia local reutilizada"
+        else:
+            # Baixa para um arquivo temporário e só então substitui a cópia anterior
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            fetched_version = self.store.download(key, tmp_path, version)
+            if fetched_version != version:
+                os.remove(tmp_path)
+                raise ValueError(f"{self.store.describe(key)}: versão {fetched_version} baixada, {version} esperada")
+            manifest = {"key": key, "version": version, "sha256": file_sha256(tmp_path)}
+            os.replace(tmp_path, path)
+            with open(manifest_path + ".tmp", "w") as f:
+                json.dump(manifest, f)
+            os.replace(manifest_path + ".tmp", manifest_path)
+            self.stats["downloads"] += 1
+            origin = "download"
+        return loader(path), origin
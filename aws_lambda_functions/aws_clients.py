@@ -0,0 +1,17 @@
+import functools
+
+# Clientes boto3 criados sob demanda e reaproveitados entre invocações.
+# Importar o boto3 e criar um cliente custa centenas de milissegundos no início a frio; adiar
+# esse custo para o primeiro uso evita pagá-lo quando o cliente não é necessário (ex: artefatos
+# empacotados com a função ou estado de janelamento em diretório local).
+
+
+@functools.lru_cache(maxsize=None)
+def get_client(service_name):
+    import boto3
+    return boto3.client(service_name)
+
+
+def resolve_client(client):
+    """Aceita um cliente pronto ou uma função sem argumentos que o cria (ex: lambda: get_client("s3"))."""
+    return client() if callable(client) else client
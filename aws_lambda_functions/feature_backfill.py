@@ -0,0 +1,384 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import as_completed
+
+import pandas as pd
+
+import feature_engine
+import lambda_process_data
+from aws_clients import get_client, resolve_client
+from feature_compaction import list_objects
+from fleet_processing import _make_executor, split_by_turbine
+from window_state import advance_windows
+
+# Reprocessamento em lote (backfill) das features a partir dos objetos brutos do Firehose.
+# Quando a janela, o passo ou as features mudam, reconstruir as features reenviando um evento S3
+# por objeto leva dias; o backfill lista os objetos de um prefixo/período e os distribui em um
+# pool de processos.
+#
+# Os objetos (em ordem de chave, que no Firehose é a ordem de entrega) são divididos em blocos
+# contíguos. Cada processo janela um bloco em sequência, com o estado por turbina em memória, e
+# antes lê os objetos imediatamente anteriores ao bloco (aquecimento) para que as janelas que
+# atravessam a fronteira entre dois blocos não se percam. Para que blocos processados de forma
+# independente concordem sobre onde as janelas começam, os inícios de janela são alinhados a uma
+# grade fixa (múltiplos de STEP_MINUTES desde a época), e cada janela pertence ao objeto em que
+# termina: o resultado não depende da divisão em blocos nem do número de processos.
+# O aquecimento é verificado por turbina: os objetos anteriores são lidos até cobrir uma janela
+# antes da primeira leitura de cada turbina no bloco, no máximo max_lookback_objects. Turbinas que
+# o limite deixa sem cobertura (ex: turbinas esparsas) são informadas no log e contadas em
+# lookback_uncovered_turbines, pois janelas da fronteira do bloco podem faltar para elas (uma
+# turbina cuja primeira leitura está no bloco também é contada, sem perda).
+# O janelamento ao vivo (lambda_process_data) alinha as janelas a partir do início de cada
+# turbina, então as janelas do backfill podem estar deslocadas em relação às do modo incremental.
+#
+# O trabalho concluído fica em um manifesto (JSON no bucket processado) identificado pelo hash da
+# configuração das features (janela, passo, código do feature_engine, destino e pontuação): cada
+# objeto é registrado com a sua impressão digital (ETag). Uma nova execução com a mesma
+# configuração pula os objetos inalterados e continua de onde uma execução interrompida parou;
+# com outra configuração, tudo é refeito. As features são gravadas com o mesmo nome de arquivo do
+# processamento normal (<objeto de origem>_features.parquet), então refazer um objeto sobrescreve
+# os seus arquivos. O backfill não altera o estado de janelamento nem os rollups do histórico.
+
+DEFAULT_MANIFEST_PREFIX = "backfill/"
+DEFAULT_OBJECTS_PER_SHARD = 8
+DEFAULT_MAX_LOOKBACK_OBJECTS = 8
+MANIFEST_SAVE_INTERVAL_S = 10.0
+_KEY_DATE_PATTERN = re.compile(r"(\d{4})/(\d{2})/(\d{2})/")
+
+
+def feature_config(window_size_points, step_points, features_path, inline_scoring=False):
+    """Configuração que determina as features geradas (o código do feature_engine entra pelo hash do arquivo)."""
+    with open(feature_engine.__file__, "rb") as f:
+        engine_hash = hashlib.sha256(f.read()).hexdigest()
+    return {
+        "window_size_points": window_size_points,
+        "step_points": step_points,
+        "alignment": "grid",
+        "feature_engine_sha256": engine_hash,
+        "features_path": features_path,
+        "inline_scoring": inline_scoring,
+    }
+
+
+def config_hash(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def object_fingerprint(item):
+    """ETag do objeto (listagem do S3), ou tamanho e data de modificação na falta dele."""
+    return item.get("ETag") or f"{item.get('Size')}:{item.get('LastModified')}"
+
+
+def object_date(item):
+    """Dia ("AAAA-MM-DD") de um objeto bruto: o da chave do Firehose (AAAA/MM/DD/HH/) ou o da modificação."""
+    match = _KEY_DATE_PATTERN.search(item["Key"])
+    if match:
+        return "-".join(match.groups())
+    last_modified = item.get("LastModified")
+    if last_modified is None:
+        return None
+    if isinstance(last_modified, (int, float)):
+        return pd.Timestamp(last_modified, unit="s").strftime("%Y-%m-%d")
+    return pd.Timestamp(last_modified).strftime("%Y-%m-%d")
+
+
+def grid_start(timestamp, step_points):
+    """Primeiro início de janela da grade (múltiplos de step_points minutos desde a época) a partir de timestamp."""
+    return pd.Timestamp(timestamp).ceil(f"{step_points}min")
+
+
+class BackfillManifest:
+    """Objetos já processados com uma configuração de features: {chave: {"fingerprint", "windows", "files"}}."""
+
+    def __init__(self, config, objects=None):
+        self.config = config
+        self.objects = dict(objects or {})
+
+    def is_done(self, item):
+        entry = self.objects.get(item["Key"])
+        return entry is not None and entry.get("fingerprint") == object_fingerprint(item)
+
+    def to_json(self):
+        return json.dumps({"config": self.config, "objects": self.objects})
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        return cls(data["config"], data.get("objects"))
+
+
+def read_readings(bucket, key):
+    df_raw = lambda_process_data.read_raw_object(f"s3://{bucket}/{key}")
+    if "timestamp" in df_raw.columns:
+        df_raw["timestamp"] = pd.to_datetime(df_raw["timestamp"])
+    return df_raw
+
+
+class Lookback:
+    """
+    Leituras de aquecimento de um bloco: os objetos anteriores ao bloco (do mais próximo ao mais
+    distante) são lidos sob demanda até que cada turbina tenha leituras desde o primeiro início de
+    janela da grade que cabe antes da sua primeira leitura no bloco. Turbinas esparsas podem exigir vários objetos.
+    reaches_start: keys chega ao primeiro objeto da listagem (antes dele não há leituras a buscar).
+    """
+
+    def __init__(self, bucket, keys, window_size_points, step_points, reaches_start):
+        self.bucket = bucket
+        self.pending = list(keys)
+        self.window_size_points = window_size_points
+        self.step_points = step_points
+        self.reaches_start = reaches_start
+        self.frames = {}
+        self.uncovered = []
+
+    def _covers(self, turbine_id, needed_from):
+        return any(frame["timestamp"].min() <= needed_from for frame in self.frames.get(turbine_id, ()))
+
+    def readings(self, turbine_id, first_timestamp):
+        """Leituras anteriores da turbina (DataFrame ou None), lendo mais objetos se necessário."""
+        needed_from = grid_start(first_timestamp - pd.Timedelta(minutes=self.window_size_points - 1), self.step_points)
+        while self.pending and not self._covers(turbine_id, needed_from):
+            key = self.pending.pop(0)
+            df_raw = read_readings(self.bucket, key)
+            if df_raw.empty or "timestamp" not in df_raw.columns:
+                continue
+            for other_id, df_turbine in split_by_turbine(df_raw, lambda_process_data.extract_turbine_id(key)).items():
+                self.frames.setdefault(other_id, []).append(df_turbine)
+        if not self._covers(turbine_id, needed_from) and not self.reaches_start:
+            # Limite de objetos de aquecimento atingido: as janelas da fronteira desta turbina podem faltar
+            print(f"Aquecimento insuficiente para {turbine_id} antes de {first_timestamp}: "
+                  f"janelas na fronteira do bloco podem faltar (aumente max_lookback_objects).")
+            self.uncovered.append(turbine_id)
+        frames = self.frames.get(turbine_id)
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def start_turbine(df_turbine, lookback, window_size_points, step_points):
+    """
+    Primeiras leituras de uma turbina no bloco: as do aquecimento que cabem em uma janela antes da
+    primeira leitura, a partir de um início de janela da grade. Devolve (leituras, primeira leitura do bloco).
+    """
+    first_timestamp = df_turbine["timestamp"].min()
+    earliest = first_timestamp - pd.Timedelta(minutes=window_size_points - 1)
+    if lookback is not None and not lookback.empty:
+        lookback = lookback[(lookback["timestamp"] >= earliest) & (lookback["timestamp"] < first_timestamp)]
+        df_turbine = pd.concat([lookback, df_turbine], ignore_index=True)
+    start = grid_start(max(earliest, df_turbine["timestamp"].min()), step_points)
+    return df_turbine[df_turbine["timestamp"] >= start], first_timestamp
+
+
+def process_shard(task):
+    """
+    Processa um bloco de objetos em sequência (executado em um processo do pool).
+    Devolve ([(chave, janelas, arquivos gravados)], na ordem do bloco, e as turbinas sem aquecimento suficiente).
+    """
+    bucket, keys, lookback_keys, reaches_start, window_size_points, step_points, features_path, inline_scoring = task
+    states = {}
+    first_timestamps = {}
+    lookback = Lookback(bucket, lookback_keys, window_size_points, step_points, reaches_start)
+    results = []
+    for key in keys:
+        df_raw = read_readings(bucket, key)
+        if df_raw.empty or "timestamp" not in df_raw.columns:
+            results.append((key, 0, 0))
+            continue
+
+        feature_frames = []
+        for turbine_id, df_turbine in split_by_turbine(df_raw, lambda_process_data.extract_turbine_id(key)).items():
+            if turbine_id not in states:
+                first_timestamp = df_turbine["timestamp"].min()
+                df_turbine, first_timestamps[turbine_id] = start_turbine(
+                    df_turbine, lookback.readings(turbine_id, first_timestamp), window_size_points, step_points)
+            features, states[turbine_id], _ = advance_windows(states.get(turbine_id), df_turbine,
+                                                              window_size_points, step_points)
+            # Janelas que terminam antes do bloco pertencem ao bloco anterior
+            features = features[pd.to_datetime(features["window_end_timestamp"]) >= first_timestamps[turbine_id]] \
+                if not features.empty else features
+            if not features.empty:
+                features["turbine_id"] = turbine_id
+                feature_frames.append(features)
+
+        if not feature_frames:
+            results.append((key, 0, 0))
+            continue
+        df_processed = pd.concat(feature_frames, ignore_index=True)
+        if inline_scoring:
+            try:
+                df_processed = lambda_process_data.score_windows(df_processed)
+            except Exception as e:
+                print(f"Erro ao pontuar as janelas de {key}; features gravadas sem predições: {e}")
+        paths = lambda_process_data.write_feature_partitions(df_processed, key, base_path=features_path)
+        results.append((key, len(df_processed), len(paths)))
+    return results, lookback.uncovered
+
+
+class FeatureBackfill:
+    """
+    Reconstrói as features dos objetos brutos sob raw_prefix em features_path, em um pool de processos.
+    features_path não pode ser o FEATURES_BASE_PATH do processamento ao vivo: as janelas do backfill
+    são alinhadas de outra forma e os arquivos têm os mesmos nomes, então sobrescreveriam os do
+    modo incremental (e a compactação juntaria os dois alinhamentos na mesma partição).
+    s3_client pode ser o cliente ou uma função que o cria, chamada só no primeiro acesso.
+    """
+
+    def __init__(self, s3_client, raw_bucket, raw_prefix, features_path, manifest_bucket=None,
+                 window_size_points=None, step_points=None, workers=None, objects_per_shard=DEFAULT_OBJECTS_PER_SHARD,
+                 max_lookback_objects=DEFAULT_MAX_LOOKBACK_OBJECTS, manifest_prefix=DEFAULT_MANIFEST_PREFIX,
+                 inline_scoring=False):
+        if features_path.rstrip("/") == lambda_process_data.FEATURES_BASE_PATH.rstrip("/"):
+            raise ValueError(f"O backfill não pode gravar em {lambda_process_data.FEATURES_BASE_PATH} (features do "
+                             f"processamento ao vivo); use um novo prefixo.")
+        self._s3_client = s3_client
+        self.raw_bucket = raw_bucket
+        self.raw_prefix = raw_prefix
+        self.manifest_bucket = manifest_bucket or lambda_process_data.PROCESSED_DATA_BUCKET
+        self.features_path = features_path
+        self.window_size_points = window_size_points or lambda_process_data.WINDOW_SIZE_MINUTES
+        self.step_points = step_points or lambda_process_data.STEP_MINUTES
+        self.workers = workers or os.cpu_count() or 1
+        self.objects_per_shard = max(1, objects_per_shard)
+        self.max_lookback_objects = max_lookback_objects
+        self.inline_scoring = inline_scoring
+        self.config = feature_config(self.window_size_points, self.step_points, self.features_path, inline_scoring)
+        self.manifest_key = f"{manifest_prefix}manifest-{config_hash(self.config)}.json"
+
+    @property
+    def s3_client(self):
+        return resolve_client(self._s3_client)
+
+    def load_manifest(self):
+        try:
+            response = self.s3_client.get_object(Bucket=self.manifest_bucket, Key=self.manifest_key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return BackfillManifest(self.config)
+        return BackfillManifest.from_json(response["Body"].read())
+
+    def save_manifest(self, manifest):
+        self.s3_client.put_object(Bucket=self.manifest_bucket, Key=self.manifest_key, Body=manifest.to_json())
+
+    def plan(self, items, manifest, start_date=None, end_date=None):
+        """
+        Divide os objetos pendentes do período em blocos contíguos de até objects_per_shard objetos.
+        Devolve [(chaves do bloco, chaves de aquecimento, se o aquecimento chega ao início da listagem)],
+        com o aquecimento do mais próximo ao mais distante.
+        """
+        shards = []
+        run = []
+
+        def close_run(end_index):
+            for offset in range(0, len(run), self.objects_per_shard):
+                first_index = end_index - len(run) + offset
+                lookback = [items[i]["Key"] for i in range(first_index - 1, max(-1, first_index - 1 - self.max_lookback_objects), -1)]
+                shards.append(([item["Key"] for item in run[offset:offset + self.objects_per_shard]], lookback,
+                               first_index <= self.max_lookback_objects))
+            run.clear()
+
+        for index, item in enumerate(items):
+            date = object_date(item)
+            in_range = ((start_date is None or (date is not None and date >= start_date))
+                        and (end_date is None or (date is not None and date <= end_date)))
+            if in_range and not manifest.is_done(item):
+                run.append(item)
+            elif run:
+                close_run(index)
+        if run:
+            close_run(len(items))
+        return shards
+
+    def run(self, start_date=None, end_date=None):
+        """Processa os objetos pendentes com data entre start_date e end_date ("AAAA-MM-DD", inclusive). Devolve as estatísticas."""
+        manifest = self.load_manifest()
+        items = [item for item in list_objects(self.s3_client, self.raw_bucket, self.raw_prefix)
+                 if not item["Key"].endswith("/")]
+        items.sort(key=lambda item: item["Key"])
+        shards = self.plan(items, manifest, start_date, end_date)
+        items_by_key = {item["Key"]: item for item in items}
+        pending = sum(len(keys) for keys, _, _ in shards)
+        print(f"Backfill {self.manifest_key}: {len(items)} objetos, {pending} a processar em {len(shards)} blocos "
+              f"({self.workers} processos).")
+
+        stats = {"objects": 0, "objects_skipped": len(items) - pending, "windows": 0, "files_written": 0,
+                 "bytes_read": 0, "failed_shards": 0, "lookback_uncovered_turbines": 0}
+        start = time.perf_counter()
+        last_save = start
+        tasks = [(self.raw_bucket, keys, lookback, reaches_start, self.window_size_points, self.step_points,
+                  self.features_path, self.inline_scoring) for keys, lookback, reaches_start in shards]
+        try:
+            with _make_executor(max(1, min(self.workers, len(tasks) or 1))) as executor:
+                futures = {executor.submit(process_shard, task): task for task in tasks}
+                for future in as_completed(futures):
+                    try:
+                        results, uncovered = future.result()
+                    except Exception as e:
+                        # O bloco fica fora do manifesto e é refeito na próxima execução
+                        print(f"Erro no bloco que começa em {futures[future][1][0]}: {e}")
+                        stats["failed_shards"] += 1
+                        continue
+                    # Contado (e não refeito): aumentar max_lookback_objects muda só o aquecimento
+                    stats["lookback_uncovered_turbines"] += len(uncovered)
+                    for key, windows, files in results:
+                        item = items_by_key[key]
+                        manifest.objects[key] = {"fingerprint": object_fingerprint(item), "windows": windows, "files": files}
+                        stats["objects"] += 1
+                        stats["windows"] += windows
+                        stats["files_written"] += files
+                        stats["bytes_read"] += item.get("Size", 0)
+                    elapsed = time.perf_counter() - start
+                    print(f"[{stats['objects']}/{pending}] {stats['objects'] / elapsed:,.1f} objetos/s, "
+                          f"{stats['bytes_read'] / elapsed / 1e6:,.1f} MB/s, {stats['windows']} janelas")
+                    if time.perf_counter() - last_save >= MANIFEST_SAVE_INTERVAL_S:
+                        self.save_manifest(manifest)
+                        last_save = time.perf_counter()
+        finally:
+            # Mesmo se interrompido, o que já foi concluído fica registrado
+            self.save_manifest(manifest)
+
+        stats["elapsed_s"] = time.perf_counter() - start
+        stats["objects_per_s"] = stats["objects"] / stats["elapsed_s"] if stats["elapsed_s"] > 0 else None
+        stats["windows_per_s"] = stats["windows"] / stats["elapsed_s"] if stats["elapsed_s"] > 0 else None
+        print(f"Backfill concluído: {json.dumps(stats)}")
+        return stats
+
+
+def parse_s3_uri(uri):
+    """s3://bucket/prefixo -> (bucket, prefixo)."""
+    if not uri.startswith("s3://"):
+        raise ValueError(f"URI S3 inválida: {uri}")
+    bucket, _, prefix = uri[len("s3://"):].partition("/")
+    return bucket, prefix
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reconstrói as features a partir dos objetos brutos do Firehose.")
+    parser.add_argument("raw", help="Prefixo dos objetos brutos (s3://bucket/prefixo/).")
+    parser.add_argument("--start-date", default=None, help="Primeiro dia (AAAA-MM-DD) dos objetos processados.")
+    parser.add_argument("--end-date", default=None, help="Último dia (AAAA-MM-DD) dos objetos processados.")
+    parser.add_argument("--features-path", required=True,
+                        help="Destino das features (s3://bucket/prefixo/), diferente do FEATURES_BASE_PATH do processamento ao vivo.")
+    parser.add_argument("--window-size", type=int, default=None, help="Janela em minutos (padrão: WINDOW_SIZE_MINUTES).")
+    parser.add_argument("--step", type=int, default=None, help="Passo em minutos (padrão: STEP_MINUTES).")
+    parser.add_argument("--workers", type=int, default=None, help="Número de processos (padrão: núcleos da máquina).")
+    parser.add_argument("--objects-per-shard", type=int, default=DEFAULT_OBJECTS_PER_SHARD)
+    parser.add_argument("--max-lookback-objects", type=int, default=DEFAULT_MAX_LOOKBACK_OBJECTS,
+                        help="Máximo de objetos anteriores lidos no aquecimento de cada bloco.")
+    parser.add_argument("--score", action="store_true", help="Pontua as janelas como o INLINE_SCORING.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    raw_bucket, raw_prefix = parse_s3_uri(args.raw)
+    backfill = FeatureBackfill(
+        lambda: get_client("s3"), raw_bucket, raw_prefix, args.features_path,
+        window_size_points=args.window_size,
+        step_points=args.step,
+        workers=args.workers,
+        objects_per_shard=args.objects_per_shard,
+        max_lookback_objects=args.max_lookback_objects,
+        inline_scoring=args.score,
+    )
+    backfill.run(args.start_date, args.end_date)
@@ -0,0 +1,241 @@
+import io
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from aws_clients import resolve_client
+
+# Compactação dos arquivos pequenos de features.
+# A lambda_process_data grava um <objeto de origem>_features.parquet por partição
+# (features/turbine_id=<id>/date=<AAAA-MM-DD>/) a cada objeto do Firehose; com o tempo cada
+# partição acumula dezenas de arquivos de poucos KB e listar/ler o histórico fica lento.
+# A compactação junta os arquivos de cada partição em um único compacted.parquet:
+# - linhas ordenadas por window_end_timestamp, com estatísticas por row group (mín/máx) e a
+#   ordenação declarada nos metadados, para que leitores pulem row groups fora do filtro;
+# - uma janela (window_end_timestamp) aparece uma vez só: se um objeto for reprocessado depois
+#   de compactado, a versão mais recente da janela substitui a que já estava no compacted.parquet,
+#   então compactar de novo a mesma partição dá o mesmo resultado (idempotente);
+# - só os arquivos lidos são apagados, e apenas se não mudaram desde a leitura (mesmo ETag):
+#   arquivos gravados durante a compactação ficam para a próxima execução. Entre a gravação do
+#   compacted.parquet e a remoção dos arquivos pequenos, um leitor pode ver as janelas repetidas.
+# O progresso de uma execução fica em um checkpoint (JSON no bucket): uma execução interrompida
+# (ex: limite de tempo da Lambda) continua de onde parou. Execuções concorrentes não são
+# coordenadas: o agendamento deve disparar uma de cada vez.
+
+COMPACTED_FILE_NAME = "compacted.parquet"
+SORT_COLUMN = "window_end_timestamp"
+DEFAULT_ROW_GROUP_SIZE = 65536
+DEFAULT_CHECKPOINT_KEY = "compaction/checkpoint.json"
+
+
+def list_objects(s3_client, bucket, prefix):
+    """Gera os objetos (itens de Contents do list_objects_v2) sob prefix, página a página."""
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        yield from response.get("Contents", [])
+        if not response.get("IsTruncated"):
+            return
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def list_feature_partitions(s3_client, bucket, prefix="features/"):
+    """
+    Agrupa os arquivos Parquet de features por partição.
+    Devolve {"turbine_id=<id>/date=<dia>": [objetos]}, com o compacted.parquet (se houver) primeiro
+    e os demais na ordem de gravação (LastModified, ou a chave na falta dele).
+    """
+    partitions = {}
+    for item in list_objects(s3_client, bucket, prefix):
+        relative = item["Key"][len(prefix):]
+        partition, _, file_name = relative.rpartition("/")
+        if not partition or not file_name.endswith(".parquet"):
+            continue
+        partitions.setdefault(partition, []).append(item)
+    for items in partitions.values():
+        items.sort(key=lambda item: (not item["Key"].endswith("/" + COMPACTED_FILE_NAME),
+                                     str(item.get("LastModified", "")), item["Key"]))
+    return partitions
+
+
+def partition_date(partition):
+    """Dia ("AAAA-MM-DD") de uma partição turbine_id=<id>/date=<dia>, ou None."""
+    for part in partition.split("/"):
+        if part.startswith("date="):
+            return part[len("date="):]
+    return None
+
+
+def needs_compaction(items):
+    """Uma partição precisa de compactação se tiver algum arquivo além do compacted.parquet."""
+    return any(not item["Key"].endswith("/" + COMPACTED_FILE_NAME) for item in items)
+
+
+def merge_feature_tables(tables):
+    """
+    Junta as tabelas de uma partição (na ordem de gravação), ordena por window_end_timestamp e
+    mantém uma linha por janela, a da tabela mais recente. Colunas ausentes em algumas tabelas
+    (ex: predições do INLINE_SCORING) ficam nulas.
+    """
+    table = pa.concat_tables(tables, promote_options="permissive")
+    if SORT_COLUMN not in table.column_names or table.num_rows == 0:
+        return table
+    timestamps = table.column(SORT_COLUMN).cast(pa.int64()).to_numpy(zero_copy_only=False)
+    # Ordem estável por timestamp; em empates a linha mais recente (maior posição) vem primeiro
+    order = np.lexsort((-np.arange(len(timestamps)), timestamps))
+    ordered = timestamps[order]
+    keep = np.concatenate(([True], ordered[1:] != ordered[:-1]))
+    return table.take(pa.array(order[keep]))
+
+
+def table_to_bytes(table, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    sorting = []
+    if SORT_COLUMN in table.column_names:
+        sorting = [pq.SortingColumn(table.column_names.index(SORT_COLUMN))]
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, row_group_size=row_group_size, write_statistics=True,
+                   sorting_columns=sorting or None)
+    return buffer.getvalue()
+
+
+def compact_partition(s3_client, bucket, prefix, partition, items, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Compacta uma partição: lê os arquivos listados, grava o compacted.parquet e apaga os arquivos
+    pequenos que não mudaram desde a leitura. Devolve estatísticas da partição.
+    """
+    compacted_key = f"{prefix}{partition}/{COMPACTED_FILE_NAME}"
+    tables = []
+    etags = {}
+    bytes_read = 0
+    for item in items:
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=item["Key"])
+        except s3_client.exceptions.NoSuchKey:
+            continue # Apagado desde a listagem (ex: outra compactação)
+        data = response["Body"].read()
+        bytes_read += len(data)
+        etags[item["Key"]] = response.get("ETag")
+        tables.append(pq.read_table(io.BytesIO(data)))
+
+    stats = {"files_read": len(tables), "bytes_read": bytes_read, "rows": 0, "bytes_written": 0, "files_deleted": 0}
+    if not tables:
+        return stats
+    table = merge_feature_tables(tables)
+    data = table_to_bytes(table, row_group_size)
+    s3_client.put_object(Bucket=bucket, Key=compacted_key, Body=data)
+    stats["rows"] = table.num_rows
+    stats["bytes_written"] = len(data)
+
+    for key, etag in etags.items():
+        if key == compacted_key:
+            continue
+        # Arquivo regravado (reprocessamento) ou apagado durante a compactação: fica como está
+        try:
+            if etag is not None and s3_client.head_object(Bucket=bucket, Key=key).get("ETag") != etag:
+                continue
+        except Exception as e:
+            print(f"Arquivo {key} não foi apagado: {e}")
+            continue
+        s3_client.delete_object(Bucket=bucket, Key=key)
+        stats["files_deleted"] += 1
+    return stats
+
+
+class CompactionCheckpoint:
+    """Progresso de uma execução da compactação: partições concluídas e totais acumulados."""
+
+    def __init__(self, run_id=None, completed=None, stats=None, finished=False):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.completed = set(completed or ())
+        self.stats = stats or {}
+        self.finished = finished
+
+    def to_json(self):
+        return json.dumps({"run_id": self.run_id, "completed": sorted(self.completed), "stats": self.stats,
+                           "finished": self.finished})
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        return cls(data["run_id"], data.get("completed"), data.get("stats"), data.get("finished", False))
+
+
+class FeatureCompactor:
+    """
+    Executa a compactação de todas as partições de features sob prefix.
+    s3_client pode ser o cliente ou uma função que o cria, chamada só no primeiro acesso.
+    """
+
+    def __init__(self, s3_client, bucket, prefix="features/", checkpoint_key=DEFAULT_CHECKPOINT_KEY,
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE, workers=8):
+        self._s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.checkpoint_key = checkpoint_key
+        self.row_group_size = row_group_size
+        self.workers = workers
+
+    @property
+    def s3_client(self):
+        return resolve_client(self._s3_client)
+
+    def load_checkpoint(self):
+        """Checkpoint de uma execução interrompida, ou um novo se a anterior terminou (ou não existir)."""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.checkpoint_key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return CompactionCheckpoint()
+        checkpoint = CompactionCheckpoint.from_json(response["Body"].read())
+        if checkpoint.finished:
+            return CompactionCheckpoint()
+        print(f"Retomando a compactação {checkpoint.run_id}: {len(checkpoint.completed)} partições já concluídas.")
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint):
+        self.s3_client.put_object(Bucket=self.bucket, Key=self.checkpoint_key, Body=checkpoint.to_json())
+
+    def run(self, max_date=None, time_left_s=None, min_time_left_s=60.0):
+        """
+        Compacta as partições pendentes com data até max_date ("AAAA-MM-DD"; None = todas).
+        time_left_s: função que devolve o tempo restante (ex: da Lambda); a execução para e
+        grava o checkpoint quando restar menos que min_time_left_s. Devolve o checkpoint.
+        """
+        checkpoint = self.load_checkpoint()
+        partitions = list_feature_partitions(self.s3_client, self.bucket, self.prefix)
+        pending = [
+            (partition, items) for partition, items in sorted(partitions.items())
+            if partition not in checkpoint.completed and needs_compaction(items)
+            and (max_date is None or (partition_date(partition) or "") <= max_date)
+        ]
+        print(f"{len(partitions)} partições, {len(pending)} a compactar (execução {checkpoint.run_id}).")
+
+        def compact(task):
+            partition, items = task
+            return partition, compact_partition(self.s3_client, self.bucket, self.prefix, partition, items,
+                                                self.row_group_size)
+
+        start = time.perf_counter()
+        chunk_size = max(1, self.workers) * 4
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            for offset in range(0, len(pending), chunk_size):
+                if time_left_s is not None and time_left_s() < min_time_left_s:
+                    print(f"Tempo esgotado: {len(pending) - offset} partições ficam para a próxima execução.")
+                    checkpoint.stats["elapsed_s"] = checkpoint.stats.get("elapsed_s", 0.0) + time.perf_counter() - start
+                    self.save_checkpoint(checkpoint)
+                    return checkpoint
+                for partition, stats in executor.map(compact, pending[offset:offset + chunk_size]):
+                    checkpoint.completed.add(partition)
+                    checkpoint.stats["partitions"] = checkpoint.stats.get("partitions", 0) + 1
+                    for name, value in stats.items():
+                        checkpoint.stats[name] = checkpoint.stats.get(name, 0) + value
+                self.save_checkpoint(checkpoint)
+
+        checkpoint.finished = True
+        checkpoint.stats["elapsed_s"] = checkpoint.stats.get("elapsed_s", 0.0) + time.perf_counter() - start
+        self.save_checkpoint(checkpoint)
+        return checkpoint
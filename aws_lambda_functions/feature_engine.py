@@ -0,0 +1,191 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Motor de janelamento vetorizado usado pela lambda_process_data.
+# Em vez de fatiar o DataFrame janela a janela e chamar calculate_features para cada
+# fatia, as estatísticas de todas as janelas são calculadas de uma só vez sobre uma
+# visão deslizante (sem cópia) dos valores de cada coluna numérica.
+# O resultado é idêntico ao produzido pelo laço original (mesmas colunas, mesma ordem,
+# mesmos dtypes e mesma aritmética de ponto flutuante que o pandas usa internamente).
+
+STAT_NAMES = ("mean", "std", "min", "max", "median")
+
+# Features espectrais (FFT) das colunas de vibração, calculadas para todas as janelas em uma
+# única chamada de np.fft.rfft. As leituras chegam a cada minuto (taxa de 1/60 Hz).
+SPECTRAL_COLUMNS = ("vibration_x_g", "vibration_y_g")
+NUM_SPECTRAL_BANDS = 3
+SAMPLE_RATE_HZ = 1.0 / 60.0
+
+
+def window_start_indices(num_points, window_size_points, step_points):
+    """Índices iniciais das janelas, na mesma sequência do laço range() original."""
+    return np.arange(0, num_points - window_size_points + 1, step_points, dtype=np.int64)
+
+
+def _window_view(values, window_size_points, step_points):
+    """Visão (num_janelas, tamanho_janela) sobre um vetor contíguo, sem copiar dados."""
+    values = np.ascontiguousarray(values)
+    return sliding_window_view(values, window_size_points)[::step_points]
+
+
+def _column_stats(values, window_size_points, step_points):
+    """
+    Calcula mean/std/min/max/median para todas as janelas de uma coluna.
+    Replica o comportamento de pandas (skipna=True, ddof=1): a soma é feita em float64
+    sobre a memória contígua da janela, exatamente como Series.mean()/std() fazem.
+    """
+    windows = _window_view(values, window_size_points, step_points)
+    as_float = windows.astype(np.float64, copy=False)
+
+    if values.dtype.kind == "f":
+        mask = np.isnan(as_float)
+        has_nan = bool(mask.any())
+    else:
+        mask = None
+        has_nan = False
+
+    if has_nan:
+        filled = np.where(mask, 0.0, as_float)
+        count = (~mask).sum(axis=1).astype(np.float64)
+    else:
+        filled = as_float
+        count = np.full(len(windows), float(window_size_points))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total = filled.sum(axis=1, dtype=np.float64)
+        mean = total / count
+
+        sqr = (mean[:, None] - filled) ** 2
+        if has_nan:
+            sqr[mask] = 0.0
+        ddof_count = count - 1
+        var = sqr.sum(axis=1, dtype=np.float64) / ddof_count
+        var[ddof_count <= 0] = np.nan
+        std = np.sqrt(var)
+
+    if has_nan:
+        min_ = np.fmin.reduce(windows, axis=1)
+        max_ = np.fmax.reduce(windows, axis=1)
+        with warnings.catch_warnings():
+            # Janelas totalmente NaN: o pandas devolve NaN sem emitir aviso
+            warnings.simplefilter("ignore", RuntimeWarning)
+            median = np.nanmedian(as_float, axis=1)
+    else:
+        min_ = windows.min(axis=1)
+        max_ = windows.max(axis=1)
+        median = np.median(as_float, axis=1)
+
+    return {"mean": mean, "std": std, "min": min_, "max": max_, "median": median}
+
+
+def _window_label(label_series, window_size_points, step_points):
+    """1 se qualquer ponto da janela tiver label diferente de zero (equivale a Series.any())."""
+    values = label_series.to_numpy()
+    if values.dtype.kind == "f":
+        flags = np.nan_to_num(values, nan=0.0) != 0
+    else:
+        flags = pd.notna(values) & (values != 0)
+    return _window_view(np.asarray(flags, dtype=bool), window_size_points, step_points).any(axis=1).astype(np.int64)
+
+
+def spectral_feature_names(column, num_bands=NUM_SPECTRAL_BANDS):
+    """Nomes das features espectrais de uma coluna, na ordem em que são geradas."""
+    return ([f"{column}_rms"] + [f"{column}_band_{band}_energy" for band in range(num_bands)]
+            + [f"{column}_dominant_freq_hz", f"{column}_spectral_kurtosis"])
+
+
+def compute_spectral_features(df, window_size_points, step_points, columns=SPECTRAL_COLUMNS,
+                              num_bands=NUM_SPECTRAL_BANDS, sample_rate_hz=SAMPLE_RATE_HZ):
+    """
+    Features no domínio da frequência para as colunas de vibração presentes em df:
+    - rms: raiz do valor quadrático médio do sinal na janela;
+    - band_<k>_energy: energia (potência de um lado, pelo teorema de Parseval) em num_bands faixas
+      de mesma largura entre a primeira frequência e a de Nyquist; as faixas somam a variância
+      (ddof=0) da janela;
+    - dominant_freq_hz: frequência de maior potência (sem a componente contínua);
+    - spectral_kurtosis: curtose do espectro de potência (picos estreitos, típicos de defeitos
+      em rolamentos e engrenagens, geram valores altos; 0 para espectro constante).
+    A média da janela é removida antes da FFT e leituras ausentes são tratadas como a média.
+    Devolve {nome da feature: vetor com um valor por janela}.
+    """
+    columns = [col for col in columns if col in df.columns]
+    if not columns or window_size_points < 2:
+        return {}
+
+    # (colunas, janelas, pontos): uma única FFT para todas as colunas e janelas
+    windows = np.stack([
+        _window_view(df[col].to_numpy(dtype=np.float64), window_size_points, step_points) for col in columns
+    ])
+    with warnings.catch_warnings():
+        # Janelas totalmente NaN geram NaN (mesmo comportamento das estatísticas)
+        warnings.simplefilter("ignore", RuntimeWarning)
+        rms = np.sqrt(np.nanmean(windows ** 2, axis=-1))
+        centered = np.nan_to_num(windows - np.nanmean(windows, axis=-1, keepdims=True), nan=0.0)
+
+    spectrum = np.fft.rfft(centered, axis=-1)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    # Potência de um lado normalizada: a soma sobre as frequências positivas é a variância
+    power[..., 1:] *= 2.0
+    if window_size_points % 2 == 0:
+        power[..., -1] /= 2.0 # A frequência de Nyquist não tem par negativo
+    power /= window_size_points ** 2
+    power = power[..., 1:] # Remove a componente contínua (zerada pela remoção da média)
+    freqs = np.fft.rfftfreq(window_size_points, d=1.0 / sample_rate_hz)[1:]
+
+    band_edges = np.linspace(0, power.shape[-1], num_bands + 1).round().astype(int)
+    band_energy = [power[..., a:b].sum(axis=-1) for a, b in zip(band_edges[:-1], band_edges[1:])]
+
+    dominant_freq = freqs[power.argmax(axis=-1)]
+
+    power_mean = power.mean(axis=-1, keepdims=True)
+    deviation = power - power_mean
+    power_var = (deviation ** 2).mean(axis=-1)
+    fourth_moment = (deviation ** 4).mean(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        kurtosis = np.where(power_var > 0, fourth_moment / power_var ** 2, 0.0)
+
+    features = {}
+    for i, col in enumerate(columns):
+        values = [rms[i]] + [energy[i] for energy in band_energy] + [dominant_freq[i], kurtosis[i]]
+        features.update(zip(spectral_feature_names(col, num_bands), values))
+    return features
+
+
+def compute_window_features(df, window_size_points, step_points, spectral_columns=SPECTRAL_COLUMNS):
+    """
+    Calcula as features de todas as janelas deslizantes de df em uma única passada.
+
+    Com spectral_columns=(), equivale a montar pd.DataFrame([calculate_features(df.iloc[i : i + window_size_points])
+    for i in range(0, len(df) - window_size_points + 1, step_points)]), mas sem o laço
+    Python por janela. Por padrão também inclui as features espectrais das colunas de
+    vibração (compute_spectral_features), logo após as estatísticas. df deve estar ordenado por timestamp.
+    """
+    starts = window_start_indices(len(df), window_size_points, step_points)
+    if len(starts) == 0:
+        return pd.DataFrame()
+
+    columns = {}
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            stats = _column_stats(df[col].to_numpy(), window_size_points, step_points)
+            for stat_name in STAT_NAMES:
+                columns[f"{col}_{stat_name}"] = stats[stat_name]
+
+    if spectral_columns:
+        columns.update(compute_spectral_features(df, window_size_points, step_points, spectral_columns))
+
+    # Mesma semântica de label de calculate_features: janela anômala se qualquer ponto for anômalo.
+    if "label" in df.columns:
+        columns["label"] = _window_label(df["label"], window_size_points, step_points)
+    else:
+        columns["label"] = np.zeros(len(starts), dtype=np.int64)
+
+    if "timestamp" in df.columns:
+        # Último timestamp de cada janela como referência
+        ends = starts + window_size_points - 1
+        columns["window_end_timestamp"] = df["timestamp"].iloc[ends].to_numpy()
+
+    return pd.DataFrame(columns)
@@ -0,0 +1,208 @@
+import queue
+import random
+import threading
+import time
+
+from aws_clients import resolve_client
+
+# Envio de registros para o Kinesis Data Firehose (PutRecordBatch).
+# - Os batches são montados respeitando os dois limites do serviço: 500 registros e 4 MiB.
+# - Vários batches ficam em voo ao mesmo tempo (threads) com uma fila limitada, de modo que
+#   quem produz os registros é desacelerado quando o Firehose não acompanha (backpressure).
+# - Em falhas parciais (FailedPutCount > 0) somente as entradas com ErrorCode em
+#   RequestResponses são reenviadas, com backoff exponencial e jitter.
+
+MAX_RECORDS_PER_BATCH = 500
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+MAX_RECORD_BYTES = 1000 * 1024
+
+# Erros da chamada inteira que valem nova tentativa (os demais falham o batch imediatamente)
+RETRYABLE_ERROR_CODES = {
+    "ServiceUnavailableException",
+    "ThrottlingException",
+    "LimitExceededException",
+    "InternalFailure",
+    "InternalServerError",
+}
+
+
+class PartialBatchFailure(Exception):
+    """Entradas de um batch que continuaram com ErrorCode após todas as novas tentativas."""
+
+    def __init__(self, failed_count, error_codes):
+        super().__init__(f"{failed_count} registros recusados pelo Firehose após as novas tentativas: {error_codes}")
+        self.failed_count = failed_count
+        self.error_codes = error_codes
+
+
+def _error_code(exception):
+    return getattr(exception, "response", {}).get("Error", {}).get("Code")
+
+
+class FirehoseSender:
+    """
+    Agrupa registros em batches por quantidade e bytes e os envia em paralelo.
+    client pode ser o cliente do Firehose ou uma função que o cria (ex: lambda: get_client("firehose")).
+
+    Uso:
+        with FirehoseSender(firehose_client, "stream") as sender:
+            for record in records:
+                sender.send(json.dumps(record).encode("utf-8"))
+        print(sender.stats)
+    """
+
+    def __init__(self, client, stream_name, max_records=MAX_RECORDS_PER_BATCH, max_batch_bytes=MAX_BATCH_BYTES,
+                 max_in_flight=4, queue_size=8, max_retries=5, base_backoff_s=0.1, max_backoff_s=5.0):
+        if not 0 < max_records <= MAX_RECORDS_PER_BATCH:
+            raise ValueError(f"max_records deve estar entre 1 e {MAX_RECORDS_PER_BATCH}.")
+        if not 0 < max_batch_bytes <= MAX_BATCH_BYTES:
+            raise ValueError(f"max_batch_bytes deve estar entre 1 e {MAX_BATCH_BYTES}.")
+        self.client = resolve_client(client)
+        self.stream_name = stream_name
+        self.max_records = max_records
+        self.max_batch_bytes = max_batch_bytes
+        self.max_retries = max_retries
+        self.base_backoff_s = base_backoff_s
+        self.max_backoff_s = max_backoff_s
+
+        self._batch = []
+        self._batch_bytes = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.last_error = None
+        self.stats = {
+            "records_sent": 0,
+            "records_failed": 0,
+            "bytes_sent": 0,
+            "batches": 0,
+            "put_calls": 0,
+            "retried_records": 0,
+            "elapsed_s": 0.0,
+            "records_per_second": 0.0,
+        }
+        self._start = time.perf_counter()
+        self._workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(max_in_flight)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def send(self, data):
+        """Adiciona um registro (bytes) ao batch corrente; envia o batch quando um limite é atingido."""
+        if self._closed:
+            raise RuntimeError("FirehoseSender já foi fechado.")
+        size = len(data)
+        if size > MAX_RECORD_BYTES:
+            raise ValueError(f"Registro com {size} bytes excede o limite do Firehose de {MAX_RECORD_BYTES} bytes.")
+        if self._batch and (len(self._batch) >= self.max_records or self._batch_bytes + size > self.max_batch_bytes):
+            self._enqueue_batch()
+        self._batch.append({"Data": data})
+        self._batch_bytes += size
+
+    def flush(self):
+        """Envia o batch parcial e espera todos os batches em voo terminarem."""
+        if self._batch:
+            self._enqueue_batch()
+        self._queue.join()
+
+    def close(self):
+        """Envia o que falta, encerra as threads e devolve as estatísticas."""
+        if self._closed:
+            return self.stats
+        self.flush()
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        elapsed = time.perf_counter() - self._start
+        self.stats["elapsed_s"] = elapsed
+        self.stats["records_per_second"] = self.stats["records_sent"] / elapsed if elapsed > 0 else 0.0
+        return self.stats
+
+    def _enqueue_batch(self):
+        batch = self._batch
+        self._batch, self._batch_bytes = [], 0
+        # Bloqueia quando a fila está cheia: limita a memória e o número de batches pendentes
+        self._queue.put(batch)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._send_batch(item)
+            except Exception as e:
+                # Nunca deixar uma thread morrer com batches ainda na fila
+                self.last_error = e
+                print(f"Erro inesperado ao enviar batch para o Firehose: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_backoff_s, self.base_backoff_s * (2 ** (attempt - 1))))
+
+    def _send_batch(self, records):
+        with self._lock:
+            self.stats["batches"] += 1
+        pending = records
+        attempt = 0
+        while pending:
+            try:
+                with self._lock:
+                    self.stats["put_calls"] += 1
+                response = self.client.put_record_batch(DeliveryStreamName=self.stream_name, Records=pending)
+            except Exception as e:
+                self.last_error = e
+                code = _error_code(e)
+                if (code is not None and code not in RETRYABLE_ERROR_CODES) or attempt >= self.max_retries:
+                    print(f"Erro ao enviar batch para o Kinesis Data Firehose ({len(pending)} registros descartados): {e}")
+                    self._record_failure(pending)
+                    return
+                attempt += 1
+                self._record_retry(pending)
+                time.sleep(self._backoff(attempt))
+                continue
+
+            if response.get("FailedPutCount", 0) == 0:
+                self._record_success(pending)
+                return
+
+            # Reenvia apenas as entradas que falharam (mesma posição em RequestResponses)
+            results = response.get("RequestResponses", [])
+            if len(results) == len(pending):
+                failed = [record for record, result in zip(pending, results) if result.get("ErrorCode")]
+                self._record_success([record for record, result in zip(pending, results) if not result.get("ErrorCode")])
+            else:
+                failed = pending
+            error_codes = sorted({result["ErrorCode"] for result in results if result.get("ErrorCode")})
+            if attempt >= self.max_retries:
+                print(f"Falha ao enviar {len(failed)} registros após {attempt} novas tentativas: {error_codes}")
+                self.last_error = PartialBatchFailure(len(failed), error_codes)
+                self._record_failure(failed)
+                return
+            attempt += 1
+            self._record_retry(failed)
+            time.sleep(self._backoff(attempt))
+            pending = failed
+
+    def _record_success(self, records):
+        num_bytes = sum(len(record["Data"]) for record in records)
+        with self._lock:
+            self.stats["records_sent"] += len(records)
+            self.stats["bytes_sent"] += num_bytes
+
+    def _record_failure(self, records):
+        with self._lock:
+            self.stats["records_failed"] += len(records)
+
+    def _record_retry(self, records):
+        with self._lock:
+            self.stats["retried_records"] += len(records)
@@ -0,0 +1,77 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+from window_state import advance_windows
+
+# Processamento de objetos do Firehose com leituras de várias turbinas misturadas.
+# As leituras são agrupadas pelo campo turbine_id de cada registro e as janelas de cada
+# turbina são calculadas de forma independente, em paralelo entre os núcleos disponíveis.
+# As features resultantes são organizadas em partições turbine_id=<id>/date=<AAAA-MM-DD>.
+
+TURBINE_ID_COLUMN = "turbine_id"
+UNKNOWN_TURBINE_ID = "unknown_turbine"
+
+
+def split_by_turbine(df_raw, default_turbine_id=UNKNOWN_TURBINE_ID):
+    """
+    Separa as leituras por turbina. Devolve {turbine_id: DataFrame sem a coluna turbine_id}.
+    Registros sem turbine_id (ou objetos sem a coluna) ficam com default_turbine_id.
+    """
+    if TURBINE_ID_COLUMN not in df_raw.columns:
+        return {default_turbine_id: df_raw}
+    turbine_ids = df_raw[TURBINE_ID_COLUMN].astype(object).where(df_raw[TURBINE_ID_COLUMN].notna(), default_turbine_id)
+    readings = df_raw.drop(columns=[TURBINE_ID_COLUMN])
+    return {str(turbine_id): group for turbine_id, group in readings.groupby(turbine_ids.astype(str), sort=True)}
+
+
+def window_turbine(turbine_id, df_turbine, state, window_size_points, step_points):
+    """Janela as leituras de uma turbina. Devolve (turbine_id, features, novo estado, descartadas)."""
+    features, new_state, num_dropped = advance_windows(state, df_turbine, window_size_points, step_points)
+    return turbine_id, features, new_state, num_dropped
+
+
+def _window_turbine_args(args):
+    return window_turbine(*args)
+
+
+def _make_executor(max_workers):
+    try:
+        return ProcessPoolExecutor(max_workers=max_workers)
+    except (OSError, NotImplementedError) as e:
+        # A AWS Lambda não tem /dev/shm (necessário para os semáforos do multiprocessing):
+        # nesse caso as turbinas são processadas em threads (o NumPy libera o GIL nos cálculos)
+        print(f"Pool de processos indisponível ({e}); usando threads.")
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+
+def window_fleet(groups, states, window_size_points, step_points, max_workers=None):
+    """
+    Calcula as janelas de todas as turbinas.
+    groups: {turbine_id: leituras}; states: {turbine_id: WindowState ou None}.
+    Devolve uma lista de (turbine_id, features, novo estado, descartadas), na ordem de groups.
+    """
+    tasks = [(turbine_id, df_turbine, states.get(turbine_id), window_size_points, step_points)
+             for turbine_id, df_turbine in groups.items()]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+    if max_workers <= 1:
+        return [window_turbine(*task) for task in tasks]
+    with _make_executor(max_workers) as executor:
+        return list(executor.map(_window_turbine_args, tasks))
+
+
+def feature_partitions(df_features):
+    """
+    Divide as features por turbina e dia (do window_end_timestamp).
+    Gera ((turbine_id, "AAAA-MM-DD"), DataFrame). Como no formato Hive, as colunas de partição
+    não são gravadas no arquivo: leitores com dataset=True as recuperam a partir do caminho.
+    """
+    dates = pd.to_datetime(df_features["window_end_timestamp"]).dt.strftime("%Y-%m-%d")
+    for (turbine_id, date), partition in df_features.groupby([df_features[TURBINE_ID_COLUMN], dates], sort=True):
+        yield (turbine_id, date), partition.drop(columns=[TURBINE_ID_COLUMN]).reset_index(drop=True)
+
+
+def partition_path(base_path, turbine_id, date, file_name):
+    """Caminho no formato Hive (turbine_id=<id>/date=<dia>/arquivo), reconhecido por Athena/Glue."""
+    return f"{base_path.rstrip('/')}/{TURBINE_ID_COLUMN}={turbine_id}/date={date}/{file_name}"
@@ -0,0 +1,239 @@
+import datetime
+import json
+import math
+import sqlite3
+import threading
+
+import numpy as np
+
+from aws_clients import resolve_client
+from rollup_store import sensor_columns
+
+# Estado atual da frota: uma entrada por turbina, atualizada pela lambda_process_data a cada
+# objeto processado e lida de uma só vez pelo dashboard (lambda_fleet_state), sem reenviar
+# janelas à lambda_predict_failure nem ler Parquet. Cada entrada traz:
+# - as features e a predição (classe, probabilidades e versão do modelo, com INLINE_SCORING) da
+#   janela mais recente da turbina;
+# - linhas de base por sensor: média e desvio padrão com média móvel exponencial (EWMA) no tempo
+#   (meia-vida FLEET_STATE_HALFLIFE_MINUTES), a última leitura e o seu desvio em relação à base;
+# - o timestamp da última leitura e da sua ingestão, e o horário da atualização, para medir o
+#   atraso entre a ingestão e o estado visto pelo dashboard.
+# A atualização é O(leituras novas) e o tamanho do estado não cresce com o histórico: ler a frota
+# custa o mesmo com um dia ou um ano de dados. Leituras com timestamp menor ou igual ao da última
+# incorporada são ignoradas (reentregas não contam duas vezes) e uma janela mais antiga que a
+# guardada não a substitui. Como no estado de janelamento, os objetos de uma turbina devem ser
+# processados em sequência.
+#
+# As entradas ficam em SQLite (execução local; ":memory:" para testes) ou em uma tabela do
+# DynamoDB com chave de partição turbine_id (na AWS, compartilhada entre as Lambdas).
+
+DEFAULT_HALFLIFE_MINUTES = 60.0
+PREDICTION_PREFIX = "prediction_"
+_EXCLUDED_FEATURES = {"label", "window_end_timestamp", "turbine_id"}
+
+
+def _json_value(value):
+    """Valor serializável em JSON: tipos do NumPy viram tipos Python e NaN vira None."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def _epoch_seconds(timestamps):
+    return timestamps.astype("datetime64[ns]").astype(np.int64) / 1e9
+
+
+def ewma_update(mean, second_moment, last_time_s, times_s, values, halflife_s):
+    """
+    Incorpora leituras (times_s crescentes, em segundos) a uma EWMA no tempo: cada leitura pesa
+    1 - exp(-dt / tau), dt desde a leitura anterior, e o passado decai por exp(-dt / tau).
+    Sem estado anterior (mean None), a média começa na primeira leitura. Devolve (média, segundo momento).
+    """
+    if mean is None:
+        mean, second_moment, last_time_s = values[0], values[0] ** 2, times_s[0]
+    tau = halflife_s / math.log(2.0)
+    previous_times = np.concatenate(([last_time_s], times_s[:-1]))
+    weights = -np.expm1(-(times_s - previous_times) / tau) * np.exp(-(times_s[-1] - times_s) / tau)
+    decay = math.exp(-(times_s[-1] - last_time_s) / tau)
+    return (float(mean * decay + np.dot(weights, values)),
+            float(second_moment * decay + np.dot(weights, values ** 2)))
+
+
+def apply_readings(entry, readings, halflife_s):
+    """Atualiza as linhas de base e a última leitura da entrada com as leituras novas. Devolve quantas foram incorporadas."""
+    if readings.empty or "timestamp" not in readings.columns:
+        return 0
+    readings = readings.dropna(subset=["timestamp"]).sort_values("timestamp")
+    # Timestamps com fuso (ex: ISO com "Z") viram UTC sem fuso, como no rollup_store
+    timestamps = readings["timestamp"].to_numpy(dtype="datetime64[ns]")
+    previous_time_s = None
+    if entry.get("last_reading_timestamp"):
+        last_timestamp = np.datetime64(entry["last_reading_timestamp"], "ns")
+        is_new = timestamps > last_timestamp
+        readings, timestamps = readings[is_new], timestamps[is_new]
+        previous_time_s = float(_epoch_seconds(np.array([last_timestamp]))[0])
+    if readings.empty:
+        return 0
+    times_s = _epoch_seconds(timestamps)
+
+    baselines = entry.setdefault("baselines", {})
+    for sensor in sensor_columns(readings):
+        values = readings[sensor].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        if not valid.any():
+            continue
+        baseline = baselines.get(sensor) or {}
+        mean, second_moment = ewma_update(baseline.get("mean"), baseline.get("m2"),
+                                          previous_time_s if baseline else None,
+                                          times_s[valid], values[valid], halflife_s)
+        std = math.sqrt(max(second_moment - mean ** 2, 0.0))
+        last = float(values[valid][-1])
+        baselines[sensor] = {
+            "mean": mean,
+            "std": std,
+            "m2": second_moment,
+            "last": last,
+            "deviation": (last - mean) / std if std > 0 else None,
+        }
+
+    entry["last_reading_timestamp"] = str(timestamps[-1].astype("datetime64[us]"))
+    if "ingestion_timestamp_utc" in readings.columns and readings["ingestion_timestamp_utc"].notna().any():
+        entry["last_ingestion_timestamp"] = _json_value(readings["ingestion_timestamp_utc"].dropna().max())
+    entry["readings_seen"] = entry.get("readings_seen", 0) + len(readings)
+    return len(readings)
+
+
+def apply_window(entry, window):
+    """Substitui as features e a predição pelas da janela (dict de uma linha de features), se ela for mais recente."""
+    window_end = _json_value(window.get("window_end_timestamp"))
+    if window_end is None or (entry.get("window_end_timestamp") or "") >= window_end:
+        return False
+    entry["window_end_timestamp"] = window_end
+    entry["features"] = {name: _json_value(value) for name, value in window.items()
+                         if name not in _EXCLUDED_FEATURES and not name.startswith(PREDICTION_PREFIX)}
+    entry["prediction"] = _json_value(window.get(f"{PREDICTION_PREFIX}label"))
+    proba_prefix = f"{PREDICTION_PREFIX}proba_"
+    entry["probabilities"] = {name[len(proba_prefix):]: _json_value(value) for name, value in window.items()
+                              if name.startswith(proba_prefix)}
+    entry["model_version"] = _json_value(window.get(f"{PREDICTION_PREFIX}model_version"))
+    return True
+
+
+def freshness(entry, now=None):
+    """Idade da entrada e atraso desde a ingestão da última leitura (segundos), no instante now (UTC)."""
+    now = now or datetime.datetime.utcnow()
+    result = {"age_s": None, "freshness_lag_s": None}
+    if entry.get("updated_at"):
+        result["age_s"] = (now - datetime.datetime.fromisoformat(entry["updated_at"])).total_seconds()
+    if entry.get("last_ingestion_timestamp"):
+        result["freshness_lag_s"] = (now - datetime.datetime.fromisoformat(entry["last_ingestion_timestamp"])).total_seconds()
+    return result
+
+
+class FleetStateStore:
+    """
+    Atualização e leitura do estado da frota. As subclasses implementam _load(turbine_id)
+    (dict ou None), _save(turbine_id, entry) e _load_all() (lista de dicts).
+    """
+
+    def __init__(self, halflife_minutes=DEFAULT_HALFLIFE_MINUTES):
+        self.halflife_s = halflife_minutes * 60.0
+
+    def update(self, turbine_id, readings, window=None, now=None):
+        """
+        Incorpora as leituras novas de uma turbina (DataFrame com timestamp em datetime) e a sua
+        janela mais recente (dict, opcional). Devolve a entrada gravada.
+        """
+        entry = self._load(turbine_id) or {"turbine_id": turbine_id}
+        apply_readings(entry, readings, self.halflife_s)
+        if window is not None:
+            apply_window(entry, window)
+        now = now or datetime.datetime.utcnow()
+        entry["updated_at"] = now.isoformat()
+        if entry.get("last_ingestion_timestamp"):
+            entry["ingest_lag_s"] = freshness(entry, now)["freshness_lag_s"]
+        self._save(turbine_id, entry)
+        return entry
+
+    def get(self, turbine_id):
+        return self._load(turbine_id)
+
+    def fleet(self):
+        """Entradas de todas as turbinas, ordenadas por turbine_id."""
+        return sorted(self._load_all(), key=lambda entry: entry["turbine_id"])
+
+
+class SQLiteFleetStateStore(FleetStateStore):
+    """Estado da frota em um arquivo SQLite (uma linha por turbina, com a entrada em JSON)."""
+
+    def __init__(self, path, halflife_minutes=DEFAULT_HALFLIFE_MINUTES):
+        super().__init__(halflife_minutes)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            # Leitores (ex: a API do dashboard em outro processo) não bloqueiam a gravação
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS fleet_state (turbine_id TEXT PRIMARY KEY, updated_at TEXT, entry TEXT NOT NULL)")
+        self._connection.commit()
+
+    def _load(self, turbine_id):
+        with self._lock:
+            row = self._connection.execute("SELECT entry FROM fleet_state WHERE turbine_id = ?", (turbine_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save(self, turbine_id, entry):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO fleet_state (turbine_id, updated_at, entry) VALUES (?, ?, ?) "
+                "ON CONFLICT(turbine_id) DO UPDATE SET updated_at = excluded.updated_at, entry = excluded.entry",
+                (turbine_id, entry.get("updated_at"), json.dumps(entry)))
+
+    def _load_all(self):
+        with self._lock:
+            rows = self._connection.execute("SELECT entry FROM fleet_state").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+class DynamoDBFleetStateStore(FleetStateStore):
+    """
+    Estado da frota em uma tabela do DynamoDB (chave de partição turbine_id, entrada em JSON no
+    atributo entry). dynamodb_client pode ser o cliente ou uma função que o cria, chamada só no primeiro acesso.
+    """
+
+    def __init__(self, dynamodb_client, table_name, halflife_minutes=DEFAULT_HALFLIFE_MINUTES):
+        super().__init__(halflife_minutes)
+        self._dynamodb_client = dynamodb_client
+        self.table_name = table_name
+
+    @property
+    def dynamodb_client(self):
+        return resolve_client(self._dynamodb_client)
+
+    def _load(self, turbine_id):
+        response = self.dynamodb_client.get_item(TableName=self.table_name, Key={"turbine_id": {"S": turbine_id}},
+                                                 ConsistentRead=True)
+        item = response.get("Item")
+        return json.loads(item["entry"]["S"]) if item else None
+
+    def _save(self, turbine_id, entry):
+        self.dynamodb_client.put_item(TableName=self.table_name, Item={
+            "turbine_id": {"S": turbine_id},
+            "updated_at": {"S": entry.get("updated_at") or ""},
+            "entry": {"S": json.dumps(entry)},
+        })
+
+    def _load_all(self):
+        entries = []
+        kwargs = {"TableName": self.table_name}
+        while True:
+            response = self.dynamodb_client.scan(**kwargs)
+            entries.extend(json.loads(item["entry"]["S"]) for item in response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                return entries
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
@@ -0,0 +1,63 @@
+import datetime
+import json
+import os
+
+from aws_clients import get_client
+from feature_compaction import DEFAULT_CHECKPOINT_KEY, DEFAULT_ROW_GROUP_SIZE, FeatureCompactor
+from metrics import instrumented
+
+# Compactação periódica das features (ex: regra agendada do EventBridge, uma vez por dia).
+# Junta os arquivos pequenos gravados pela lambda_process_data em um compacted.parquet por
+# partição turbine_id=<id>/date=<dia> (ver feature_compaction.py). A função deve ter
+# concorrência reservada 1: duas compactações simultâneas da mesma partição não são coordenadas.
+
+PROCESSED_DATA_BUCKET = os.environ.get("PROCESSED_DATA_BUCKET_NAME", "tcc-kelly-processed-turbine-data-bucket")
+FEATURES_PREFIX = os.environ.get("FEATURES_PREFIX", "features/")
+COMPACTION_CHECKPOINT_KEY = os.environ.get("COMPACTION_CHECKPOINT_KEY", DEFAULT_CHECKPOINT_KEY)
+# Só compacta partições com pelo menos este número de dias: as do dia corrente ainda recebem
+# arquivos e seriam regravadas a cada execução (0 compacta todas)
+COMPACTION_MIN_AGE_DAYS = int(os.environ.get("COMPACTION_MIN_AGE_DAYS", "1"))
+COMPACTION_WORKERS = int(os.environ.get("COMPACTION_WORKERS", "8"))
+COMPACTION_ROW_GROUP_SIZE = int(os.environ.get("COMPACTION_ROW_GROUP_SIZE", str(DEFAULT_ROW_GROUP_SIZE)))
+# Margem (segundos) antes do limite de tempo da Lambda para gravar o checkpoint e encerrar
+COMPACTION_MIN_TIME_LEFT_S = float(os.environ.get("COMPACTION_MIN_TIME_LEFT_S", "60"))
+
+# Cliente S3 criado apenas no primeiro acesso
+compactor = FeatureCompactor(lambda: get_client("s3"), PROCESSED_DATA_BUCKET, FEATURES_PREFIX,
+                             COMPACTION_CHECKPOINT_KEY, COMPACTION_ROW_GROUP_SIZE, COMPACTION_WORKERS)
+
+
+@instrumented("lambda_compact_features")
+def lambda_handler(event, context, metrics):
+    """
+    Função Lambda que compacta as partições de features.
+    O evento pode trazer min_age_days para substituir COMPACTION_MIN_AGE_DAYS.
+    Se o tempo da invocação acabar, o progresso fica no checkpoint e "finished" volta false:
+    a próxima invocação continua a mesma execução.
+    """
+    event = event or {}
+    min_age_days = int(event.get("min_age_days", COMPACTION_MIN_AGE_DAYS))
+    max_date = None
+    if min_age_days > 0:
+        max_date = (datetime.datetime.utcnow().date() - datetime.timedelta(days=min_age_days)).isoformat()
+    time_left_s = None
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        time_left_s = lambda: context.get_remaining_time_in_millis() / 1000.0
+
+    try:
+        with metrics.stage("compact"):
+            checkpoint = compactor.run(max_date=max_date, time_left_s=time_left_s,
+                                       min_time_left_s=COMPACTION_MIN_TIME_LEFT_S)
+    except Exception as e:
+        print(f"Erro ao compactar as features: {e}")
+        raise e # Nova tentativa da Lambda retoma a partir do checkpoint
+
+    stats = checkpoint.stats
+    metrics.set("partitions", stats.get("partitions", 0))
+    metrics.set("files_deleted", stats.get("files_deleted", 0))
+    metrics.set("payload_bytes", stats.get("bytes_read", 0))
+    print(f"Compactação {checkpoint.run_id} ({'concluída' if checkpoint.finished else 'interrompida'}): {json.dumps(stats)}")
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"run_id": checkpoint.run_id, "finished": checkpoint.finished, "stats": stats})
+    }
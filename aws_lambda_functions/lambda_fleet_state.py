@@ -0,0 +1,76 @@
+import datetime
+import json
+import os
+
+# Estado atual da frota para o dashboard (via API Gateway, GET): uma única leitura devolve a
+# entrada de todas as turbinas (janela e predição mais recentes, linhas de base EWMA por sensor),
+# mantida pela lambda_process_data (fleet_state.py). O custo não depende do tamanho do histórico.
+from aws_clients import get_client
+from fleet_state import DynamoDBFleetStateStore, SQLiteFleetStateStore, freshness
+from metrics import instrumented
+
+# Mesma tabela do DynamoDB (ou arquivo SQLite, em execução local) atualizada pela lambda_process_data
+FLEET_STATE_TABLE = os.environ.get("FLEET_STATE_TABLE", "")
+FLEET_STATE_DB = os.environ.get("FLEET_STATE_DB", "")
+
+fleet_state_store = None
+if FLEET_STATE_TABLE:
+    # Cliente DynamoDB criado apenas na primeira consulta
+    fleet_state_store = DynamoDBFleetStateStore(lambda: get_client("dynamodb"), FLEET_STATE_TABLE)
+elif FLEET_STATE_DB:
+    fleet_state_store = SQLiteFleetStateStore(FLEET_STATE_DB)
+
+
+@instrumented("lambda_fleet_state")
+def lambda_handler(event, context, metrics):
+    """
+    Função Lambda que devolve o estado atual de todas as turbinas.
+    Com features=false na query string, as features da janela mais recente são omitidas.
+    Cada turbina traz age_s (segundos desde a última atualização) e freshness_lag_s (segundos desde
+    a ingestão da última leitura incorporada).
+    """
+    params = (event or {}).get("queryStringParameters") or {}
+    include_features = str(params.get("features", "true")).lower() != "false"
+    if fleet_state_store is None:
+        return {
+            "statusCode": 500,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"error": "Estado da frota não configurado (FLEET_STATE_TABLE ou FLEET_STATE_DB)."})
+        }
+
+    try:
+        with metrics.stage("query"):
+            entries = fleet_state_store.fleet()
+    except Exception as e:
+        print(f"Erro ao ler o estado da frota: {e}")
+        return {
+            "statusCode": 500,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"error": f"Erro ao ler o estado da frota: {str(e)}"})
+        }
+
+    with metrics.stage("serialize"):
+        now = datetime.datetime.utcnow()
+        turbines = []
+        for entry in entries:
+            entry.update(freshness(entry, now))
+            if not include_features:
+                entry.pop("features", None)
+            # Segundo momento da EWMA: só necessário para atualizar a linha de base
+            for baseline in entry.get("baselines", {}).values():
+                baseline.pop("m2", None)
+            turbines.append(entry)
+        lags = [entry["freshness_lag_s"] for entry in turbines if entry["freshness_lag_s"] is not None]
+        body = json.dumps({
+            "generated_at": now.isoformat(),
+            "count": len(turbines),
+            "max_freshness_lag_s": max(lags) if lags else None,
+            "turbines": turbines,
+        })
+    metrics.set("records", len(turbines))
+    metrics.set("payload_bytes", len(body))
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json"},
+        "body": body
+    }
@@ -0,0 +1,129 @@
+import json
+import math
+import os
+
+import numpy as np
+
+# Consulta do histórico dos sensores para os gráficos do dashboard (via API Gateway, GET).
+# Lê os rollups mantidos pela lambda_process_data (rollup_store.py) na resolução mais fina que
+# respeita o número máximo de pontos pedido, então o custo não cresce com o tamanho do histórico.
+# O boto3 só é importado na primeira consulta, como nas demais Lambdas.
+from aws_clients import get_client
+from metrics import instrumented
+from rollup_store import DEFAULT_MAX_POINTS, RESOLUTIONS, LocalRollupStore, S3RollupStore
+
+# Mesmo bucket/prefixo (ou diretório local) em que a lambda_process_data grava os rollups
+PROCESSED_DATA_BUCKET = os.environ.get("PROCESSED_DATA_BUCKET_NAME", "tcc-kelly-processed-turbine-data-bucket")
+ROLLUP_DIR = os.environ.get("ROLLUP_DIR", "")
+ROLLUP_PREFIX = os.environ.get("ROLLUP_PREFIX", "rollups/")
+STATE_IO_WORKERS = int(os.environ.get("STATE_IO_WORKERS", "16"))
+
+# Limite de pontos por série aceito em uma requisição e período padrão (sem start) em horas
+MAX_POINTS_LIMIT = int(os.environ.get("MAX_POINTS_LIMIT", "5000"))
+DEFAULT_RANGE_HOURS = int(os.environ.get("DEFAULT_RANGE_HOURS", "24"))
+
+if ROLLUP_DIR:
+    rollup_store = LocalRollupStore(ROLLUP_DIR, io_workers=STATE_IO_WORKERS)
+else:
+    # Cliente S3 criado apenas na primeira consulta
+    rollup_store = S3RollupStore(lambda: get_client("s3"), PROCESSED_DATA_BUCKET, ROLLUP_PREFIX, io_workers=STATE_IO_WORKERS)
+
+
+def parse_timestamp(value, name):
+    """
+    Timestamp ISO 8601 da consulta como datetime64[ns] em UTC sem fuso (como os rollups): valores
+    com "Z" ou deslocamento (ex: "-03:00") são convertidos para UTC. Levanta ValueError se inválido.
+    """
+    import pandas as pd # Importado só quando a consulta traz start/end
+
+    try:
+        timestamp = pd.Timestamp(value)
+    except (ValueError, TypeError, OverflowError):
+        timestamp = pd.NaT
+    if pd.isna(timestamp):
+        raise ValueError(f"Parâmetro inválido: {name}={value!r} não é um timestamp ISO 8601.")
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(None)
+    return timestamp.to_datetime64().astype("datetime64[ns]")
+
+
+def parse_query(params):
+    """
+    Valida os parâmetros da consulta. Devolve (turbine_id, sensores, início, fim, máximo de pontos, resolução).
+    Levanta ValueError com a mensagem devolvida ao cliente.
+    """
+    turbine_id = params.get("turbine_id")
+    sensors = [sensor.strip() for sensor in (params.get("sensor") or params.get("sensors") or "").split(",") if sensor.strip()]
+    if not turbine_id or not sensors:
+        raise ValueError("Parâmetros obrigatórios: turbine_id e sensor (um ou mais, separados por vírgula).")
+    end = parse_timestamp(params["end"], "end") if params.get("end") else np.datetime64("now", "ns")
+    start = (parse_timestamp(params["start"], "start") if params.get("start")
+             else end - np.timedelta64(DEFAULT_RANGE_HOURS, "h"))
+    try:
+        max_points = int(params.get("max_points") or DEFAULT_MAX_POINTS)
+    except ValueError as e:
+        raise ValueError(f"Parâmetro inválido: {e}")
+    if not 1 <= max_points <= MAX_POINTS_LIMIT:
+        raise ValueError(f"max_points deve estar entre 1 e {MAX_POINTS_LIMIT}.")
+    resolution = params.get("resolution")
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise ValueError(f"Resolução desconhecida: {resolution}. Use uma de {list(RESOLUTIONS)}.")
+    return turbine_id, sensors, start, end, max_points, resolution
+
+
+def series_to_points(series):
+    """Converte as colunas da consulta em uma lista de pontos (um dicionário por intervalo), como o gráfico espera."""
+    columns = {"timestamp": np.datetime_as_string(series["timestamp"], unit="s").tolist()}
+    for name, values in series.items():
+        if name != "timestamp":
+            # NaN (intervalo sem leituras do sensor) não é JSON válido
+            columns[name] = [None if math.isnan(v) else v for v in values.tolist()]
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+@instrumented("lambda_history_query")
+def lambda_handler(event, context, metrics):
+    """
+    Função Lambda que devolve o histórico agregado de sensores de uma turbina.
+    Parâmetros (query string): turbine_id, sensor (ex: "gearbox_temperature_c,vibration_x_g"),
+    start e end (ISO 8601, com fuso convertido para UTC; padrão: últimas DEFAULT_RANGE_HOURS horas),
+    max_points e resolution (opcional).
+    Cada ponto traz timestamp (início do intervalo) e <sensor>_min, <sensor>_max e <sensor>_mean.
+    """
+    params = event.get("queryStringParameters") or {}
+    try:
+        turbine_id, sensors, start, end, max_points, resolution = parse_query(params)
+        metrics.set_property("turbine_id", turbine_id)
+        with metrics.stage("query"):
+            resolution, series = rollup_store.query(turbine_id, sensors, start, end, max_points, resolution)
+    except ValueError as e:
+        return {
+            "statusCode": 400,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"error": str(e)})
+        }
+    except Exception as e:
+        print(f"Erro ao consultar o histórico de {params.get('turbine_id')}: {e}")
+        return {
+            "statusCode": 500,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"error": f"Erro ao consultar o histórico: {str(e)}"})
+        }
+
+    with metrics.stage("serialize"):
+        points = series_to_points(series)
+        body = json.dumps({
+            "turbine_id": turbine_id,
+            "resolution": resolution,
+            "start": np.datetime_as_string(start, unit="s"),
+            "end": np.datetime_as_string(end, unit="s"),
+            "count": len(points),
+            "points": points,
+        })
+    metrics.set("records", len(points))
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json"},
+        "body": body
+    }
@@ -1,16 +1,101 @@
 import json
-import boto3
+import functools
 import os
 import datetime
 
+from aws_clients import get_client, resolve_client
+from firehose_sender import FirehoseSender
+from metrics import NULL_METRICS, instrumented
+from record_aggregation import DEFAULT_COMPRESSION_LEVEL, DEFAULT_MAX_READINGS, RecordAggregator
+from record_stream import iter_record_batches
+
 # Nome do bucket S3 para onde os dados brutos serão enviados pelo Kinesis Firehose
 # Este bucket deve ser configurado como destino no Kinesis Data Firehose
 RAW_DATA_BUCKET = os.environ.get("RAW_DATA_BUCKET_NAME", "tcc-kelly-raw-turbine-data-bucket")
 
-# Cliente S3
-s3_client = boto3.client("s3")
+# Origem dos arquivos de simulação: diretório local (prototipagem) ou bucket S3
+SIMULATION_DATA_DIR = os.environ.get("SIMULATION_DATA_DIR", "/home/ubuntu/tcc_kelly_castro/data_simulation/")
+SIMULATION_DATA_BUCKET = os.environ.get("SIMULATION_DATA_BUCKET_NAME", RAW_DATA_BUCKET)
+
+# Nome do stream do Kinesis Data Firehose (deve ser criado previamente no AWS)
+FIREHOSE_STREAM_NAME = os.environ.get("FIREHOSE_STREAM_NAME", "tcc-kelly-turbine-data-firehose-stream")
+# Número de batches enviados em paralelo e de novas tentativas para registros que falharem
+FIREHOSE_MAX_IN_FLIGHT = int(os.environ.get("FIREHOSE_MAX_IN_FLIGHT", "4"))
+FIREHOSE_MAX_RETRIES = int(os.environ.get("FIREHOSE_MAX_RETRIES", "5"))
+# Agregação: com "true", até AGGREGATION_MAX_READINGS leituras de uma turbina vão em um único
+# registro do Firehose, em formato colunar com gzip (record_aggregation.py), em vez de uma leitura
+# por registro. A lambda_process_data lê os dois formatos.
+AGGREGATE_RECORDS = os.environ.get("AGGREGATE_RECORDS", "false").lower() == "true"
+AGGREGATION_MAX_READINGS = int(os.environ.get("AGGREGATION_MAX_READINGS", str(DEFAULT_MAX_READINGS)))
+AGGREGATION_COMPRESSION_LEVEL = int(os.environ.get("AGGREGATION_COMPRESSION_LEVEL", str(DEFAULT_COMPRESSION_LEVEL)))
+
+# Clientes criados no primeiro uso e reaproveitados entre invocações (aws_clients.get_client):
+# o boto3 não é importado no início a frio. Podem ser substituídos por um cliente pronto (benchmarks)
+s3_client = functools.partial(get_client, "s3")
+firehose_client = functools.partial(get_client, "firehose")
+
+def open_simulation_source(event):
+    """
+    Devolve a origem dos registros para iter_record_batches: o corpo (stream) de um objeto S3
+    quando o evento traz s3_bucket/s3_key, ou o caminho local do arquivo de simulação.
+    """
+    if event.get("s3_key"):
+        bucket = event.get("s3_bucket", SIMULATION_DATA_BUCKET)
+        return resolve_client(s3_client).get_object(Bucket=bucket, Key=event["s3_key"])["Body"]
+    # Simulação: ler o arquivo do diretório local (NÃO FAZER ISSO EM PRODUÇÃO REAL SEM EFS)
+    return os.path.join(SIMULATION_DATA_DIR, event["simulation_file"])
+
+def turbine_id_from_file_name(file_name):
+    """turbine_id a partir do nome do arquivo de simulação (ex: turbine_1_data.json -> turbine_1), ou None."""
+    parts = file_name.split("/")[-1].split("_")
+    if parts[0] == "turbine" and len(parts) > 1:
+        return f"turbine_{parts[1]}"
+    return None
 
-def lambda_handler(event, context):
+def send_records(record_batches, sender, turbine_id=None, metrics=NULL_METRICS, aggregator=None):
+    """
+    Envia os registros de cada lote ao Firehose assim que são lidos.
+    Com aggregator (RecordAggregator que entrega ao sender), as leituras são agrupadas em registros
+    agregados; as pendentes são enviadas ao final.
+    O timestamp de ingestão é calculado uma vez por lote lido (e não por registro).
+    Registros sem turbine_id recebem o turbine_id informado: o Firehose mistura as leituras de
+    várias turbinas no mesmo objeto e o processamento as separa por esse campo.
+    Devolve (registros lidos, registros ignorados por excederem o limite do Firehose).
+    """
+    records_read = 0
+    records_skipped = 0
+    record_batches = iter(record_batches)
+    while True:
+        # Leitura e parsing do próximo lote (tempo medido separadamente do envio)
+        with metrics.stage("parse"):
+            batch = next(record_batches, None)
+        if batch is None:
+            break
+        with metrics.stage("send"):
+            # Adicionar um timestamp de ingestão para rastreabilidade
+            ingestion_timestamp = datetime.datetime.utcnow().isoformat()
+            for record in batch:
+                record["ingestion_timestamp_utc"] = ingestion_timestamp
+                if turbine_id is not None:
+                    record.setdefault("turbine_id", turbine_id)
+                if aggregator is not None:
+                    aggregator.add(record)
+                    continue
+                try:
+                    sender.send(json.dumps(record).encode("utf-8"))
+                except ValueError as e:
+                    # Registro maior que o limite do Firehose: não há como enviá-lo
+                    print(f"Registro ignorado: {e}")
+                    records_skipped += 1
+        records_read += len(batch)
+    if aggregator is not None:
+        with metrics.stage("send"):
+            aggregator.flush()
+        records_skipped += aggregator.stats["readings_skipped"]
+    return records_read, records_skipped
+
+@instrumented("lambda_ingest_data")
+def lambda_handler(event, context, metrics):
     """
     Função Lambda para simular a ingestão de dados de sensores de turbinas eólicas.
     Em um cenário real, esta função poderia ser acionada por um evento do IoT Core
@@ -26,101 +111,112 @@ def lambda_handler(event, context):
     recebe um batch de dados (por exemplo, de um arquivo JSON) e o envia para o Firehose.
     Neste exemplo, vamos assumir que o evento de entrada contém o nome do arquivo 
     JSON simulado a ser processado.
+    As métricas da invocação (metrics.py) são emitidas em uma linha JSON ao final.
     """
-    print(f"Evento recebido: {event}")
 
     # Para este exemplo, vamos assumir que o evento contém o nome de um arquivo
-    # no diretório de simulação. Em um cenário real, os dados viriam de outra fonte.
-    # Exemplo de evento esperado: {"simulation_file": "turbine_1_data.json"}
+    # no diretório de simulação, a localização de um objeto no S3 ou as próprias leituras
+    # (ex: regra do IoT Core ou o gerador de carga benchmarks/bench_ingest_replay.py).
+    # Exemplos de evento esperado:
+    #   {"simulation_file": "turbine_1_data.json"}
+    #   {"s3_bucket": "bucket-com-simulacoes", "s3_key": "simulacoes/turbine_1_data.ndjson.gz"}
+    #   {"records": [{"turbine_id": "turbine_1", "timestamp": "...", ...}, ...]}
     
-    simulation_file_name = event.get("simulation_file")
+    inline_records = event.get("records")
+    simulation_file_name = event.get("simulation_file") or event.get("s3_key")
+    if inline_records is not None:
+        simulation_file_name = simulation_file_name or "event"
     if not simulation_file_name:
         return {
             "statusCode": 400,
             "body": json.dumps({"error": "Nome do arquivo de simulação não fornecido no evento."})
         }
+    metrics.set_property("source_file", simulation_file_name)
 
-    # Caminho para os dados simulados (ajustar conforme necessário se a Lambda tiver acesso ao EFS ou S3)
-    # Para este protótipo, vamos assumir que a Lambda tem acesso a um diretório local
-    # onde os dados simulados foram colocados (o que não é típico para Lambdas reais sem EFS).
-    # Uma abordagem mais realista seria a Lambda ler de um bucket S3 onde os arquivos simulados foram carregados.
-    
-    # Simulando a leitura do arquivo (em um cenário real, isso seria diferente)
-    # Vamos assumir que o arquivo está em um bucket S3 acessível pela Lambda.
-    # Para este exemplo, vamos apenas simular o conteúdo.
-    # Este código precisaria ser adaptado para ler o arquivo de onde ele realmente está (ex: S3)
-    # ou para receber os dados diretamente no payload do evento.
-
-    # ---- INÍCIO DA SIMULAÇÃO DE LEITURA DE ARQUIVO ----
-    # Esta parte é uma simplificação. Em um deploy real, a Lambda não leria de /home/ubuntu.
-    # Ela leria de S3 ou receberia os dados no evento.
+    # ---- INÍCIO DA LEITURA DO ARQUIVO ----
+    # O arquivo (array JSON ou NDJSON, opcionalmente gzip) é lido de forma incremental:
+    # os registros vão para o Firehose à medida que são lidos, então a memória não cresce
+    # com o tamanho do arquivo e o envio acontece em paralelo com a leitura.
     try:
-        # Simulação: Ler o arquivo JSON do diretório local (NÃO FAZER ISSO EM PRODUÇÃO REAL SEM EFS)
-        # Em um cenário real, o arquivo estaria em S3 e seria lido com s3_client.get_object
-        # ou os dados viriam diretamente no evento.
-        # Para fins de prototipagem local, vamos manter assim, mas com ressalvas.
-        file_path = f"/home/ubuntu/tcc_kelly_castro/data_simulation/{simulation_file_name}"
-        with open(file_path, "r") as f:
-            records = json.load(f)
-        print(f"Lidos {len(records)} registros do arquivo {simulation_file_name}")
+        if inline_records is not None:
+            # Leituras no próprio evento: um único lote, sem leitura de arquivo
+            record_batches = [inline_records]
+            turbine_id = event.get("turbine_id")
+        else:
+            record_batches = iter_record_batches(open_simulation_source(event))
+            turbine_id = turbine_id_from_file_name(simulation_file_name)
     except Exception as e:
         print(f"Erro ao ler o arquivo de simulação {simulation_file_name}: {e}")
         return {
             "statusCode": 500,
             "body": json.dumps({"error": f"Erro ao processar arquivo de simulação: {str(e)}"})
         }
-    # ---- FIM DA SIMULAÇÃO DE LEITURA DE ARQUIVO ----
-
-    # Nome do stream do Kinesis Data Firehose (deve ser criado previamente no AWS)
-    firehose_stream_name = os.environ.get("FIREHOSE_STREAM_NAME", "tcc-kelly-turbine-data-firehose-stream")
-    firehose_client = boto3.client("firehose")
+    # ---- FIM DA LEITURA DO ARQUIVO ----
 
     # Enviar registros para o Kinesis Data Firehose
-    # O Firehose espera uma lista de dicionários com uma chave "Data"
-    # O conteúdo de "Data" deve ser bytes, então serializamos para JSON e codificamos para UTF-8.
-    # O Firehose adiciona uma nova linha automaticamente entre os registros se configurado.
-    
-    # Dividir em batches para não exceder limites do Firehose (PutRecordBatch)
-    # Limite: 500 registros ou 4MB por batch
-    batch_size = 450 # Um pouco abaixo do limite para segurança
-    records_sent_count = 0
-    
-    for i in range(0, len(records), batch_size):
-        batch = records[i:i + batch_size]
-        firehose_records = []
-        for record in batch:
-            # Adicionar um timestamp de ingestão para rastreabilidade
-            record["ingestion_timestamp_utc"] = datetime.datetime.utcnow().isoformat()
-            firehose_records.append({"Data": json.dumps(record).encode("utf-8")})
-        
-        if not firehose_records:
-            continue
-            
+    # O FirehoseSender monta os batches respeitando os limites do PutRecordBatch
+    # (500 registros ou 4 MiB), mantém vários batches em voo e reenvia apenas os
+    # registros que falharem, com backoff.
+    read_error = None
+    aggregator = None
+    with FirehoseSender(firehose_client, FIREHOSE_STREAM_NAME, max_in_flight=FIREHOSE_MAX_IN_FLIGHT,
+                        max_retries=FIREHOSE_MAX_RETRIES) as sender:
+        if AGGREGATE_RECORDS:
+            aggregator = RecordAggregator(sender.send, max_readings=AGGREGATION_MAX_READINGS,
+                                          compression_level=AGGREGATION_COMPRESSION_LEVEL)
         try:
-            response = firehose_client.put_record_batch(
-                DeliveryStreamName=firehose_stream_name,
-                Records=firehose_records
-            )
-            print(f"Batch enviado para o Firehose. Resposta: {response}")
-            if response.get("FailedPutCount", 0) > 0:
-                print(f"Falha ao enviar alguns registros: {response.get('RequestResponses')}")
-                # Adicionar lógica de tratamento de falhas/reprocessamento aqui
-            else:
-                records_sent_count += len(firehose_records)
-
+            records_read, records_skipped = send_records(record_batches, sender, turbine_id=turbine_id,
+                                                         metrics=metrics, aggregator=aggregator)
         except Exception as e:
-            print(f"Erro ao enviar batch para o Kinesis Data Firehose: {e}")
-            # Adicionar lógica de tratamento de falhas aqui
-            # Pode ser necessário reenviar ou registrar a falha
-            return {
-                "statusCode": 500,
-                "body": json.dumps({"error": f"Erro ao enviar dados para o Firehose: {str(e)}"})
-            }
+            # Arquivo corrompido ou truncado: o que já foi lido segue para o Firehose
+            print(f"Erro ao ler o arquivo de simulação {simulation_file_name}: {e}")
+            read_error = e
+            records_read, records_skipped = None, 0
+        # Espera os batches em voo (e as novas tentativas) terminarem
+        with metrics.stage("flush"):
+            if aggregator is not None:
+                # Leituras ainda não agregadas quando a leitura do arquivo falhou
+                aggregator.flush()
+            sender.flush()
+
+    stats = dict(sender.stats, records_read=records_read, records_skipped=records_skipped)
+    if aggregator is not None:
+        # records_sent conta registros do Firehose; as leituras agregadas ficam em readings_aggregated
+        stats.update(aggregator.stats)
+        metrics.set("readings_aggregated", aggregator.stats["readings_aggregated"])
+    metrics.set("records", stats["records_sent"])
+    metrics.set("payload_bytes", stats["bytes_sent"])
+    metrics.set("records_failed", stats["records_failed"] + records_skipped)
+    metrics.set("retried_records", stats["retried_records"])
+    metrics.set("put_calls", stats["put_calls"])
+    print(f"Envio para o Kinesis Data Firehose concluído: {json.dumps(stats)}")
+
+    if read_error is not None:
+        return {
+            "statusCode": 500,
+            "body": json.dumps({
+                "error": f"Erro ao processar arquivo de simulação: {str(read_error)}",
+                "source_file": simulation_file_name,
+                "stats": stats,
+            })
+        }
+
+    if stats["records_failed"] > 0 or records_skipped > 0:
+        return {
+            "statusCode": 500,
+            "body": json.dumps({
+                "error": f"Erro ao enviar dados para o Firehose: {stats['records_failed'] + records_skipped} registros não enviados. "
+                         f"Último erro: {sender.last_error}",
+                "source_file": simulation_file_name,
+                "stats": stats,
+            })
+        }
 
+    records_sent_count = stats["records_sent"]
     print(f"Total de {records_sent_count} registros enviados para o Kinesis Data Firehose.")
     return {
         "statusCode": 200,
-        "body": json.dumps({"message": f"{records_sent_count} registros processados e enviados para o Firehose.", "source_file": simulation_file_name})
+        "body": json.dumps({"message": f"{records_sent_count} registros processados e enviados para o Firehose.", "source_file": simulation_file_name, "stats": stats})
     }
 
 # Exemplo de como testar localmente (não faz parte do código da Lambda em si)
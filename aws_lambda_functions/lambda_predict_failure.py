@@ -1,68 +1,288 @@
 import json
-import boto3
 import os
-import pandas as pd
 import numpy as np
-import joblib
-import awswrangler as wr # Pode ser útil para alguma manipulação, mas não essencial aqui
+
+# Início a frio: no carregamento do módulo só entram json, os e NumPy. O boto3 (cliente S3) e o
+# joblib/scikit-learn (modelo) são importados no primeiro uso, e o pandas apenas pelo caminho
+# de batch e pelo scaler genérico; a predição de uma janela não depende dele.
+from artifact_cache import ArtifactCache, LocalArtifactStore, S3ArtifactStore, DEFAULT_CACHE_DIR
+from aws_clients import get_client
+from metrics import NULL_METRICS, instrumented
+from tree_ensemble import FILE_SUFFIX as TREE_ENSEMBLE_SUFFIX, TreeEnsemble, is_tree_ensemble_file
 
 # Nome do bucket S3 onde o modelo treinado e o scaler estão armazenados
 MODEL_ARTIFACTS_BUCKET = os.environ.get("MODEL_ARTIFACTS_BUCKET_NAME", "tcc-kelly-model-artifacts-bucket")
 MODEL_KEY = os.environ.get("MODEL_S3_KEY", "notebooks/best_failure_prediction_model.joblib") # Chave do modelo no S3
 SCALER_KEY = os.environ.get("SCALER_S3_KEY", "notebooks/feature_scaler.joblib") # Chave do scaler no S3
 COLUMNS_KEY = os.environ.get("COLUMNS_S3_KEY", "notebooks/model_columns.json") # Chave do JSON com as colunas
+# Diretório local com os artefatos empacotados junto da função (layer ou imagem de contêiner),
+# com as mesmas chaves do bucket. Se definido, o S3 (e o boto3) não são usados.
+MODEL_ARTIFACTS_DIR = os.environ.get("MODEL_ARTIFACTS_DIR", "")
+# Modelo no formato compacto de árvores (tree_ensemble.py, chave terminada em .trees): o scaler vem
+# embutido no próprio arquivo, então SCALER_KEY não é baixado e joblib/scikit-learn não são carregados
+COMPACT_MODEL = MODEL_KEY.endswith(TREE_ENSEMBLE_SUFFIX)
+
+# Mapeamento do label numérico para o status exibido ao cliente
+LABEL_MAP = {0: "Normal", 1: "Falha Caixa de Engrenagens (Superaquecimento)", 2: "Falha de Vibração"}
+
+# Número máximo de janelas aceitas em uma única requisição de predição em batch
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "10000"))
+
+# Intervalo mínimo (segundos) entre verificações de nova versão dos artefatos no S3 (negativo desativa)
+ARTIFACT_REFRESH_SECONDS = float(os.environ.get("ARTIFACT_REFRESH_SECONDS", "300"))
+ARTIFACT_CACHE_DIR = os.environ.get("ARTIFACT_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+# Features de desvio padrão ausentes (janelas com um único ponto) são imputadas com 0, como no
+# notebook e no treinamento (training_data.impute_batch); as demais recebem a média de treino
+ZERO_FILL_SUFFIX = "_std"
+
+class InferenceState:
+    """
+    Uma versão carregada dos artefatos (modelo, scaler e colunas) mais as estruturas
+    pré-computadas do caminho rápido: mapa feature -> índice, valores de imputação,
+    coeficientes do scaler fundido e a linha NumPy pré-alocada.
+    """
+
+    def __init__(self, model, scaler, model_columns):
+        self.model = model
+        self.scaler = scaler
+        self.model_columns = model_columns
+
+        num_features = len(model_columns)
+        self.feature_index = {name: i for i, name in enumerate(model_columns)}
+
+        # Modelo compacto: o scaler está embutido e o modelo recebe as features sem escalar
+        self.scaler_folded = scaler is None and isinstance(model, TreeEnsemble)
+
+        # O StandardScaler guarda as médias do conjunto de treino; são elas que imputam valores ausentes
+        mean = model.feature_mean if self.scaler_folded else getattr(scaler, "mean_", None)
+        self.feature_means = np.asarray(mean, dtype=np.float64) if mean is not None else np.zeros(num_features)
+        self.fill_values = np.where([name.endswith(ZERO_FILL_SUFFIX) for name in model_columns], 0.0, self.feature_means)
+
+        # (x - mean) / scale == x * (1 / scale) + (-mean / scale)
+        if self.scaler_folded:
+            self.scaler_coef = None
+            self.scaler_offset = None
+        elif all(hasattr(scaler, attr) for attr in ("with_mean", "with_std", "scale_")):
+            center = self.feature_means if scaler.with_mean else np.zeros(num_features)
+            scale = np.asarray(scaler.scale_, dtype=np.float64) if scaler.with_std and scaler.scale_ is not None else np.ones(num_features)
+            self.scaler_coef = 1.0 / scale
+            self.scaler_offset = -center * self.scaler_coef
+        else:
+            # Scaler desconhecido: usa scaler.transform
+            self.scaler_coef = None
+            self.scaler_offset = None
+
+        # Reutilizada entre requisições: a Lambda atende uma requisição por vez em cada ambiente
+        self.input_row = np.empty((1, num_features), dtype=np.float64)
+
+def load_json_file(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def load_joblib_file(path):
+    import joblib # Importado só ao carregar o modelo/scaler (junto com o scikit-learn)
+    return joblib.load(path)
+
+def load_model_file(path):
+    """Modelo no formato compacto (aberto com mmap) ou estimador serializado com joblib."""
+    if is_tree_ensemble_file(path):
+        return TreeEnsemble.load(path)
+    return load_joblib_file(path)
+
+def build_inference_state(objects):
+    return InferenceState(objects["model"], objects.get("scaler"), objects["model_columns"])
+
+# Cache versionado dos artefatos: carregados apenas uma vez por versão (otimização para Lambda)
+# e trocados atomicamente quando um novo modelo é publicado no S3.
+if MODEL_ARTIFACTS_DIR:
+    artifact_store = LocalArtifactStore(MODEL_ARTIFACTS_DIR)
+else:
+    artifact_store = S3ArtifactStore(lambda: get_client("s3"), MODEL_ARTIFACTS_BUCKET)
 
-s3_client = boto3.client("s3")
+model_artifacts = {
+    "model": (MODEL_KEY, load_model_file),
+    "model_columns": (COLUMNS_KEY, load_json_file),
+}
+if not COMPACT_MODEL:
+    model_artifacts["scaler"] = (SCALER_KEY, load_joblib_file)
 
-# Variáveis globais para carregar o modelo e o scaler apenas uma vez (otimização para Lambda)
-model = None
-scaler = None
-model_columns = None
+artifact_cache = ArtifactCache(
+    artifact_store,
+    model_artifacts,
+    build_inference_state,
+    cache_dir=ARTIFACT_CACHE_DIR,
+    refresh_interval_s=ARTIFACT_REFRESH_SECONDS,
+)
 
 def load_model_artifacts():
-    """Carrega o modelo, scaler e colunas do S3 se ainda não estiverem carregados."""
-    global model, scaler, model_columns
-    
-    if model is None:
-        try:
-            model_path = "/tmp/model.joblib"
-            s3_client.download_file(MODEL_ARTIFACTS_BUCKET, MODEL_KEY, model_path)
-            model = joblib.load(model_path)
-            print(f"Modelo carregado de s3://{MODEL_ARTIFACTS_BUCKET}/{MODEL_KEY}")
-        except Exception as e:
-            print(f"Erro ao carregar o modelo do S3: {e}")
-            raise e
-            
-    if scaler is None:
-        try:
-            scaler_path = "/tmp/scaler.joblib"
-            s3_client.download_file(MODEL_ARTIFACTS_BUCKET, SCALER_KEY, scaler_path)
-            scaler = joblib.load(scaler_path)
-            print(f"Scaler carregado de s3://{MODEL_ARTIFACTS_BUCKET}/{SCALER_KEY}")
-        except Exception as e:
-            print(f"Erro ao carregar o scaler do S3: {e}")
-            raise e
-
-    if model_columns is None:
+    """
+    Devolve o InferenceState ativo. No primeiro uso baixa (em paralelo) o modelo, o scaler e as
+    colunas; depois apenas verifica periodicamente se há uma nova versão publicada.
+    """
+    try:
+        return artifact_cache.get()
+    except Exception as e:
+        print(f"Erro ao carregar os artefatos do modelo do S3: {e}")
+        raise e
+
+def apply_scaler(state, matrix):
+    """Aplica o scaler (fundido, in-place quando possível) a uma matriz float64 na ordem de model_columns."""
+    if state.scaler_folded:
+        return matrix # O modelo compacto escala internamente, exatamente como o StandardScaler
+    if state.scaler_coef is None:
+        import pandas as pd
+        return state.scaler.transform(pd.DataFrame(matrix, columns=state.model_columns))
+    np.multiply(matrix, state.scaler_coef, out=matrix)
+    np.add(matrix, state.scaler_offset, out=matrix)
+    return matrix
+
+def predict_matrix(state, matrix_scaled):
+    """
+    Prediz labels e probabilidades de uma matriz já escalada.
+    Para classificadores com predict_proba, o label é classes_[argmax(proba)] — o mesmo que
+    model.predict devolve para os modelos do notebook — evitando uma segunda passada no modelo.
+    """
+    model = state.model
+    if hasattr(model, "predict_proba"):
+        prediction_proba = model.predict_proba(matrix_scaled)
+        predictions = model.classes_.take(np.argmax(prediction_proba, axis=1))
+        return predictions, prediction_proba
+    return model.predict(matrix_scaled), None
+
+def format_prediction(label, proba_row):
+    label = int(label) # Convertendo para int nativo para JSON
+    return {
+        "predicted_label": label,
+        "prediction_probabilities": proba_row.tolist() if proba_row is not None else "N/A",
+        # Mapear label numérico para significado (opcional, mas útil)
+        "predicted_status": LABEL_MAP.get(label, "Desconhecido"),
+    }
+
+def predict_single_fast(state, window, metrics=NULL_METRICS):
+    """
+    Caminho rápido para uma única janela: preenche a linha pré-alocada diretamente a partir
+    do JSON, sem montar DataFrames. Features ausentes, nulas ou NaN recebem state.fill_values.
+    Levanta ValueError se alguma feature tiver valor não numérico.
+    """
+    row = state.input_row[0]
+    np.copyto(row, state.fill_values)
+    bad_columns = []
+    for name, value in window.items():
+        index = state.feature_index.get(name)
+        if index is None or value is None:
+            continue # Colunas extras são ignoradas
         try:
-            columns_path = "/tmp/model_columns.json"
-            s3_client.download_file(MODEL_ARTIFACTS_BUCKET, COLUMNS_KEY, columns_path)
-            with open(columns_path, "r") as f:
-                model_columns = json.load(f)
-            print(f"Colunas do modelo carregadas de s3://{MODEL_ARTIFACTS_BUCKET}/{COLUMNS_KEY}")
-        except Exception as e:
-            print(f"Erro ao carregar as colunas do modelo do S3: {e}")
-            raise e
-
-def lambda_handler(event, context):
+            row[index] = float(value)
+        except (TypeError, ValueError):
+            bad_columns.append(name)
+    if bad_columns:
+        raise ValueError(f"Valores não numéricos nas features: {', '.join(bad_columns)}")
+
+    missing = np.isnan(row)
+    if missing.any():
+        np.copyto(row, state.fill_values, where=missing)
+
+    with metrics.stage("scale"):
+        matrix_scaled = apply_scaler(state, state.input_row)
+    with metrics.stage("predict"):
+        predictions, prediction_proba = predict_matrix(state, matrix_scaled)
+    return format_prediction(predictions[0], prediction_proba[0] if prediction_proba is not None else None)
+
+def build_input_frame(state, input_data):
+    """
+    Converte um payload de batch em um DataFrame com as colunas de model_columns (na ordem
+    do treinamento), indexado pela posição de cada janela no payload.
+    Devolve (df_input, item_errors), onde item_errors mapeia posição -> mensagem
+    para itens que não puderam nem ser lidos como janela.
+    Levanta ValueError se o payload como um todo for inválido.
+    """
+    import pandas as pd
+    model_columns = state.model_columns
+    item_errors = {}
+
+    if isinstance(input_data, dict) and "columns" in input_data:
+        columns = input_data["columns"]
+        if not isinstance(columns, dict) or not all(isinstance(v, list) for v in columns.values()):
+            raise ValueError("Payload colunar deve ter o formato {\"columns\": {\"feature\": [valores, ...]}}.")
+        lengths = {len(v) for v in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("Todas as colunas do payload colunar devem ter o mesmo tamanho.")
+        num_rows = lengths.pop() if lengths else 0
+        df_input = pd.DataFrame(
+            {col: columns[col] if col in columns else [np.nan] * num_rows for col in model_columns},
+            columns=model_columns,
+        )
+        return df_input, item_errors
+
+    if isinstance(input_data, list):
+        windows = {}
+        for position, window in enumerate(input_data):
+            if isinstance(window, dict):
+                windows[position] = window
+            else:
+                item_errors[position] = "Cada janela deve ser um objeto JSON com as features."
+        df_input = pd.DataFrame.from_records(list(windows.values()), columns=model_columns)
+        df_input.index = list(windows.keys())
+        return df_input, item_errors
+
+    raise ValueError("Corpo da requisição deve ser um objeto JSON, uma lista de objetos ou um payload colunar.")
+
+def predict_frame(state, df_input, item_errors, metrics=NULL_METRICS):
+    """
+    Escala e prediz todas as janelas válidas de df_input em uma única chamada ao scaler e ao
+    modelo. Devolve uma lista de resultados na ordem original do payload; janelas com valores
+    não numéricos recebem um erro individual em vez de invalidar o batch inteiro.
+    """
+    import pandas as pd
+    num_items = len(df_input) + len(item_errors)
+    item_errors = dict(item_errors)
+
+    # Valores não numéricos viram NaN; se o valor original não era nulo, a janela é inválida
+    df_numeric = df_input.apply(pd.to_numeric, errors="coerce")
+    invalid_rows = (df_numeric.isna() & df_input.notna()).any(axis=1)
+    for position in df_numeric.index[invalid_rows]:
+        bad_columns = df_numeric.columns[(df_numeric.loc[position].isna() & df_input.loc[position].notna()).to_numpy()]
+        item_errors[position] = f"Valores não numéricos nas features: {', '.join(bad_columns)}"
+    df_valid = df_numeric[~invalid_rows].astype(np.float64)
+
+    scored = {}
+    if not df_valid.empty:
+        # Valores ausentes recebem os valores de imputação, como no caminho rápido
+        matrix = df_valid.to_numpy(dtype=np.float64, copy=True)
+        missing = np.isnan(matrix)
+        if missing.any():
+            matrix[missing] = np.broadcast_to(state.fill_values, matrix.shape)[missing]
+        # Aplicar o scaler e realizar a predição de todas as janelas de uma vez
+        with metrics.stage("scale"):
+            matrix_scaled = apply_scaler(state, matrix)
+        with metrics.stage("predict"):
+            predictions, prediction_proba = predict_matrix(state, matrix_scaled)
+        for row, position in enumerate(df_valid.index):
+            scored[position] = format_prediction(
+                predictions[row], prediction_proba[row] if prediction_proba is not None else None
+            )
+
+    results = []
+    for position in range(num_items):
+        if position in item_errors:
+            results.append({"index": position, "error": item_errors[position]})
+        else:
+            results.append({"index": position, **scored[position]})
+    return results
+
+@instrumented("lambda_predict_failure")
+def lambda_handler(event, context, metrics):
     """
     Função Lambda para realizar predições de falha.
-    Espera receber os dados de features de uma janela como entrada no corpo da requisição HTTP (via API Gateway).
+    Espera receber os dados de features de uma janela (ou um batch de janelas) como entrada
+    no corpo da requisição HTTP (via API Gateway).
+    As métricas da invocação (metrics.py) são emitidas em uma linha JSON ao final.
     """
-    print(f"Evento recebido: {event}")
-    
     try:
-        load_model_artifacts() # Garante que modelo, scaler e colunas estão carregados
+        # Versão dos artefatos usada durante toda esta requisição, mesmo que uma nova seja publicada
+        with metrics.stage("artifact_load"):
+            state = load_model_artifacts()
     except Exception as e:
         return {
             "statusCode": 500,
@@ -70,7 +290,7 @@ def lambda_handler(event, context):
             "body": json.dumps({"error": f"Erro ao carregar artefatos do modelo: {str(e)}"})
         }
 
-    if model is None or scaler is None or model_columns is None:
+    if state is None or state.model is None or (state.scaler is None and not state.scaler_folded) or state.model_columns is None:
         return {
             "statusCode": 500,
             "headers": {"Content-Type": "application/json"},
@@ -80,7 +300,9 @@ def lambda_handler(event, context):
     try:
         # O corpo da requisição do API Gateway estará em event["body"] como uma string JSON
         if isinstance(event.get("body"), str):
-            input_data = json.loads(event["body"])
+            metrics.set("payload_bytes", len(event["body"].encode("utf-8")))
+            with metrics.stage("parse"):
+                input_data = json.loads(event["body"])
         else:
             input_data = event.get("body") # Se já for um dict (ex: teste direto da Lambda)
             
@@ -91,58 +313,60 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "Corpo da requisição vazio ou inválido."})
             }
         
-        # Espera-se que input_data seja um dicionário representando uma única janela de features
-        # ou uma lista de dicionários para predição em batch (vamos tratar um único por simplicidade aqui)
-        # Exemplo de input_data: 
+        # input_data pode ser:
+        # - um dicionário com uma única janela de features (resposta no formato original);
+        # - uma lista de dicionários, uma janela por item (predição em batch);
+        # - um payload colunar {"columns": {"feature": [v1, v2, ...], ...}} (predição em batch).
+        # Exemplo de janela:
         # {
         #   "wind_speed_m_s_mean": 7.1, "wind_speed_m_s_std": 1.9, ...,
         #   "vibration_y_g_median": 0.1
         # }
-        
-        # Converter para DataFrame do Pandas para aplicar o scaler e predição
-        # Garantir que a ordem das colunas e as colunas presentes são as mesmas do treinamento
-        df_input = pd.DataFrame([input_data])
-        
-        # Reordenar e selecionar colunas conforme o treinamento
-        # Adicionar colunas faltantes com NaN (ou valor padrão, mas o scaler deve ter sido treinado com isso em mente)
-        for col in model_columns:
-            if col not in df_input.columns:
-                df_input[col] = np.nan # Ou 0, ou média - depende da estratégia de preenchimento no treino
-        
-        df_input = df_input[model_columns] # Garante a ordem e seleção correta das colunas
-        
-        # Lidar com NaNs (ex: preencher com média se foi feito no treino, ou o scaler pode falhar)
-        # O ideal é que o pipeline de features já garanta que não há NaNs ou que são tratados consistentemente.
-        # Se o scaler foi treinado com dados que tinham NaNs preenchidos, a mesma estratégia deve ser usada aqui.
-        # Por simplicidade, vamos assumir que o scaler lida com isso ou que os dados de entrada são limpos.
-        # Se o scaler foi treinado após preenchimento de NaNs com média, por exemplo:
-        # df_input.fillna(df_input.mean(), inplace=True) # CUIDADO: a média aqui é do input, não do treino.
-        # O correto seria usar médias do conjunto de treino salvas, ou garantir que não há NaNs.
-        # Para este exemplo, vamos assumir que as features de entrada são completas.
-        if df_input.isnull().values.any():
-             print("Alerta: Dados de entrada contêm NaNs. Preenchendo com 0 para evitar erro no scaler/modelo.")
-             df_input.fillna(0, inplace=True) # Estratégia simples, pode não ser a ideal.
-
-        # Aplicar o scaler
-        input_scaled = scaler.transform(df_input)
-        
-        # Realizar a predição
-        prediction = model.predict(input_scaled)
-        prediction_proba = model.predict_proba(input_scaled) if hasattr(model, "predict_proba") else None
-        
-        result = {
-            "predicted_label": int(prediction[0]), # Convertendo para int nativo para JSON
-            "prediction_probabilities": prediction_proba[0].tolist() if prediction_proba is not None else "N/A"
-        }
-        
-        # Mapear label numérico para significado (opcional, mas útil)
-        label_map = {0: "Normal", 1: "Falha Caixa de Engrenagens (Superaquecimento)", 2: "Falha de Vibração"}
-        result["predicted_status"] = label_map.get(int(prediction[0]), "Desconhecido")
+        if isinstance(input_data, dict) and "columns" not in input_data:
+            # Janela única: caminho rápido direto para NumPy, sem pandas
+            metrics.set("records", 1)
+            try:
+                result = predict_single_fast(state, input_data, metrics)
+            except ValueError as e:
+                return {
+                    "statusCode": 400,
+                    "headers": {"Content-Type": "application/json"},
+                    "body": json.dumps({"error": str(e)})
+                }
+            return {
+                "statusCode": 200,
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps(result)
+            }
+
+        try:
+            with metrics.stage("parse"):
+                df_input, item_errors = build_input_frame(state, input_data)
+        except ValueError as e:
+            return {
+                "statusCode": 400,
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps({"error": str(e)})
+            }
+
+        num_items = len(df_input) + len(item_errors)
+        metrics.set("records", num_items)
+        if num_items > MAX_BATCH_SIZE:
+            return {
+                "statusCode": 413,
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps({"error": f"Batch com {num_items} janelas excede o limite de {MAX_BATCH_SIZE}."})
+            }
+
+        # Todas as janelas válidas são escaladas e preditas em uma única chamada vetorizada
+        results = predict_frame(state, df_input, item_errors, metrics)
 
+        num_errors = sum(1 for r in results if "error" in r)
+        metrics.set("errors", num_errors)
         return {
             "statusCode": 200,
             "headers": {"Content-Type": "application/json"},
-            "body": json.dumps(result)
+            "body": json.dumps({"count": len(results), "errors": num_errors, "results": results})
         }
 
     except Exception as e:
@@ -1,17 +1,86 @@
+import io
 import json
-import boto3
 import os
+import numpy as np
 import pandas as pd
-from io import StringIO, BytesIO
 import awswrangler as wr # Usar awswrangler para facilitar leitura/escrita no S3 com pandas
 
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_clients import get_client
+from metrics import instrumented
+from fleet_processing import feature_partitions, partition_path, split_by_turbine, window_fleet
+from fleet_state import DEFAULT_HALFLIFE_MINUTES, DynamoDBFleetStateStore, SQLiteFleetStateStore
+from record_aggregation import decode_raw_object
+from rollup_store import LocalRollupStore, S3RollupStore
+from window_state import LocalWindowStateStore, S3WindowStateStore
+
 # Nome do bucket S3 onde os dados processados/features serão armazenados
 PROCESSED_DATA_BUCKET = os.environ.get("PROCESSED_DATA_BUCKET_NAME", "tcc-kelly-processed-turbine-data-bucket")
+# Features particionadas por turbina e dia: features/turbine_id=<id>/date=<AAAA-MM-DD>/
+FEATURES_BASE_PATH = f"s3://{PROCESSED_DATA_BUCKET}/features/"
+
+# Número de processos para janelar as turbinas em paralelo (padrão: núcleos disponíveis)
+# e de threads para ler/gravar estado e partições no S3
+PROCESSING_WORKERS = int(os.environ.get("PROCESSING_WORKERS", "0")) or None
+STATE_IO_WORKERS = int(os.environ.get("STATE_IO_WORKERS", "16"))
+
+# Janelamento: tamanho da janela e passo (em minutos; os dados chegam a cada minuto)
+WINDOW_SIZE_MINUTES = int(os.environ.get("WINDOW_SIZE_MINUTES", "10"))
+STEP_MINUTES = int(os.environ.get("STEP_MINUTES", "5"))
+
+# Janelamento incremental: as leituras que ainda não formam uma janela completa ficam guardadas
+# por turbina e são combinadas com o próximo objeto entregue pelo Firehose.
+# Com "false", cada objeto é janelado isoladamente (comportamento original).
+INCREMENTAL_WINDOWING = os.environ.get("INCREMENTAL_WINDOWING", "true").lower() == "true"
+# Diretório local para o estado (execução local); se vazio, o estado fica no bucket processado
+WINDOW_STATE_DIR = os.environ.get("WINDOW_STATE_DIR", "")
+WINDOW_STATE_PREFIX = os.environ.get("WINDOW_STATE_PREFIX", "window_state/")
+
+# Pontuação junto do processamento: com "true", cada janela calculada é pontuada pelo mesmo modelo
+# da lambda_predict_failure (mesmos artefatos e variáveis de ambiente: MODEL_ARTIFACTS_BUCKET_NAME,
+# MODEL_S3_KEY, SCALER_S3_KEY, COLUMNS_S3_KEY ou MODEL_ARTIFACTS_DIR) e as predições são gravadas
+# nas mesmas partições das features, em colunas com o prefixo PREDICTION_COLUMN_PREFIX.
+INLINE_SCORING = os.environ.get("INLINE_SCORING", "false").lower() == "true"
+PREDICTION_COLUMN_PREFIX = "prediction_"
+
+# Rollups do histórico dos sensores (1 min, 10 min, 1 h e 1 dia) consultados pelo dashboard via
+# lambda_history_query. ROLLUP_DIR: diretório local (execução local); se vazio, ficam no bucket processado
+HISTORY_ROLLUPS = os.environ.get("HISTORY_ROLLUPS", "true").lower() == "true"
+ROLLUP_DIR = os.environ.get("ROLLUP_DIR", "")
+ROLLUP_PREFIX = os.environ.get("ROLLUP_PREFIX", "rollups/")
 
-s3_client = boto3.client("s3")
+# Estado atual da frota lido pelo dashboard via lambda_fleet_state (fleet_state.py): janela e
+# predição mais recentes e linhas de base EWMA por sensor de cada turbina. FLEET_STATE_TABLE: tabela
+# do DynamoDB; FLEET_STATE_DB: arquivo SQLite (execução local). Sem nenhum dos dois, fica desativado
+FLEET_STATE_TABLE = os.environ.get("FLEET_STATE_TABLE", "")
+FLEET_STATE_DB = os.environ.get("FLEET_STATE_DB", "")
+FLEET_STATE_HALFLIFE_MINUTES = float(os.environ.get("FLEET_STATE_HALFLIFE_MINUTES", str(DEFAULT_HALFLIFE_MINUTES)))
+
+if WINDOW_STATE_DIR:
+    window_state_store = LocalWindowStateStore(WINDOW_STATE_DIR)
+else:
+    # Cliente S3 criado apenas no primeiro acesso ao estado
+    window_state_store = S3WindowStateStore(lambda: get_client("s3"), PROCESSED_DATA_BUCKET, WINDOW_STATE_PREFIX)
+
+if ROLLUP_DIR:
+    rollup_store = LocalRollupStore(ROLLUP_DIR, io_workers=STATE_IO_WORKERS)
+else:
+    rollup_store = S3RollupStore(lambda: get_client("s3"), PROCESSED_DATA_BUCKET, ROLLUP_PREFIX, io_workers=STATE_IO_WORKERS)
+
+fleet_state_store = None
+if FLEET_STATE_TABLE:
+    # Cliente DynamoDB criado apenas na primeira atualização
+    fleet_state_store = DynamoDBFleetStateStore(lambda: get_client("dynamodb"), FLEET_STATE_TABLE, FLEET_STATE_HALFLIFE_MINUTES)
+elif FLEET_STATE_DB:
+    fleet_state_store = SQLiteFleetStateStore(FLEET_STATE_DB, FLEET_STATE_HALFLIFE_MINUTES)
 
 def calculate_features(df_window):
-    """Calcula features estatísticas para uma janela de dados."""
+    """
+    Calcula features estatísticas para uma janela de dados.
+    Mantida como implementação de referência (uma janela por vez); o handler usa o motor vetorizado
+    (feature_engine.compute_window_features, por turbina), que produz o mesmo resultado para todas as janelas.
+    """
     features = {}
     for col in df_window.columns:
         if pd.api.types.is_numeric_dtype(df_window[col]):
@@ -20,7 +89,7 @@ def calculate_features(df_window):
             features[f"{col}_min"] = df_window[col].min()
             features[f"{col}_max"] = df_window[col].max()
             features[f"{col}_median"] = df_window[col].median()
-            # Adicionar mais features se necessário (ex: skew, kurtosis, FFT para vibração)
+            # Features espectrais (FFT) da vibração: ver feature_engine.compute_spectral_features
     
     # A label da janela é o último label conhecido na janela (ou o mais frequente, etc.)
     # Para simplificar, se qualquer ponto na janela for anômalo, a janela é anômala.
@@ -36,87 +105,218 @@ def calculate_features(df_window):
         
     return features
 
-def lambda_handler(event, context):
+def extract_turbine_id(source_key):
+    """Extrai o turbine_id do nome do arquivo (ex: turbine_1_...) ou devolve 'unknown_turbine'."""
+    turbine_id_str = "unknown_turbine"
+    try:
+        parts = source_key.split("/")[-1].split("_")
+        if parts[0] == "turbine" and len(parts) > 1:
+            turbine_id_str = f"turbine_{parts[1]}"
+    except Exception as e:
+        print(f"Não foi possível extrair turbine_id do nome do arquivo {source_key}: {e}")
+    return turbine_id_str
+
+def load_window_states(turbine_ids):
+    """Carrega em paralelo o estado de janelamento de cada turbina (None se ainda não existir)."""
+    if not turbine_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(STATE_IO_WORKERS, len(turbine_ids))) as executor:
+        return dict(zip(turbine_ids, executor.map(window_state_store.load, turbine_ids)))
+
+def save_window_states(states):
+    """Grava em paralelo o novo estado de janelamento de cada turbina."""
+    if not states:
+        return
+    with ThreadPoolExecutor(max_workers=min(STATE_IO_WORKERS, len(states))) as executor:
+        list(executor.map(lambda item: window_state_store.save(*item), states.items()))
+
+def read_raw_object(path):
+    """
+    Lê as leituras de um objeto entregue pelo Firehose: uma leitura JSON por linha ou registros
+    agregados (colunares com gzip, ver record_aggregation.py), inclusive misturados no mesmo objeto.
+    """
+    buffer = io.BytesIO()
+    wr.s3.download(path=path, local_file=buffer)
+    return decode_raw_object(buffer.getvalue())
+
+def update_rollups(groups):
+    """Incorpora as leituras de cada turbina aos rollups do histórico, em paralelo. Devolve os arquivos gravados."""
+    if not groups:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(STATE_IO_WORKERS, len(groups))) as executor:
+        return sum(executor.map(lambda item: rollup_store.update(*item), groups.items()))
+
+def update_fleet_state(groups, df_processed):
+    """
+    Atualiza a entrada de cada turbina no estado da frota com as suas leituras e a sua janela mais
+    recente (com as predições, se houver). Devolve o maior atraso desde a ingestão, em segundos (ou None).
+    """
+    latest_windows = {}
+    if not df_processed.empty:
+        latest = df_processed.sort_values("window_end_timestamp").groupby("turbine_id", sort=False).tail(1)
+        latest_windows = {row["turbine_id"]: row for row in latest.to_dict("records")}
+    with ThreadPoolExecutor(max_workers=min(STATE_IO_WORKERS, len(groups))) as executor:
+        entries = list(executor.map(
+            lambda item: fleet_state_store.update(item[0], item[1], latest_windows.get(item[0])), groups.items()))
+    lags = [entry["ingest_lag_s"] for entry in entries if entry.get("ingest_lag_s") is not None]
+    return max(lags) if lags else None
+
+def score_windows(df_processed):
+    """
+    Pontua todas as janelas em uma única chamada vetorizada ao scaler e ao modelo.
+    Acrescenta prediction_label, prediction_proba_<classe> (se o modelo tiver predict_proba) e
+    prediction_model_version. Valores ausentes são imputados como na API de predição (state.fill_values).
+    """
+    # Importado só com INLINE_SCORING: o joblib/scikit-learn não pesam no início a frio do modo padrão
+    import lambda_predict_failure as predictor
+
+    state = predictor.load_model_artifacts()
+    matrix = df_processed.reindex(columns=state.model_columns).to_numpy(dtype=np.float64, copy=True)
+    missing = np.isnan(matrix)
+    if missing.any():
+        matrix[missing] = np.broadcast_to(state.fill_values, matrix.shape)[missing]
+    predictions, prediction_proba = predictor.predict_matrix(state, predictor.apply_scaler(state, matrix))
+
+    scored = {f"{PREDICTION_COLUMN_PREFIX}label": predictions.astype(np.int64)}
+    if prediction_proba is not None:
+        for k, label in enumerate(state.model.classes_):
+            scored[f"{PREDICTION_COLUMN_PREFIX}proba_{label}"] = prediction_proba[:, k]
+    scored[f"{PREDICTION_COLUMN_PREFIX}model_version"] = predictor.artifact_cache.versions.get("model")
+    return df_processed.assign(**scored)
+
+def write_feature_partitions(df_processed, source_key, base_path=None):
+    """
+    Grava as features em FEATURES_BASE_PATH (ou base_path)/turbine_id=<id>/date=<dia>/<objeto de origem>_features.parquet.
+    O nome do arquivo deriva do objeto de origem, então reprocessar o mesmo objeto sobrescreve
+    os mesmos arquivos em vez de duplicar janelas. Devolve os caminhos gravados.
+    """
+    file_name = source_key.split("/")[-1].replace(".json", "").replace(".gz", "") + "_features.parquet"
+    partitions = [
+        (partition_path(base_path or FEATURES_BASE_PATH, turbine_id, date, file_name), df_partition)
+        for (turbine_id, date), df_partition in feature_partitions(df_processed)
+    ]
+    with ThreadPoolExecutor(max_workers=min(STATE_IO_WORKERS, len(partitions))) as executor:
+        list(executor.map(lambda item: wr.s3.to_parquet(df=item[1], path=item[0]), partitions))
+    return [path for path, _ in partitions]
+
+@instrumented("lambda_process_data")
+def lambda_handler(event, context, metrics):
     """
     Função Lambda para processar dados brutos do S3 (entregues pelo Firehose),
     extrair features e salvar os dados processados em outro bucket S3.
     Esta função seria tipicamente acionada por um evento S3 (PutObject) no bucket de dados brutos.
+    As métricas da invocação (metrics.py) são emitidas em uma linha JSON ao final.
     """
-    print(f"Evento recebido: {event}")
-
     # Obter informações do bucket e do objeto do evento S3
     source_bucket = event["Records"][0]["s3"]["bucket"]["name"]
     source_key = event["Records"][0]["s3"]["object"]["key"]
+    metrics.set_property("source_key", source_key)
+    if "size" in event["Records"][0]["s3"]["object"]:
+        metrics.set("payload_bytes", event["Records"][0]["s3"]["object"]["size"])
 
     print(f"Processando arquivo: s3://{source_bucket}/{source_key}")
 
     try:
-        # Ler o arquivo JSON do S3 (awswrangler lida bem com partições do Firehose)
-        # O Firehose pode entregar múltiplos JSONs em um único arquivo S3, ou arquivos gzippados.
-        # awswrangler.s3.read_json geralmente lida com isso.
-        # Se os dados estiverem em formato JSON Lines (um JSON por linha), o awswrangler também suporta.
-        df_raw = wr.s3.read_json(path=f"s3://{source_bucket}/{source_key}", lines=True, orient="records")
+        # Ler o objeto do S3: JSON Lines (uma leitura por registro do Firehose) ou registros
+        # agregados pela lambda_ingest_data com AGGREGATE_RECORDS (colunares, com gzip)
+        with metrics.stage("parse"):
+            df_raw = read_raw_object(f"s3://{source_bucket}/{source_key}")
+            # Converter colunas para tipos corretos se necessário (ex: timestamp)
+            if "timestamp" in df_raw.columns:
+                df_raw["timestamp"] = pd.to_datetime(df_raw["timestamp"])
         print(f"Lidos {len(df_raw)} registros do arquivo {source_key}")
-        
+        metrics.set("records", len(df_raw))
+
         if df_raw.empty:
             print("Arquivo vazio, nada a processar.")
             return {"statusCode": 200, "body": json.dumps("Arquivo vazio.")}
-
-        # Converter colunas para tipos corretos se necessário (ex: timestamp)
-        if "timestamp" in df_raw.columns:
-            df_raw["timestamp"] = pd.to_datetime(df_raw["timestamp"])
-        
-        # Lógica de janelamento e extração de features
-        # Para este exemplo, vamos usar janelas deslizantes simples.
-        # O tamanho da janela e o passo devem ser definidos com base no caso de uso.
-        WINDOW_SIZE_MINUTES = 10 # Exemplo: janela de 10 minutos
-        STEP_MINUTES = 5       # Exemplo: passo de 5 minutos
         
-        # Assumindo que os dados estão ordenados por timestamp e chegam a cada minuto
-        window_size_points = WINDOW_SIZE_MINUTES 
+        # Lógica de janelamento e extração de features (janelas deslizantes).
+        # Assumindo que os dados chegam a cada minuto, janela e passo em pontos = minutos.
+        window_size_points = WINDOW_SIZE_MINUTES
         step_points = STEP_MINUTES
 
-        processed_features_list = []
-        
-        if not df_raw.empty and "timestamp" in df_raw.columns:
-            df_raw = df_raw.sort_values(by="timestamp")
-            for i in range(0, len(df_raw) - window_size_points + 1, step_points):
-                df_window = df_raw.iloc[i : i + window_size_points]
-                if not df_window.empty:
-                    features = calculate_features(df_window)
-                    # Adicionar identificador da turbina se disponível no nome do arquivo/path
-                    # Ex: extrair de source_key
-                    turbine_id_str = "unknown_turbine"
-                    try:
-                        # Tentativa de extrair turbine_id do nome do arquivo (ex: turbine_1_...)
-                        parts = source_key.split("/")[-1].split("_")
-                        if parts[0] == "turbine" and len(parts) > 1:
-                            turbine_id_str = f"turbine_{parts[1]}"
-                    except Exception as e:
-                        print(f"Não foi possível extrair turbine_id do nome do arquivo {source_key}: {e}")
-                    features["turbine_id"] = turbine_id_str
-                    processed_features_list.append(features)
+        if "timestamp" not in df_raw.columns:
+            print("DataFrame sem coluna 'timestamp' após leitura. Não é possível janelar.")
+            print("Nenhuma feature foi extraída.")
+            return {"statusCode": 200, "body": json.dumps("Nenhuma feature extraída.")}
+
+        # Um objeto do Firehose mistura leituras de várias turbinas: as janelas são calculadas por
+        # turbina (campo turbine_id de cada registro). Objetos sem esse campo usam o nome do arquivo.
+        # Com janelamento incremental, cada turbina continua a partir das leituras pendentes do
+        # objeto anterior; sem ele, cada objeto é janelado isoladamente
+        with metrics.stage("split"):
+            groups = split_by_turbine(df_raw, default_turbine_id=extract_turbine_id(source_key))
+        with metrics.stage("state_load"):
+            states = load_window_states(list(groups)) if INCREMENTAL_WINDOWING else {}
+        print(f"{len(groups)} turbina(s) no arquivo {source_key}")
+        metrics.set("turbines", len(groups))
+
+        with metrics.stage("features"):
+            results = window_fleet(groups, states, window_size_points, step_points, max_workers=PROCESSING_WORKERS)
+
+        feature_frames = []
+        new_states = {}
+        for turbine_id, features, new_state, num_dropped in results:
+            if num_dropped:
+                print(f"{num_dropped} leituras já processadas (reentrega ou atraso) descartadas para {turbine_id}.")
+                metrics.add("records_dropped", num_dropped)
+            if not features.empty:
+                features["turbine_id"] = turbine_id
+                feature_frames.append(features)
+            new_states[turbine_id] = new_state
+
+        output_paths = []
+        if feature_frames:
+            df_processed = pd.concat(feature_frames, ignore_index=True)
+            metrics.set("windows", len(df_processed))
+            if INLINE_SCORING:
+                # Uma falha ao pontuar não impede a gravação das features (as janelas ficam sem predição)
+                try:
+                    with metrics.stage("score"):
+                        df_processed = score_windows(df_processed)
+                    metrics.set("windows_scored", len(df_processed))
+                except Exception as e:
+                    print(f"Erro ao pontuar as janelas de {source_key}; features gravadas sem predições: {e}")
+                    metrics.add("scoring_errors")
+            # Salvar as features em Parquet, particionadas por turbina e dia (formato Hive)
+            with metrics.stage("write"):
+                output_paths = write_feature_partitions(df_processed, source_key)
+            print(f"Features processadas salvas em {len(output_paths)} partições de {FEATURES_BASE_PATH}")
         else:
-            print("DataFrame vazio ou sem coluna 'timestamp' após leitura. Não é possível janelar.")
+            df_processed = pd.DataFrame()
 
-        if not processed_features_list:
+        # Rollups do histórico: cada arquivo ignora leituras já incorporadas, então uma nova tentativa
+        # (se esta etapa ou as seguintes falharem) não duplica as contagens
+        if HISTORY_ROLLUPS:
+            with metrics.stage("rollups"):
+                metrics.set("rollup_files_written", update_rollups(groups))
+
+        # Estado atual da frota: as atualizações são idempotentes (leituras já incorporadas e janelas
+        # mais antigas são ignoradas), então uma nova tentativa não altera as linhas de base
+        if fleet_state_store is not None:
+            with metrics.stage("fleet_state"):
+                lag_s = update_fleet_state(groups, df_processed)
+            if lag_s is not None:
+                metrics.set("fleet_state_lag_ms", lag_s * 1000.0)
+
+        # O estado só avança depois que as features foram gravadas: se a gravação falhar,
+        # o reprocessamento do objeto gera as mesmas janelas (mesmos arquivos de saída)
+        if INCREMENTAL_WINDOWING:
+            with metrics.stage("state_save"):
+                save_window_states(new_states)
+
+        if df_processed.empty:
             print("Nenhuma feature foi extraída.")
             return {"statusCode": 200, "body": json.dumps("Nenhuma feature extraída.")}
 
-        df_processed = pd.DataFrame(processed_features_list)
-        
-        # Salvar as features processadas em formato Parquet no bucket de destino
-        # O Parquet é eficiente para armazenamento e consultas analíticas.
-        # O nome do arquivo de saída pode incluir informações do arquivo de origem ou timestamp.
-        output_filename = source_key.replace(".json", "").replace(".gz", "") + "_features.parquet"
-        output_path = f"s3://{PROCESSED_DATA_BUCKET}/features/{output_filename}"
-        
-        wr.s3.to_parquet(df=df_processed, path=output_path)
-        print(f"Features processadas salvas em: {output_path}")
-
         return {
             "statusCode": 200,
-            "body": json.dumps({"message": f"Arquivo {source_key} processado. {len(df_processed)} janelas de features salvas em {output_path}"})
+            "body": json.dumps({
+                "message": f"Arquivo {source_key} processado. {len(df_processed)} janelas de features de "
+                           f"{len(groups)} turbina(s) salvas em {len(output_paths)} partições de {FEATURES_BASE_PATH}",
+                "output_paths": output_paths,
+            })
         }
 
     except Exception as e:
@@ -0,0 +1,288 @@
+import hashlib
+import io
+import os
+import random
+import shutil
+import threading
+import time
+
+# Substitutos locais (em memória ou em um diretório) de serviços AWS usados pelas Lambdas, para
+# testes e benchmarks sem credenciais. Implementam apenas a parte da API que o pipeline utiliza.
+
+
+class FakeClientError(Exception):
+    """Exceção com o mesmo formato de botocore.exceptions.ClientError (atributo response)."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code}: {message}")
+        self.response = {"Error": {"Code": code, "Message": message}}
+
+
+class FakeFirehoseClient:
+    """
+    Substituto do cliente boto3 "firehose" (put_record_batch).
+
+    failure_rate: fração de registros que voltam com ErrorCode (falha parcial).
+    throttle_rate: fração de chamadas que levantam ServiceUnavailableException.
+    latency_s: atraso simulado por chamada.
+    Os registros aceitos ficam em delivered[stream] (lista de bytes), na ordem de chegada.
+    """
+
+    def __init__(self, failure_rate=0.0, throttle_rate=0.0, latency_s=0.0, seed=0):
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.latency_s = latency_s
+        self.delivered = {}
+        self.calls = 0
+        self.objects_delivered = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        if len(Records) > 500:
+            raise FakeClientError("InvalidArgumentException", "Mais de 500 registros no batch.")
+        if sum(len(record["Data"]) for record in Records) > 4 * 1024 * 1024:
+            raise FakeClientError("InvalidArgumentException", "Batch excede 4 MiB.")
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+        with self._lock:
+            self.calls += 1
+            if self._random.random() < self.throttle_rate:
+                raise FakeClientError("ServiceUnavailableException", "Slow down.")
+            failures = [self._random.random() < self.failure_rate for _ in Records]
+            stream = self.delivered.setdefault(DeliveryStreamName, [])
+            responses = []
+            for record, failed in zip(Records, failures):
+                if failed:
+                    responses.append({"ErrorCode": "ServiceUnavailableException", "ErrorMessage": "Slow down."})
+                else:
+                    stream.append(record["Data"])
+                    responses.append({"RecordId": f"{self.calls}-{len(stream)}"})
+
+        return {"FailedPutCount": sum(failures), "Encrypted": False, "RequestResponses": responses}
+
+    def delivered_records(self, stream_name):
+        return list(self.delivered.get(stream_name, []))
+
+    def deliver_to_s3(self, stream_name, s3_client, bucket, prefix="raw/", buffer_bytes=5 * 1024 * 1024):
+        """
+        Simula a entrega do Firehose no S3: consome os registros aceitos e os grava em objetos de
+        até buffer_bytes, um registro por linha (delimitador de nova linha), com chaves no formato
+        <prefix>AAAA/MM/DD/HH/<stream>-<n>. Devolve as chaves gravadas.
+        """
+        with self._lock:
+            records = self.delivered.pop(stream_name, [])
+        hour_prefix = time.strftime("%Y/%m/%d/%H", time.gmtime())
+        keys = []
+        batch, batch_bytes = [], 0
+
+        def write_object():
+            self.objects_delivered += 1
+            key = f"{prefix}{hour_prefix}/{stream_name}-{self.objects_delivered:06d}"
+            s3_client.put_object(Bucket=bucket, Key=key, Body=b"".join(batch))
+            keys.append(key)
+
+        for data in records:
+            line = data if data.endswith(b"\n") else data + b"\n"
+            if batch and batch_bytes + len(line) > buffer_bytes:
+                write_object()
+                batch, batch_bytes = [], 0
+            batch.append(line)
+            batch_bytes += len(line)
+        if batch:
+            write_object()
+        return keys
+
+
+class FakeDynamoDBClient:
+    """
+    Substituto em memória do cliente boto3 "dynamodb" (get_item, put_item e scan paginado), para
+    tabelas com chave de partição simples. page_size: itens por página do scan.
+    """
+
+    def __init__(self, page_size=100):
+        self.page_size = page_size
+        self.tables = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(key):
+        (name, value), = key.items()
+        return name, next(iter(value.values()))
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        with self._lock:
+            self.calls += 1
+            item = self.tables.get(TableName, {}).get(self._key(Key)[1])
+        return {"Item": dict(item)} if item is not None else {}
+
+    def put_item(self, TableName, Item):
+        with self._lock:
+            self.calls += 1
+            table = self.tables.setdefault(TableName, {})
+            # A chave de partição é o primeiro atributo do item
+            name = next(iter(Item))
+            table[self._key({name: Item[name]})[1]] = dict(Item)
+        return {}
+
+    def scan(self, TableName, ExclusiveStartKey=None, Limit=None):
+        with self._lock:
+            self.calls += 1
+            keys = sorted(self.tables.get(TableName, {}))
+            start = 0
+            if ExclusiveStartKey is not None:
+                start = keys.index(self._key(ExclusiveStartKey)[1]) + 1
+            page = keys[start:start + (Limit or self.page_size)]
+            items = [dict(self.tables[TableName][key]) for key in page]
+        response = {"Items": items, "Count": len(items)}
+        if start + len(page) < len(keys):
+            name = next(iter(items[-1]))
+            response["LastEvaluatedKey"] = {name: items[-1][name]}
+        return response
+
+
+class _NoSuchKey(Exception):
+    pass
+
+
+class _LocalS3Exceptions:
+    NoSuchKey = _NoSuchKey
+
+
+def split_s3_path(path):
+    """s3://bucket/chave -> (bucket, chave)."""
+    if not path.startswith("s3://"):
+        raise ValueError(f"Caminho S3 inválido: {path}")
+    bucket, _, key = path[len("s3://"):].partition("/")
+    return bucket, key
+
+
+class LocalS3Client:
+    """
+    Substituto do cliente boto3 "s3" sobre um diretório local: root_dir/<bucket>/<chave>.
+    Implementa get_object, put_object, head_object, delete_object, download_file e list_objects_v2.
+    O bucket não é versionado (a versão é o ETag) e os metadados dos objetos ficam em memória.
+    """
+
+    exceptions = _LocalS3Exceptions
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self._metadata = {}
+
+    def local_path(self, bucket, key):
+        return os.path.join(self.root_dir, bucket, *key.split("/"))
+
+    def put_object(self, Bucket, Key, Body, Metadata=None):
+        path = self.local_path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        elif not isinstance(Body, (bytes, bytearray)):
+            Body = Body.read()
+        with open(path + ".tmp", "wb") as f:
+            f.write(Body)
+        os.replace(path + ".tmp", path)
+        self._metadata[(Bucket, Key)] = dict(Metadata or {})
+        return {"ETag": f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def get_object(self, Bucket, Key, IfMatch=None, VersionId=None):
+        if VersionId is not None:
+            raise FakeClientError("InvalidArgument", "Bucket local sem versionamento")
+        try:
+            with open(self.local_path(Bucket, Key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise _NoSuchKey(f"s3://{Bucket}/{Key}")
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        if IfMatch is not None and IfMatch != etag:
+            raise FakeClientError("PreconditionFailed", f"s3://{Bucket}/{Key} mudou (ETag {etag})")
+        return {"Body": io.BytesIO(data), "ContentLength": len(data), "ETag": etag,
+                "Metadata": self._metadata.get((Bucket, Key), {})}
+
+    def head_object(self, Bucket, Key):
+        path = self.local_path(Bucket, Key)
+        if not os.path.exists(path):
+            raise FakeClientError("404", f"Not Found: s3://{Bucket}/{Key}")
+        digest = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return {"ETag": f'"{digest.hexdigest()}"', "ContentLength": os.path.getsize(path),
+                "Metadata": self._metadata.get((Bucket, Key), {})}
+
+    def delete_object(self, Bucket, Key):
+        try:
+            os.remove(self.local_path(Bucket, Key))
+        except FileNotFoundError:
+            pass # Como no S3, apagar uma chave inexistente não é erro
+        return {}
+
+    def download_file(self, Bucket, Key, Filename):
+        shutil.copyfile(self.local_path(Bucket, Key), Filename)
+
+    def list_objects_v2(self, Bucket, Prefix=""):
+        bucket_dir = os.path.join(self.root_dir, Bucket)
+        contents = []
+        for dirpath, _, filenames in os.walk(bucket_dir):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, bucket_dir).replace(os.sep, "/")
+                if key.startswith(Prefix):
+                    contents.append({"Key": key, "Size": os.path.getsize(path), "LastModified": os.path.getmtime(path)})
+        contents.sort(key=lambda item: item["Key"])
+        return {"Contents": contents, "KeyCount": len(contents), "IsTruncated": False}
+
+
+class LocalWrangler:
+    """
+    Substituto do módulo awswrangler (apenas wr.s3.read_json, download, to_parquet, read_parquet e
+    list_objects) que lê e grava no mesmo diretório de um LocalS3Client.
+    Uso: lambda_process_data.wr = LocalWrangler(s3_client)
+    """
+
+    def __init__(self, s3_client):
+        self.s3 = _LocalWranglerS3(s3_client)
+
+
+class _LocalWranglerS3:
+    def __init__(self, s3_client):
+        self.client = s3_client
+
+    def _local(self, path):
+        return self.client.local_path(*split_s3_path(path))
+
+    def read_json(self, path, **kwargs):
+        import pandas as pd
+        return pd.read_json(self._local(path), **kwargs)
+
+    def download(self, path, local_file, **kwargs):
+        with open(self._local(path), "rb") as f:
+            if isinstance(local_file, str):
+                with open(local_file, "wb") as out:
+                    shutil.copyfileobj(f, out)
+            else:
+                shutil.copyfileobj(f, local_file)
+
+    def to_parquet(self, df, path, **kwargs):
+        local = self._local(path)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        df.to_parquet(local + ".tmp", index=kwargs.get("index", False))
+        os.replace(local + ".tmp", local)
+        return {"paths": [path]}
+
+    def read_parquet(self, path, dataset=False, **kwargs):
+        import pandas as pd
+        paths = [path] if isinstance(path, str) else list(path)
+        if dataset and len(paths) == 1:
+            # Diretório particionado no formato Hive (colunas de partição recuperadas do caminho)
+            return pd.read_parquet(self._local(paths[0]), **kwargs)
+        return pd.concat([pd.read_parquet(self._local(p), **kwargs) for p in paths], ignore_index=True)
+
+    def list_objects(self, path):
+        bucket, prefix = split_s3_path(path)
+        return [f"s3://{bucket}/{item['Key']}" for item in self.client.list_objects_v2(Bucket=bucket, Prefix=prefix)["Contents"]]
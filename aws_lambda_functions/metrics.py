@@ -0,0 +1,176 @@
+import functools
+import json
+import os
+import random
+import time
+
+# Métricas estruturadas por invocação das Lambdas.
+# Cada invocação amostrada gera uma única linha JSON no formato EMF (CloudWatch Embedded Metric
+# Format): o CloudWatch Logs extrai as métricas automaticamente, sem chamadas a PutMetricData.
+# A linha traz início a frio ou a quente, a duração de cada etapa (*_ms), contadores (registros,
+# janelas, bytes do payload) e a vazão em registros por segundo.
+#
+# Invocações não amostradas (ou com as métricas desativadas) recebem NULL_METRICS, cujos
+# métodos não fazem nada: o custo no caminho quente é o de uma chamada de função vazia.
+
+# "on" (padrão) ou "off"
+METRICS_MODE = os.environ.get("METRICS_MODE", "on").lower()
+# Fração das invocações a quente que emitem métricas (inícios a frio são sempre emitidos)
+METRICS_SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", "1.0"))
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "TurbineFailurePipeline")
+
+_warm_functions = set()
+
+
+def _unit(name):
+    if name.endswith("_ms"):
+        return "Milliseconds"
+    if name.endswith("_bytes"):
+        return "Bytes"
+    if name.endswith("_per_second"):
+        return "Count/Second"
+    return "Count"
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_duration(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class InvocationMetrics:
+    """Métricas de uma invocação: durações por etapa, contadores e propriedades de contexto."""
+
+    enabled = True
+
+    def __init__(self, function_name, cold_start, request_id=None):
+        self.function_name = function_name
+        self.cold_start = cold_start
+        self.request_id = request_id
+        self.values = {}
+        self.properties = {}
+        self._start = time.perf_counter()
+
+    def stage(self, name):
+        """Context manager que soma a duração do bloco em <name>_ms."""
+        return _StageTimer(self, name)
+
+    def add_duration(self, name, seconds):
+        key = f"{name}_ms"
+        self.values[key] = self.values.get(key, 0.0) + seconds * 1000.0
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def add(self, name, value=1):
+        self.values[name] = self.values.get(name, 0) + value
+
+    def set_property(self, name, value):
+        """Informação de contexto (não agregada como métrica), ex: chave do objeto processado."""
+        self.properties[name] = value
+
+    def to_record(self):
+        total_s = time.perf_counter() - self._start
+        values = dict(self.values, total_ms=total_s * 1000.0, cold_start=int(self.cold_start))
+        if "records" in values and total_s > 0:
+            values["records_per_second"] = values["records"] / total_s
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["function"]],
+                    "Metrics": [{"Name": name, "Unit": _unit(name)} for name in values],
+                }],
+            },
+            "function": self.function_name,
+            "request_id": self.request_id,
+            **self.properties,
+            **values,
+        }
+
+    def emit(self):
+        print(json.dumps(self.to_record(), default=str, separators=(",", ":")))
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullMetrics:
+    """Métricas desativadas ou invocação não amostrada: nada é medido nem emitido."""
+
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def add_duration(self, name, seconds):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def add(self, name, value=1):
+        pass
+
+    def set_property(self, name, value):
+        pass
+
+    def emit(self):
+        pass
+
+
+NULL_METRICS = _NullMetrics()
+
+
+def start_invocation(function_name, context=None):
+    """Devolve as métricas da invocação (ou NULL_METRICS, conforme METRICS_MODE e a amostragem)."""
+    cold_start = function_name not in _warm_functions
+    _warm_functions.add(function_name)
+    if METRICS_MODE == "off":
+        return NULL_METRICS
+    if not cold_start and METRICS_SAMPLE_RATE < 1.0 and random.random() >= METRICS_SAMPLE_RATE:
+        return NULL_METRICS
+    return InvocationMetrics(function_name, cold_start, getattr(context, "aws_request_id", None))
+
+
+def instrumented(function_name):
+    """
+    Decorador para handlers no formato handler(event, context, metrics): a Lambda continua
+    chamando handler(event, context) e a linha de métricas é emitida ao final de cada
+    invocação, inclusive quando o handler levanta uma exceção.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            metrics = start_invocation(function_name, context)
+            status = "error"
+            try:
+                response = handler(event, context, metrics)
+                if isinstance(response, dict):
+                    status = response.get("statusCode", status)
+                return response
+            finally:
+                if metrics.enabled:
+                    metrics.set_property("status", status)
+                    metrics.emit()
+        return wrapper
+    return decorator
@@ -0,0 +1,159 @@
+import gzip
+import io
+import json
+import zlib
+
+from firehose_sender import MAX_RECORD_BYTES
+
+# Agregação de leituras em registros do Kinesis Data Firehose.
+# Sem agregação, cada leitura vira um registro JSON, com os nomes dos campos repetidos em todas as
+# linhas. No modo agregado, muitas leituras da mesma turbina vão em um único registro, em formato
+# colunar e comprimido com gzip:
+#   gzip('{"columns":{"timestamp":[...],"wind_speed_m_s":[...],...},"constants":{...},"count":N}\n')
+# Campos com o mesmo valor em todas as leituras (turbine_id, timestamp de ingestão) vão uma vez
+# só em "constants". O Firehose concatena os registros no objeto do S3, o que resulta em um
+# arquivo gzip com vários membros; decode_raw_object lê esses objetos, os objetos antigos (uma
+# leitura JSON por linha) e objetos que misturem os dois formatos.
+
+GZIP_MAGIC = b"\x1f\x8b"
+COLUMNAR_PREFIX = b'{"columns":'
+DEFAULT_MAX_READINGS = 20000
+DEFAULT_COMPRESSION_LEVEL = 1
+_WHITESPACE = b" \t\r\n"
+
+
+def encode_readings(readings, compression_level=DEFAULT_COMPRESSION_LEVEL):
+    """Codifica uma lista de leituras (dicts) em um registro colunar comprimido (bytes)."""
+    columns = {}
+    for i, reading in enumerate(readings):
+        for key, value in reading.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * i
+            column.append(value)
+        # Campos ausentes nesta leitura
+        for column in columns.values():
+            if len(column) <= i:
+                column.append(None)
+    constants = {}
+    for key, column in list(columns.items()):
+        first = column[0]
+        if all(value == first for value in column):
+            constants[key] = columns.pop(key)[0]
+    document = {"columns": columns, "constants": constants, "count": len(readings)}
+    text = json.dumps(document, separators=(",", ":")) + "\n"
+    return gzip.compress(text.encode("utf-8"), compresslevel=compression_level, mtime=0)
+
+
+class RecordAggregator:
+    """
+    Acumula leituras por turbina e entrega registros agregados a emit (ex: FirehoseSender.send)
+    a cada max_readings leituras de uma turbina, e o restante em flush(). Um registro que passe
+    do limite do Firehose é dividido ao meio até caber; uma leitura que sozinha não cabe é
+    descartada (contada em stats["readings_skipped"]).
+
+    Uso:
+        aggregator = RecordAggregator(sender.send)
+        for record in records:
+            aggregator.add(record)
+        aggregator.flush()
+    """
+
+    def __init__(self, emit, max_readings=DEFAULT_MAX_READINGS, max_record_bytes=MAX_RECORD_BYTES,
+                 compression_level=DEFAULT_COMPRESSION_LEVEL, key_field="turbine_id"):
+        if max_readings < 1:
+            raise ValueError("max_readings deve ser positivo.")
+        self.emit = emit
+        self.max_readings = max_readings
+        self.max_record_bytes = max_record_bytes
+        self.compression_level = compression_level
+        self.key_field = key_field
+        self._pending = {}
+        self.stats = {"readings_aggregated": 0, "readings_skipped": 0, "records_emitted": 0, "encoded_bytes": 0}
+
+    def add(self, reading):
+        pending = self._pending.setdefault(reading.get(self.key_field), [])
+        pending.append(reading)
+        if len(pending) >= self.max_readings:
+            self._emit(pending)
+            pending.clear()
+
+    def flush(self):
+        for pending in self._pending.values():
+            if pending:
+                self._emit(pending)
+        self._pending = {}
+
+    def _emit(self, readings):
+        data = encode_readings(readings, self.compression_level)
+        if len(data) > self.max_record_bytes:
+            if len(readings) == 1:
+                print(f"Leitura ignorada: {len(data)} bytes comprimidos excedem o limite do Firehose "
+                      f"de {self.max_record_bytes} bytes.")
+                self.stats["readings_skipped"] += 1
+                return
+            middle = len(readings) // 2
+            self._emit(readings[:middle])
+            self._emit(readings[middle:])
+            return
+        self.emit(data)
+        self.stats["readings_aggregated"] += len(readings)
+        self.stats["records_emitted"] += 1
+        self.stats["encoded_bytes"] += len(data)
+
+
+def _iter_segments(data):
+    """
+    Separa um objeto entregue pelo Firehose em trechos de texto: cada membro gzip é descomprimido
+    e o texto puro (leituras JSON, uma por linha) segue até o próximo membro gzip. Com compressão
+    GZIP configurada no Firehose, o objeto inteiro é um gzip que contém os registros agregados.
+    """
+    view = memoryview(data)
+    position = 0
+    while position < len(data):
+        if data[position] in _WHITESPACE:
+            position += 1
+        elif data.startswith(GZIP_MAGIC, position):
+            decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+            segment = decompressor.decompress(view[position:])
+            if GZIP_MAGIC in segment:
+                # Objeto inteiro em gzip com registros agregados, inclusive depois de leituras em texto puro
+                yield from _iter_segments(segment)
+            else:
+                yield segment
+            if not decompressor.eof:
+                raise ValueError("Membro gzip truncado no objeto do Firehose.")
+            position = len(data) - len(decompressor.unused_data)
+        else:
+            end = data.find(b"\n" + GZIP_MAGIC, position)
+            end = len(data) if end < 0 else end + 1
+            yield bytes(view[position:end])
+            position = end
+
+
+def decode_raw_object(data):
+    """
+    DataFrame com as leituras de um objeto bruto do Firehose (bytes), agregado ou não.
+    Objetos sem registros agregados são lidos com pd.read_json(lines=True), como antes.
+    """
+    import pandas as pd
+
+    # JSON válido nunca contém o byte 0x1f sem escape: sem ele não há membros gzip no objeto
+    if GZIP_MAGIC not in data and COLUMNAR_PREFIX not in data:
+        return pd.read_json(io.BytesIO(data), lines=True, orient="records")
+
+    frames = []
+    plain_lines = []
+    for segment in _iter_segments(data):
+        for line in segment.split(b"\n"):
+            if line.startswith(COLUMNAR_PREFIX):
+                document = json.loads(line)
+                frame = pd.DataFrame(document["columns"], index=pd.RangeIndex(document["count"]))
+                frames.append(frame.assign(**document["constants"]))
+            elif line.strip():
+                plain_lines.append(line)
+    if plain_lines:
+        frames.append(pd.read_json(io.BytesIO(b"\n".join(plain_lines)), lines=True, orient="records"))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
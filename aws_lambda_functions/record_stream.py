@@ -0,0 +1,141 @@
+import codecs
+import gzip
+import io
+import json
+
+# Leitura incremental de registros JSON a partir de um arquivo local ou do corpo de um
+# objeto S3 (StreamingBody). Aceita um array JSON ([{...}, {...}]) ou NDJSON (um objeto por
+# linha), opcionalmente comprimidos com gzip. Os registros são entregues em lotes à medida
+# que os bytes chegam, então a memória não cresce com o tamanho do arquivo.
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+_WHITESPACE = " \t\n\r"
+
+
+class _PeekableStream:
+    """Permite olhar os primeiros bytes de um stream sem consumi-los (detecção de gzip)."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._head = b""
+
+    def peek(self, size):
+        while len(self._head) < size:
+            data = self.raw.read(size - len(self._head))
+            if not data:
+                break
+            self._head += data
+        return self._head[:size]
+
+    def read(self, size=-1):
+        if self._head:
+            if size is None or size < 0:
+                data, self._head = self._head + self.raw.read(), b""
+                return data
+            data, self._head = self._head[:size], self._head[size:]
+            if len(data) < size:
+                data += self.raw.read(size - len(data))
+            return data
+        return self.raw.read(size)
+
+
+def _open_stream(source):
+    """Aceita um caminho local, bytes ou um objeto com read() (arquivo binário, StreamingBody)."""
+    if isinstance(source, str):
+        return open(source, "rb"), True
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source), True
+    return source, False
+
+
+def iter_record_batches(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Gera listas de registros (dicts) lidos incrementalmente de source.
+    Cada lista contém os registros completos disponíveis após a leitura de um bloco de bytes.
+    """
+    stream, should_close = _open_stream(source)
+    try:
+        peekable = _PeekableStream(stream)
+        if peekable.peek(2) == GZIP_MAGIC:
+            stream_to_read = gzip.GzipFile(fileobj=peekable, mode="rb")
+        else:
+            stream_to_read = peekable
+        yield from _iter_text_batches(stream_to_read, chunk_size)
+    finally:
+        if should_close:
+            stream.close()
+
+
+def iter_records(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Gera os registros de source um a um (ver iter_record_batches)."""
+    for batch in iter_record_batches(source, chunk_size):
+        yield from batch
+
+
+def _iter_text_batches(stream, chunk_size):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    json_decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    mode = None # "array" ou "ndjson", decidido pelo primeiro caractere não branco
+    array_done = False
+    eof = False
+
+    while not eof:
+        data = stream.read(chunk_size)
+        if not data:
+            eof = True
+            buffer += decoder.decode(b"", final=True)
+        else:
+            buffer += decoder.decode(data)
+
+        if mode is None:
+            stripped = buffer.lstrip(_WHITESPACE + "\ufeff")
+            if not stripped:
+                continue
+            buffer, position = stripped, 0
+            if buffer[0] == "[":
+                mode = "array"
+                position = 1
+            else:
+                mode = "ndjson"
+
+        batch = []
+        if mode == "ndjson":
+            last_newline = buffer.rfind("\n")
+            end = len(buffer) if eof else last_newline + 1
+            for line in buffer[:end].split("\n"):
+                line = line.strip()
+                if line:
+                    batch.append(json.loads(line))
+            buffer = buffer[end:]
+        elif not array_done:
+            while True:
+                while position < len(buffer) and buffer[position] in _WHITESPACE + ",":
+                    position += 1
+                if position >= len(buffer):
+                    break
+                if buffer[position] == "]":
+                    array_done = True
+                    break
+                try:
+                    record, end = json_decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    break # Registro incompleto: ler mais bytes
+                if end == len(buffer) and not eof:
+                    # Um valor escalar pode continuar no próximo bloco (ex: número cortado)
+                    break
+                batch.append(record)
+                position = end
+            # Descarta o prefixo já consumido para manter o buffer pequeno
+            buffer, position = buffer[position:], 0
+
+        if batch:
+            yield batch
+
+    if mode == "array" and not array_done:
+        raise ValueError("Array JSON incompleto: ']' final não encontrado.")
@@ -0,0 +1,307 @@
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from aws_clients import resolve_client
+
+# Histórico agregado dos sensores para os gráficos do dashboard.
+# Para cada turbina são mantidos rollups em quatro resoluções (1 min, 10 min, 1 h e 1 dia) com
+# contagem, soma, mínimo e máximo de cada sensor por intervalo; a média é soma / contagem, o que
+# permite juntar intervalos (e atualizações) sem perder exatidão.
+# Cada resolução é dividida em arquivos Parquet por período, de tamanho limitado:
+#   rollups/turbine_id=<id>/resolution=<res>/<período>.parquet
+# (1 min: um arquivo por dia; 10 min: por mês; 1 h e 1 dia: por ano). Uma consulta escolhe a
+# resolução mais fina que respeita o número máximo de pontos e lê apenas os períodos do
+# intervalo pedido: meses de histórico em 1 h ou 1 dia são um ou dois arquivos pequenos.
+#
+# Os rollups são atualizados de forma incremental pela lambda_process_data com as leituras de
+# cada objeto. Cada arquivo guarda nos metadados o timestamp da última leitura incorporada e
+# leituras com timestamp menor ou igual são ignoradas: reprocessar um objeto (reentrega do
+# Firehose ou nova tentativa da Lambda) não conta as leituras duas vezes. Como no estado de
+# janelamento, os objetos de uma turbina devem ser processados em sequência.
+
+ROLLUP_METADATA_KEY = b"rollup"
+BUCKET_COLUMN = "bucket_start"
+STATISTICS = ("count", "sum", "min", "max")
+# Colunas das leituras que não são sensores
+NON_SENSOR_COLUMNS = ("timestamp", "label", "turbine_id")
+
+# Resolução -> (largura do intervalo, unidade do período de cada arquivo), da mais fina à mais grossa
+RESOLUTIONS = {
+    "1min": (np.timedelta64(1, "m"), "D"),
+    "10min": (np.timedelta64(10, "m"), "M"),
+    "1h": (np.timedelta64(1, "h"), "Y"),
+    "1d": (np.timedelta64(1, "D"), "Y"),
+}
+DEFAULT_MAX_POINTS = 500
+
+
+def floor_timestamps(timestamps, width):
+    """Início do intervalo de largura width de cada timestamp (datetime64[ns], sem fuso)."""
+    values = np.asarray(timestamps, dtype="datetime64[ns]").astype(np.int64)
+    step = int(width / np.timedelta64(1, "ns"))
+    return ((values // step) * step).astype("datetime64[ns]")
+
+
+def period_keys(timestamps, unit):
+    """Período (arquivo) de cada timestamp, como datetime64[unit]; str() dá "AAAA-MM-DD", "AAAA-MM" ou "AAAA"."""
+    return np.asarray(timestamps, dtype="datetime64[ns]").astype(f"datetime64[{unit}]")
+
+
+def choose_resolution(start, end, max_points=DEFAULT_MAX_POINTS):
+    """Resolução mais fina com no máximo max_points intervalos em [start, end] (ou a mais grossa)."""
+    span = np.datetime64(end, "ns") - np.datetime64(start, "ns")
+    for name, (width, _) in RESOLUTIONS.items():
+        if span // width + 1 <= max_points:
+            return name
+    return list(RESOLUTIONS)[-1]
+
+
+def sensor_columns(readings):
+    """Colunas numéricas das leituras que são sensores."""
+    return [col for col in readings.columns if col not in NON_SENSOR_COLUMNS and readings[col].dtype.kind in "iuf"]
+
+
+def _reducer(column):
+    """Como combinar uma estatística de intervalos repetidos: contagem e soma somam, mínimo e máximo ignoram NaN."""
+    stat = column.rsplit("_", 1)[1]
+    return np.fmin if stat == "min" else np.fmax if stat == "max" else np.add
+
+
+def _reduce_buckets(buckets, columns):
+    """Combina as linhas de um mesmo intervalo (buckets já ordenados). Devolve {coluna: array}."""
+    if len(buckets) == 0:
+        return {BUCKET_COLUMN: buckets, **columns}
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    reduced = {BUCKET_COLUMN: buckets[starts]}
+    for column, values in columns.items():
+        reduced[column] = _reducer(column).reduceat(values, starts)
+    return reduced
+
+
+def compute_rollup(timestamps, values, width):
+    """
+    Agrega leituras em intervalos de largura width.
+    timestamps: datetime64[ns]; values: {sensor: float64}, NaN para leitura ausente.
+    Devolve {bucket_start, <sensor>_count/_sum/_min/_max: array}, ordenado por intervalo.
+    """
+    buckets = floor_timestamps(timestamps, width)
+    order = np.argsort(buckets, kind="stable")
+    columns = {}
+    for sensor, sensor_values in values.items():
+        sensor_values = sensor_values[order]
+        valid = ~np.isnan(sensor_values)
+        columns[f"{sensor}_count"] = valid.astype(np.int64)
+        columns[f"{sensor}_sum"] = np.where(valid, sensor_values, 0.0)
+        columns[f"{sensor}_min"] = sensor_values
+        columns[f"{sensor}_max"] = sensor_values
+    return _reduce_buckets(buckets[order], columns)
+
+
+def merge_rollups(existing, new):
+    """
+    Junta dois rollups da mesma resolução ({coluna: array}); intervalos repetidos são combinados.
+    Sensores presentes em só um dos lados ficam com contagem 0 e mínimo/máximo NaN no outro.
+    """
+    columns = list(existing) + [column for column in new if column not in existing]
+
+    def column_or_empty(rollup, column):
+        if column in rollup:
+            return rollup[column]
+        size = len(rollup[BUCKET_COLUMN])
+        if column.endswith("_count"):
+            return np.zeros(size, dtype=np.int64)
+        return np.zeros(size) if column.endswith("_sum") else np.full(size, np.nan)
+
+    buckets = np.concatenate((existing[BUCKET_COLUMN], new[BUCKET_COLUMN]))
+    order = np.argsort(buckets, kind="stable")
+    combined = {
+        column: np.concatenate((column_or_empty(existing, column), column_or_empty(new, column)))[order]
+        for column in columns if column != BUCKET_COLUMN
+    }
+    return _reduce_buckets(buckets[order], combined)
+
+
+def rollup_to_bytes(rollup, last_timestamp):
+    metadata = {ROLLUP_METADATA_KEY: json.dumps({"last_timestamp": str(np.datetime64(last_timestamp, "ns"))}).encode()}
+    buffer = io.BytesIO()
+    pq.write_table(pa.table(rollup).replace_schema_metadata(metadata), buffer)
+    return buffer.getvalue()
+
+
+def rollup_from_table(table):
+    return {column: table.column(column).to_numpy() for column in table.column_names}
+
+
+def rollup_last_timestamp(schema):
+    metadata = json.loads((schema.metadata or {}).get(ROLLUP_METADATA_KEY, b"{}"))
+    last_timestamp = metadata.get("last_timestamp")
+    return np.datetime64(last_timestamp, "ns") if last_timestamp else None
+
+
+class RollupStore:
+    """
+    Leitura e atualização dos rollups. As subclasses implementam apenas _read(key) (bytes ou None
+    se não existir) e _write(key, data) sobre um diretório local ou um prefixo do S3.
+    """
+
+    def __init__(self, io_workers=16):
+        self.io_workers = io_workers
+
+    def _key(self, turbine_id, resolution, period):
+        return f"turbine_id={turbine_id}/resolution={resolution}/{period}.parquet"
+
+    def _map(self, function, items):
+        items = list(items)
+        if len(items) <= 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.io_workers, len(items))) as executor:
+            return list(executor.map(function, items))
+
+    def update(self, turbine_id, readings):
+        """
+        Incorpora as leituras de uma turbina (DataFrame com timestamp em datetime e um sensor por
+        coluna) aos rollups de todas as resoluções. Devolve o número de arquivos gravados.
+        """
+        sensors = sensor_columns(readings)
+        if readings.empty or not sensors:
+            return 0
+        readings = readings.dropna(subset=["timestamp"])
+        timestamps = readings["timestamp"].to_numpy(dtype="datetime64[ns]")
+        values = {sensor: readings[sensor].to_numpy(dtype=np.float64, na_value=np.nan) for sensor in sensors}
+
+        # Arquivos afetados: (resolução, período) de cada leitura
+        targets = []
+        for resolution, (width, unit) in RESOLUTIONS.items():
+            keys = period_keys(timestamps, unit)
+            for period in np.unique(keys):
+                targets.append((resolution, width, period, keys == period))
+
+        def update_file(target):
+            resolution, width, period, in_period = target
+            key = self._key(turbine_id, resolution, str(period))
+            data = self._read(key)
+            existing = pq.read_table(io.BytesIO(data)) if data is not None else None
+            last_timestamp = rollup_last_timestamp(existing.schema) if existing is not None else None
+            selected = in_period if last_timestamp is None else in_period & (timestamps > last_timestamp)
+            if not selected.any():
+                return 0
+            rollup = compute_rollup(timestamps[selected], {sensor: v[selected] for sensor, v in values.items()}, width)
+            if existing is not None:
+                rollup = merge_rollups(rollup_from_table(existing), rollup)
+            self._write(key, rollup_to_bytes(rollup, timestamps[selected].max()))
+            return 1
+
+        return sum(self._map(update_file, targets))
+
+    def query(self, turbine_id, sensors, start, end, max_points=DEFAULT_MAX_POINTS, resolution=None):
+        """
+        Histórico de sensores de uma turbina em [start, end] com no máximo max_points intervalos.
+        Lê apenas os arquivos da resolução escolhida (choose_resolution, se não informada) que
+        cobrem o intervalo, e apenas as colunas dos sensores pedidos.
+        Devolve (resolução, {"timestamp": datetime64[ns], "<sensor>_min"/"_max"/"_mean": float64}).
+        Se mesmo a resolução mais grossa passar de max_points, intervalos vizinhos são combinados.
+        """
+        start, end = np.datetime64(start, "ns"), np.datetime64(end, "ns")
+        if end < start:
+            raise ValueError("O fim do intervalo é anterior ao início.")
+        if resolution is None:
+            resolution = choose_resolution(start, end, max_points)
+        elif resolution not in RESOLUTIONS:
+            raise ValueError(f"Resolução desconhecida: {resolution}. Use uma de {list(RESOLUTIONS)}.")
+        width, unit = RESOLUTIONS[resolution]
+
+        periods = np.arange(start.astype(f"datetime64[{unit}]"), end.astype(f"datetime64[{unit}]") + 1)
+        columns = [BUCKET_COLUMN] + [f"{sensor}_{stat}" for sensor in sensors for stat in STATISTICS]
+
+        def read_period(period):
+            data = self._read(self._key(turbine_id, resolution, str(period)))
+            if data is None:
+                return None
+            source = pq.ParquetFile(io.BytesIO(data))
+            missing = [col for col in columns if col not in source.schema_arrow.names]
+            if missing:
+                raise ValueError(f"Sensores sem histórico para {turbine_id}: "
+                                 f"{sorted({col.rsplit('_', 1)[0] for col in missing})}")
+            return source.read(columns=columns)
+
+        tables = [table for table in self._map(read_period, periods) if table is not None]
+        if tables:
+            rollup = rollup_from_table(pa.concat_tables(tables))
+        else:
+            rollup = {col: np.array([], "datetime64[ns]" if col == BUCKET_COLUMN else np.float64) for col in columns}
+        timestamps = rollup[BUCKET_COLUMN]
+        in_range = (timestamps >= floor_timestamps(start, width)) & (timestamps <= end)
+        timestamps = timestamps[in_range]
+        values = {col: rollup[col][in_range].astype(np.float64) for col in columns[1:]}
+        # Mais intervalos que max_points (só ocorre na resolução mais grossa): combina grupos vizinhos
+        group_size = -(-len(timestamps) // max_points) if max_points > 0 else 1
+        if group_size > 1:
+            starts = np.arange(0, len(timestamps), group_size)
+            timestamps = timestamps[starts]
+            for col in values:
+                reduce = np.fmin if col.endswith("_min") else np.fmax if col.endswith("_max") else np.add
+                values[col] = reduce.reduceat(values[col], starts)
+
+        result = {"timestamp": timestamps}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for sensor in sensors:
+                count = values[f"{sensor}_count"]
+                result[f"{sensor}_min"] = values[f"{sensor}_min"]
+                result[f"{sensor}_max"] = values[f"{sensor}_max"]
+                result[f"{sensor}_mean"] = np.where(count > 0, values[f"{sensor}_sum"] / count, np.nan)
+        return resolution, result
+
+
+class LocalRollupStore(RollupStore):
+    """Rollups em um diretório local."""
+
+    def __init__(self, directory, io_workers=16):
+        super().__init__(io_workers)
+        self.directory = directory
+
+    def _read(self, key):
+        try:
+            with open(os.path.join(self.directory, key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key, data):
+        path = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+
+class S3RollupStore(RollupStore):
+    """
+    Rollups em um prefixo do S3.
+    s3_client pode ser o cliente ou uma função que o cria, chamada só no primeiro acesso.
+    """
+
+    def __init__(self, s3_client, bucket, prefix="rollups/", io_workers=16):
+        super().__init__(io_workers)
+        self._s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    @property
+    def s3_client(self):
+        return resolve_client(self._s3_client)
+
+    def _read(self, key):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return response["Body"].read()
+
+    def _write(self, key, data):
+        self.s3_client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
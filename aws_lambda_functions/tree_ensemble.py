@@ -0,0 +1,264 @@
+import json
+import math
+import mmap
+import struct
+
+import numpy as np
+
+# Formato compacto para ensembles de árvores (Random Forest e Gradient Boosting do scikit-learn).
+# Todas as árvores são achatadas em vetores NumPy contíguos (feature, limiar, filhos e valores de
+# cada nó) gravados em um único arquivo junto com o StandardScaler (médias e escalas). O arquivo
+# é aberto com mmap: carregar o modelo não exige joblib, scikit-learn nem desserializar objetos.
+#
+# A avaliação reproduz exatamente o scikit-learn (scaler.transform seguido de predict_proba):
+# as features são escaladas em float64 como (x - média) / escala e convertidas para float32, e as
+# somas entre árvores seguem a ordem das árvores. Os limiares são gravados em float32, arredondados
+# para baixo: para x float32, x <= limiar equivale a x <= (maior float32 <= limiar), então a
+# comparação é a mesma do scikit-learn com metade dos bytes.
+#
+# Layout do arquivo: MAGIC, tamanho do cabeçalho (uint64), cabeçalho JSON e os vetores, cada um
+# alinhado em ARRAY_ALIGNMENT bytes (o cabeçalho guarda dtype, forma e posição de cada vetor).
+
+MAGIC = b"TRENSMB1"
+FILE_SUFFIX = ".trees"
+ARRAY_ALIGNMENT = 64
+# Limite de (linhas x árvores) avaliadas de uma vez: mantém a memória da travessia limitada
+MAX_CHUNK_CELLS = 1 << 18
+# A cada quantos níveis as células (linha, árvore) que já chegaram a uma folha saem da travessia
+COMPACTION_INTERVAL = 4
+
+RANDOM_FOREST = "random_forest"
+GRADIENT_BOOSTING = "gradient_boosting"
+
+
+def _round_down_to_float32(values):
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def _leaf_probabilities(value):
+    """
+    Normaliza cada linha de tree_.value para somar 1, como o predict_proba da árvore: o
+    scikit-learn >= 1.4 já guarda frações, as versões anteriores guardam contagens (ponderadas).
+    """
+    value = np.asarray(value, dtype=np.float64)
+    total = value.sum(axis=1, keepdims=True)
+    return value / np.where(total > 0, total, 1.0)
+
+
+def _flatten_trees(trees, leaf_values):
+    """
+    Concatena as árvores em vetores únicos com índices globais. children guarda os filhos de cada
+    nó intercalados: children[2 * nó] é o da direita (x > limiar) e children[2 * nó + 1] o da
+    esquerda (x <= limiar), então o próximo nó é children[2 * nó + (x <= limiar)]. Nas folhas os
+    dois filhos apontam para a própria folha e a travessia pode seguir por um número fixo de passos.
+    leaf_values(tree) devolve a matriz (nós, colunas) de valores de cada nó.
+    """
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for tree in trees:
+        tree_ = tree.tree_
+        node_ids = np.arange(tree_.node_count, dtype=np.int64)
+        is_leaf = tree_.children_left < 0
+        features.append(np.where(is_leaf, 0, tree_.feature).astype(np.int32))
+        thresholds.append(_round_down_to_float32(np.where(is_leaf, 0.0, tree_.threshold)))
+        left = np.where(is_leaf, node_ids, tree_.children_left) + offset
+        right = np.where(is_leaf, node_ids, tree_.children_right) + offset
+        children.append(np.column_stack([right, left]).astype(np.int32))
+        values.append(np.asarray(leaf_values(tree), dtype=np.float64))
+        roots.append(offset)
+        offset += tree_.node_count
+        max_depth = max(max_depth, tree_.max_depth)
+    if 2 * offset >= np.iinfo(np.int32).max:
+        raise ValueError("Ensemble grande demais para índices int32.")
+    arrays = {
+        "feature": np.concatenate(features),
+        "threshold": np.concatenate(thresholds),
+        "children": np.concatenate(children).ravel(),
+        "value": np.concatenate(values),
+        "root": np.asarray(roots, dtype=np.int32),
+    }
+    return arrays, max_depth
+
+
+def export_tree_ensemble(model, scaler, path):
+    """
+    Exporta um RandomForestClassifier/ExtraTreesClassifier ou GradientBoostingClassifier (log_loss)
+    treinado sobre as features escaladas por scaler (StandardScaler) para o formato compacto.
+    Levanta ValueError para modelos não suportados. Devolve o tamanho do arquivo em bytes.
+    """
+    n_features = int(model.n_features_in_)
+    header = {"format_version": 1, "classes": np.asarray(model.classes_).tolist(), "n_features": n_features}
+
+    if hasattr(model, "estimators_") and hasattr(model, "n_estimators") and not hasattr(model, "learning_rate"):
+        # Floresta: probabilidade = média das probabilidades das folhas
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("Apenas florestas com uma saída são suportadas.")
+        n_classes = len(model.classes_)
+        arrays, max_depth = _flatten_trees(model.estimators_, lambda tree: _leaf_probabilities(tree.tree_.value[:, 0, :n_classes]))
+        header["kind"] = RANDOM_FOREST
+    elif hasattr(model, "learning_rate") and hasattr(model, "_raw_predict_init"):
+        if getattr(model, "loss", "log_loss") != "log_loss":
+            raise ValueError("Apenas Gradient Boosting com loss='log_loss' é suportado.")
+        init = model.init_
+        if not (init == "zero" or (type(init).__name__ == "DummyClassifier" and init.strategy == "prior")):
+            raise ValueError("Apenas Gradient Boosting com estimador inicial padrão (prior) é suportado.")
+        stages, k_per_stage = model.estimators_.shape
+        trees = [model.estimators_[i, k] for i in range(stages) for k in range(k_per_stage)]
+        # learning_rate * valor, o mesmo produto que o scikit-learn soma a cada estágio
+        learning_rate = float(model.learning_rate)
+        arrays, max_depth = _flatten_trees(trees, lambda tree: learning_rate * tree.tree_.value[:, 0, :1])
+        arrays["tree_class"] = np.tile(np.arange(k_per_stage, dtype=np.int32), stages)
+        # Predição inicial constante (log-odds das classes no treino), igual para qualquer entrada
+        arrays["init_raw"] = np.asarray(model._raw_predict_init(np.zeros((1, n_features)))[0], dtype=np.float64)
+        header["kind"] = GRADIENT_BOOSTING
+    else:
+        raise ValueError(f"Modelo {type(model).__name__} não é um ensemble de árvores suportado.")
+
+    if scaler is not None:
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+        scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+        # Médias de treino usadas para imputar valores ausentes (como InferenceState.feature_means)
+        arrays["feature_mean"] = np.asarray(scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features), dtype=np.float64)
+    else:
+        mean, scale = np.zeros(n_features), np.ones(n_features)
+        arrays["feature_mean"] = np.zeros(n_features)
+    arrays["scaler_mean"] = np.asarray(mean, dtype=np.float64)
+    arrays["scaler_scale"] = np.asarray(scale, dtype=np.float64)
+    header["max_depth"] = int(max_depth)
+    return _write_arrays(path, header, arrays)
+
+
+def _write_arrays(path, header, arrays):
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+    header = dict(header, arrays=layout)
+    header_bytes = json.dumps(header).encode()
+    # Os dados começam alinhados após MAGIC + tamanho + cabeçalho
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+    header_bytes = header_bytes.ljust(data_start - len(MAGIC) - 8)
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        return f.tell()
+
+
+def is_tree_ensemble_file(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class TreeEnsemble:
+    """
+    Ensemble carregado do formato compacto. Recebe as features brutas (na ordem de model_columns):
+    o scaler está embutido. Expõe classes_, predict_proba e predict como um classificador do scikit-learn.
+    """
+
+    def __init__(self, header, arrays, buffer=None):
+        self.kind = header["kind"]
+        self.classes_ = np.asarray(header["classes"])
+        self.n_features_in_ = header["n_features"]
+        self.max_depth = header["max_depth"]
+        self._buffer = buffer # Mantém o mmap aberto enquanto os vetores estiverem em uso
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.n_trees = len(self.root)
+        self.is_leaf = self.children[0::2] == np.arange(len(self.feature), dtype=self.children.dtype)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} não está no formato compacto de árvores.")
+        (header_size,) = struct.unpack_from("<Q", buffer, len(MAGIC))
+        data_start = len(MAGIC) + 8 + header_size
+        header = json.loads(bytes(buffer[len(MAGIC) + 8:data_start]))
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"], dtype=np.int64))
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                         offset=data_start + spec["offset"]).reshape(spec["shape"])
+        return cls(header, arrays, buffer)
+
+    def transform(self, X):
+        """Escala como StandardScaler.transform e converte para float32, como as árvores do scikit-learn."""
+        X = np.array(X, dtype=np.float64) # cópia: a entrada não é alterada
+        X -= self.scaler_mean
+        X /= self.scaler_scale
+        return X.astype(np.float32)
+
+    def apply(self, X_scaled):
+        """Índice global da folha alcançada em cada árvore: matriz (linhas, árvores)."""
+        num_rows, num_features = X_scaled.shape
+        values = X_scaled.ravel()
+        # Uma célula por (linha, árvore): nó atual e posição da linha em values
+        nodes = np.broadcast_to(self.root, (num_rows, self.n_trees)).ravel()
+        row_offsets = np.repeat(np.arange(num_rows, dtype=np.int32) * num_features, self.n_trees)
+        leaves = None
+        cells = None # None: todas as células, na ordem original
+        # Todas as células avançam um nível por passo (as que já estão em uma folha permanecem nela)
+        for depth in range(1, self.max_depth + 1):
+            go_left = values[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_left]
+            if depth % COMPACTION_INTERVAL == 0 and depth < self.max_depth:
+                # Árvores profundas e desbalanceadas: as células que já terminaram deixam a travessia
+                done = self.is_leaf[nodes]
+                if leaves is None:
+                    leaves = np.empty(num_rows * self.n_trees, dtype=nodes.dtype)
+                finished = np.flatnonzero(done) if cells is None else cells[done]
+                leaves[finished] = nodes[done]
+                remaining = ~done
+                cells = np.flatnonzero(remaining) if cells is None else cells[remaining]
+                nodes = nodes[remaining]
+                row_offsets = row_offsets[remaining]
+        if cells is None:
+            return nodes.reshape(num_rows, self.n_trees)
+        leaves[cells] = nodes
+        return leaves.reshape(num_rows, self.n_trees)
+
+    def _predict_proba_chunk(self, X_scaled):
+        leaves = self.apply(X_scaled)
+        if self.kind == RANDOM_FOREST:
+            # Soma sequencial (cumsum) na ordem das árvores, como o acúmulo do scikit-learn
+            leaf_proba = self.value[leaves] # (linhas, árvores, classes)
+            return np.cumsum(leaf_proba, axis=1)[:, -1, :] / self.n_trees
+        raw = np.empty((len(X_scaled), len(self.init_raw)))
+        leaf_values = self.value[leaves, 0]
+        for k in range(len(self.init_raw)):
+            class_values = leaf_values[:, self.tree_class == k]
+            stacked = np.concatenate([np.full((len(X_scaled), 1), self.init_raw[k]), class_values], axis=1)
+            raw[:, k] = np.cumsum(stacked, axis=1)[:, -1]
+        if raw.shape[1] == 1:
+            # expit com o exp da libm (o mesmo do scipy.special.expit usado pelo scikit-learn)
+            positive = 1.0 / (1.0 + np.fromiter(map(math.exp, (-raw[:, 0]).tolist()), dtype=np.float64, count=len(raw)))
+            return np.column_stack([1 - positive, positive])
+        raw -= raw.max(axis=1, keepdims=True)
+        np.exp(raw, out=raw)
+        raw /= raw.sum(axis=1, keepdims=True)
+        return raw
+
+    def predict_proba(self, X):
+        X_scaled = self.transform(X)
+        chunk_rows = max(1, MAX_CHUNK_CELLS // self.n_trees)
+        if len(X_scaled) <= chunk_rows:
+            return self._predict_proba_chunk(X_scaled)
+        return np.concatenate([
+            self._predict_proba_chunk(X_scaled[start:start + chunk_rows])
+            for start in range(0, len(X_scaled), chunk_rows)
+        ])
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
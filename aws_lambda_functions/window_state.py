@@ -0,0 +1,176 @@
+import io
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from aws_clients import resolve_client
+from feature_engine import compute_window_features
+
+# Janelamento incremental por turbina entre objetos entregues pelo Firehose.
+# Cada turbina guarda o "rabo" ainda não janelado do seu fluxo de leituras (as linhas a partir
+# do início da próxima janela). Um novo objeto estende esse rabo e só as janelas que passam a
+# estar completas são emitidas, de modo que:
+# - nenhuma janela que atravessa a fronteira entre dois objetos é perdida;
+# - o processamento é O(dados novos), sem reprocessar objetos anteriores;
+# - o resultado é o mesmo que janelar o fluxo inteiro de uma só vez.
+# Leituras com timestamp menor ou igual ao último já visto (reentregas do Firehose ou dados
+# atrasados) são descartadas, o que torna reprocessar o mesmo objeto idempotente.
+#
+# O estado é pequeno (menos de uma janela de linhas por turbina) e é gravado como Parquet, com
+# os metadados do janelamento no schema, em um diretório local ou em um prefixo do S3.
+# Invocações concorrentes para a mesma turbina não são coordenadas: o gatilho deve processar os
+# objetos de uma turbina em sequência (ex: concorrência reservada da Lambda).
+
+STATE_METADATA_KEY = b"window_state"
+
+
+class WindowState:
+    """Estado do janelamento de uma turbina."""
+
+    def __init__(self, tail=None, last_timestamp=None, windows_emitted=0, window_size_points=None, step_points=None,
+                 skip_points=0):
+        self.tail = tail if tail is not None else pd.DataFrame()
+        self.last_timestamp = last_timestamp
+        self.windows_emitted = windows_emitted
+        self.window_size_points = window_size_points
+        self.step_points = step_points
+        # Leituras futuras a pular antes do próximo início de janela (só ocorre com passo > janela)
+        self.skip_points = skip_points
+
+    def metadata(self):
+        return {
+            "last_timestamp": self.last_timestamp.isoformat() if self.last_timestamp is not None else None,
+            "windows_emitted": self.windows_emitted,
+            "window_size_points": self.window_size_points,
+            "step_points": self.step_points,
+            "skip_points": self.skip_points,
+        }
+
+    def to_bytes(self):
+        table = pa.Table.from_pandas(self.tail, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[STATE_METADATA_KEY] = json.dumps(self.metadata()).encode("utf-8")
+        buffer = io.BytesIO()
+        pq.write_table(table.replace_schema_metadata(metadata), buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        table = pq.read_table(io.BytesIO(data))
+        metadata = json.loads(table.schema.metadata[STATE_METADATA_KEY])
+        last_timestamp = metadata.get("last_timestamp")
+        return cls(
+            tail=table.to_pandas(),
+            last_timestamp=pd.Timestamp(last_timestamp) if last_timestamp else None,
+            windows_emitted=metadata.get("windows_emitted", 0),
+            window_size_points=metadata.get("window_size_points"),
+            step_points=metadata.get("step_points"),
+            skip_points=metadata.get("skip_points", 0),
+        )
+
+
+class LocalWindowStateStore:
+    """Estado de janelamento em um diretório local (um arquivo Parquet por turbina)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, turbine_id):
+        return os.path.join(self.directory, f"{turbine_id}.parquet")
+
+    def load(self, turbine_id):
+        try:
+            with open(self._path(turbine_id), "rb") as f:
+                return WindowState.from_bytes(f.read())
+        except FileNotFoundError:
+            return None
+
+    def save(self, turbine_id, state):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(turbine_id)
+        with open(path + ".tmp", "wb") as f:
+            f.write(state.to_bytes())
+        os.replace(path + ".tmp", path)
+
+
+class S3WindowStateStore:
+    """
+    Estado de janelamento em um prefixo do S3 (um objeto Parquet por turbina).
+    s3_client pode ser o cliente ou uma função que o cria, chamada só no primeiro acesso.
+    """
+
+    def __init__(self, s3_client, bucket, prefix="window_state/"):
+        self._s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    @property
+    def s3_client(self):
+        return resolve_client(self._s3_client)
+
+    def _key(self, turbine_id):
+        return f"{self.prefix}{turbine_id}.parquet"
+
+    def load(self, turbine_id):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(turbine_id))
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return WindowState.from_bytes(response["Body"].read())
+
+    def save(self, turbine_id, state):
+        self.s3_client.put_object(Bucket=self.bucket, Key=self._key(turbine_id), Body=state.to_bytes())
+
+
+def advance_windows(state, df_new, window_size_points, step_points):
+    """
+    Estende o estado de uma turbina com novas leituras e calcula apenas as janelas completadas.
+    df_new deve ter a coluna timestamp já convertida para datetime.
+    Devolve (features das novas janelas, novo estado, número de leituras descartadas).
+    """
+    if state is None:
+        state = WindowState(window_size_points=window_size_points, step_points=step_points)
+    elif (state.window_size_points, state.step_points) != (window_size_points, step_points):
+        # Configuração de janelamento mudou: o alinhamento anterior não vale mais, mas as
+        # leituras pendentes são mantidas como início do novo fluxo
+        print(f"Configuração de janelamento mudou de {(state.window_size_points, state.step_points)} "
+              f"para {(window_size_points, step_points)}; realinhando a partir das leituras pendentes.")
+        state = WindowState(state.tail, state.last_timestamp, state.windows_emitted, window_size_points, step_points)
+
+    df_new = df_new.sort_values(by="timestamp")
+    num_dropped = 0
+    if state.last_timestamp is not None:
+        is_new = df_new["timestamp"] > state.last_timestamp
+        num_dropped = int((~is_new).sum())
+        df_new = df_new[is_new]
+    last_timestamp = df_new["timestamp"].iloc[-1] if not df_new.empty else state.last_timestamp
+    remaining_skip = state.skip_points
+    if remaining_skip:
+        skipped = min(remaining_skip, len(df_new))
+        df_new = df_new.iloc[skipped:]
+        remaining_skip -= skipped
+
+    if state.tail.empty:
+        combined = df_new.reset_index(drop=True)
+    elif df_new.empty:
+        combined = state.tail.reset_index(drop=True)
+    else:
+        combined = pd.concat([state.tail, df_new], ignore_index=True)
+
+    features = compute_window_features(combined, window_size_points, step_points)
+    num_windows = len(features)
+
+    # O próximo início de janela (e tudo depois dele) fica para a próxima entrega
+    next_start = num_windows * step_points
+    new_state = WindowState(
+        tail=combined.iloc[next_start:].reset_index(drop=True),
+        last_timestamp=last_timestamp,
+        windows_emitted=state.windows_emitted + num_windows,
+        window_size_points=window_size_points,
+        step_points=step_points,
+        skip_points=remaining_skip + max(0, next_start - len(combined)),
+    )
+    return features, new_state, num_dropped
@@ -0,0 +1,168 @@
+"""
+Início a frio das Lambdas: tempo de importação do módulo, primeira invocação e invocação
+a quente, cada execução em um processo Python novo (como um ambiente de execução novo
+da Lambda). Também gera o relatório de importações (python -X importtime) agrupado por
+pacote, para mostrar onde o tempo de carregamento é gasto.
+
+Para a lambda_predict_failure, um modelo pequeno é treinado e os artefatos são servidos
+de um diretório local (MODEL_ARTIFACTS_DIR), então não é necessário acesso ao S3.
+As demais Lambdas são medidas apenas na importação.
+
+Uso:
+    python benchmarks/bench_cold_start.py --runs 5
+    python benchmarks/bench_cold_start.py --module lambda_process_data --runs 3
+    python benchmarks/bench_cold_start.py --lambda-dir /outro/checkout/aws_lambda_functions --import-only
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+LAMBDA_DIR = os.path.join(ROOT_DIR, "aws_lambda_functions")
+
+MODEL_KEY = "model.joblib"
+SCALER_KEY = "scaler.joblib"
+COLUMNS_KEY = "model_columns.json"
+
+# Executado no processo filho: importa o módulo e, para a predição, faz duas invocações
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import {module} as handler_module
+imported = time.perf_counter()
+result = {{"import_s": imported - start}}
+if {invoke}:
+    event = {{"body": json.dumps(json.load(open(sys.argv[1])))}}
+    response = handler_module.lambda_handler(event, None)
+    first = time.perf_counter()
+    assert response["statusCode"] == 200, response
+    handler_module.lambda_handler(event, None)
+    result.update(first_invocation_s=first - imported, warm_invocation_s=time.perf_counter() - first)
+result["modules"] = sorted(sys.modules)
+print("RESULT " + json.dumps(result))
+"""
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def write_artifacts(directory):
+    """Treina scaler e modelo (regressão logística) sobre features sintéticas e grava os artefatos."""
+    import joblib
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import StandardScaler
+
+    sys.path.insert(0, LAMBDA_DIR)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_feature_engine import make_turbine_frame
+    from feature_engine import compute_window_features
+
+    features = compute_window_features(make_turbine_frame(2 * 24 * 60, 0), 10, 5)
+    X = features.drop(columns=["window_end_timestamp", "label"]).select_dtypes(include=np.number)
+    X = X.fillna(X.mean())
+    scaler = StandardScaler().fit(X)
+    model = LogisticRegression(solver="liblinear", class_weight="balanced").fit(scaler.transform(X), features["label"])
+    joblib.dump(model, os.path.join(directory, MODEL_KEY))
+    joblib.dump(scaler, os.path.join(directory, SCALER_KEY))
+    with open(os.path.join(directory, COLUMNS_KEY), "w") as f:
+        json.dump(list(X.columns), f)
+    payload_path = os.path.join(directory, "payload.json")
+    with open(payload_path, "w") as f:
+        json.dump(X.iloc[0].to_dict(), f)
+    return payload_path
+
+
+def run_child(module, lambda_dir, invoke, payload_path, env, importtime=False):
+    code = CHILD_CODE.format(module=module, invoke=invoke)
+    flags = ["-X", "importtime"] if importtime else []
+    completed = subprocess.run(
+        [sys.executable, *flags, "-c", code, payload_path or ""],
+        cwd=lambda_dir, env=env, capture_output=True, text=True,
+    )
+    result_lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+    if completed.returncode != 0 or not result_lines:
+        raise RuntimeError(f"Falha ao executar {module}:\n{completed.stdout[-2000:]}\n{completed.stderr[-2000:]}")
+    result = json.loads(result_lines[-1][len("RESULT "):])
+    result["importtime"] = parse_importtime(completed.stderr)
+    return result
+
+
+def parse_importtime(stderr):
+    """Soma o tempo próprio (self, em ms) de cada módulo importado, agrupado pelo pacote de topo."""
+    by_package = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, _, _, name = match.groups()
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0.0) + int(self_us) / 1000.0
+    return by_package
+
+
+def summarize(values):
+    values = np.asarray(values) * 1000.0
+    return {"median_ms": float(np.median(values)), "min_ms": float(values.min()), "max_ms": float(values.max())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="lambda_predict_failure",
+                        choices=["lambda_predict_failure", "lambda_process_data", "lambda_ingest_data"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--lambda-dir", default=LAMBDA_DIR, help="Diretório com o código das Lambdas a medir.")
+    parser.add_argument("--import-only", action="store_true", help="Mede apenas a importação do módulo.")
+    parser.add_argument("--top", type=int, default=12, help="Pacotes exibidos no relatório de importações.")
+    parser.add_argument("--output", default=None, help="Grava os resultados em JSON.")
+    args = parser.parse_args()
+
+    invoke = args.module == "lambda_predict_failure" and not args.import_only
+    with tempfile.TemporaryDirectory(prefix="bench_cold_start_") as tmp:
+        env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+                   METRICS_MODE="off", ARTIFACT_CACHE_DIR=os.path.join(tmp, "cache"),
+                   MODEL_ARTIFACTS_DIR=tmp, MODEL_S3_KEY=MODEL_KEY, SCALER_S3_KEY=SCALER_KEY,
+                   COLUMNS_S3_KEY=COLUMNS_KEY)
+        payload_path = write_artifacts(tmp) if invoke else None
+        # Uma execução descartada para aquecer o cache de disco e os .pyc
+        run_child(args.module, args.lambda_dir, invoke, payload_path, env)
+        runs = [run_child(args.module, args.lambda_dir, invoke, payload_path, env) for _ in range(args.runs)]
+        # O -X importtime deixa a importação mais lenta: o relatório vem de uma execução separada
+        profile = run_child(args.module, args.lambda_dir, invoke, payload_path, env, importtime=True)
+
+    results = {
+        "module": args.module,
+        "lambda_dir": os.path.abspath(args.lambda_dir),
+        "runs": args.runs,
+        "import": summarize([r["import_s"] for r in runs]),
+    }
+    if invoke:
+        results["first_invocation"] = summarize([r["first_invocation_s"] for r in runs])
+        results["cold_start_total"] = summarize([r["import_s"] + r["first_invocation_s"] for r in runs])
+        results["warm_invocation"] = summarize([r["warm_invocation_s"] for r in runs])
+    results["import_ms_by_package"] = dict(sorted(profile["importtime"].items(), key=lambda item: -item[1]))
+    heavy = ("pandas", "awswrangler", "boto3", "botocore", "pyarrow", "sklearn", "scipy", "joblib")
+    results["heavy_packages_loaded"] = [p for p in heavy if any(m == p or m.startswith(p + ".") for m in profile["modules"])]
+
+    print(f"{args.module} ({args.runs} execuções, processo novo a cada uma)")
+    for name in ("import", "first_invocation", "cold_start_total", "warm_invocation"):
+        if name in results:
+            r = results[name]
+            print(f"  {name:<18} mediana {r['median_ms']:9.1f} ms  (min {r['min_ms']:.1f}, max {r['max_ms']:.1f})")
+    print(f"  pacotes pesados carregados: {', '.join(results['heavy_packages_loaded']) or 'nenhum'}")
+    # Importações feitas em threads paralelas (ex: modelo e scaler carregados juntos) podem se sobrepor
+    print(f"\nimportações por pacote (tempo próprio em ms, com -X importtime; inclui a primeira invocação):")
+    for package, ms in list(results["import_ms_by_package"].items())[:args.top]:
+        print(f"  {package:<24} {ms:9.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
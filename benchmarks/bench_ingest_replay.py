@@ -0,0 +1,255 @@
+"""
+Gerador de carga da ingestão: reproduz leituras simuladas de N turbinas em tempo real
+(ou com o relógio acelerado) e as envia à lambda_ingest_data, que as repassa a um
+Kinesis Data Firehose local (local_aws.FakeFirehoseClient, com latência simulada por chamada).
+
+Cada turbina gera uma leitura por minuto de tempo simulado (simulate_turbine_data.py), com
+timestamps crescentes a partir do horário de início. Com --speedup 60, um minuto simulado passa
+em um segundo (1 leitura/s por turbina); com --rate, o relógio é acelerado para atingir a vazão
+total pedida. As turbinas são divididas entre --workers threads: a cada --batch-interval-s, cada
+thread envia em uma invocação as leituras que já venceram de todas as suas turbinas, na ordem
+dos timestamps. Uma turbina pertence a uma única thread, então seus timestamps chegam ao
+Firehose em ordem crescente de invocação.
+
+Ao final são informadas a vazão atingida contra a pedida e a latência de ponta a ponta de cada
+leitura: do instante em que ela deveria ser emitida até o Firehose aceitar o seu registro
+(retorno da invocação, que espera o envio dos batches).
+
+Uso:
+    python benchmarks/bench_ingest_replay.py --turbines 20 --speedup 60 --duration-s 30
+    python benchmarks/bench_ingest_replay.py --turbines 100 --rate 2000 --workers 8 --aggregate
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT_DIR, "aws_lambda_functions"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "data_simulation"))
+
+STREAM_NAME = "replay-stream"
+SECONDS_PER_READING = 3600 / 60  # Uma leitura por minuto simulado (DATA_POINTS_PER_HOUR = 60)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ["FIREHOSE_STREAM_NAME"] = STREAM_NAME
+
+import lambda_ingest_data  # noqa: E402
+import simulate_turbine_data  # noqa: E402
+from local_aws import FakeFirehoseClient  # noqa: E402
+
+
+def iter_turbine_readings(turbine_id, total_points, start_time, seed, chunk_points):
+    """Leituras (dicts) de uma turbina a partir de start_time, geradas bloco a bloco sob demanda."""
+    end_time = pd.Timestamp(start_time) + pd.Timedelta(minutes=total_points - 1)
+    chunks = simulate_turbine_data.generate_turbine_chunks(turbine_id, total_points, end_time, seed, chunk_points)
+    turbine_name = f"turbine_{turbine_id}"
+    for chunk in chunks:
+        chunk["turbine_id"] = turbine_name
+        yield from chunk.to_dict("records")
+
+
+class ReplayWorker(threading.Thread):
+    """
+    Emite as leituras de um grupo de turbinas no ritmo do relógio simulado.
+    A leitura k da turbina de índice j vence em (k + j / turbinas) * reading_interval_s após o
+    início, o que espalha as turbinas dentro de cada minuto simulado.
+    """
+
+    def __init__(self, turbines, args, start_wall, reading_interval_s, total_points):
+        super().__init__(daemon=True)
+        self.turbines = turbines  # [(índice, turbine_id)]
+        self.args = args
+        self.start_wall = start_wall
+        self.reading_interval_s = reading_interval_s
+        self.total_points = total_points
+        self.lags_s = []
+        self.latencies_s = []
+        self.records_sent = 0
+        self.firehose_records = 0
+        self.errors = 0
+        self.timestamp_inversions = 0
+        self.last_done = start_wall
+
+    def due_count(self, index, elapsed_s):
+        """Quantas leituras da turbina de índice index já venceram após elapsed_s segundos."""
+        phase = index / self.args.turbines
+        count = math.floor(elapsed_s / self.reading_interval_s - phase) + 1
+        return max(0, min(self.total_points, count))
+
+    def run(self):
+        args = self.args
+        readings = {
+            index: iter_turbine_readings(turbine_id, self.total_points, args.start_time, args.seed, args.chunk_points)
+            for index, turbine_id in self.turbines
+        }
+        sent = dict.fromkeys(readings, 0)
+        last_timestamp = dict.fromkeys(readings, "")
+        for tick in itertools.count(1):
+            elapsed_s = time.perf_counter() - self.start_wall
+            batch = []
+            due_offsets = []
+            for index, _ in self.turbines:
+                due = self.due_count(index, elapsed_s)
+                for k in range(sent[index], due):
+                    reading = next(readings[index])
+                    if reading["timestamp"] <= last_timestamp[index]:
+                        self.timestamp_inversions += 1
+                    last_timestamp[index] = reading["timestamp"]
+                    batch.append(reading)
+                    due_offsets.append((k + index / args.turbines) * self.reading_interval_s)
+                sent[index] = due
+
+            if batch:
+                invoke_start = time.perf_counter()
+                response = lambda_ingest_data.lambda_handler({"records": batch}, None)
+                done = time.perf_counter()
+                self.latencies_s.append(done - invoke_start)
+                self.lags_s.append(done - self.start_wall - np.asarray(due_offsets))
+                self.last_done = done
+                if response.get("statusCode") == 200:
+                    stats = json.loads(response["body"])["stats"]
+                    self.records_sent += stats["records_read"]
+                    self.firehose_records += stats["records_sent"]
+                else:
+                    self.errors += 1
+
+            if all(count >= self.total_points for count in sent.values()):
+                return
+            # Próximo tick no horário previsto; atrasado, segue sem dormir até alcançar o relógio
+            delay = self.start_wall + tick * args.batch_interval_s - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def percentiles_ms(values_s):
+    values_ms = np.asarray(values_s) * 1000.0
+    if not len(values_ms):
+        return None
+    return {
+        "p50": float(np.percentile(values_ms, 50)),
+        "p95": float(np.percentile(values_ms, 95)),
+        "p99": float(np.percentile(values_ms, 99)),
+        "max": float(values_ms.max()),
+    }
+
+
+def run_replay(args):
+    if args.rate:
+        speedup = args.rate * SECONDS_PER_READING / args.turbines
+    else:
+        speedup = args.speedup
+    reading_interval_s = SECONDS_PER_READING / speedup
+    target_rate = args.turbines / reading_interval_s
+    total_points = max(1, int(args.duration_s / reading_interval_s))
+
+    firehose_client = FakeFirehoseClient(latency_s=args.firehose_latency_ms / 1000.0)
+    lambda_ingest_data.firehose_client = firehose_client
+    lambda_ingest_data.AGGREGATE_RECORDS = args.aggregate
+
+    turbines = list(enumerate(range(1, args.turbines + 1)))
+    workers_count = max(1, min(args.workers, args.turbines))
+    print(f"Replay: {args.turbines} turbinas x {total_points} leituras, relógio {speedup:,.1f}x, "
+          f"vazão alvo {target_rate:,.1f} leituras/s, {workers_count} threads")
+
+    start_wall = time.perf_counter()
+    workers = [
+        ReplayWorker(turbines[i::workers_count], args, start_wall, reading_interval_s, total_points)
+        for i in range(workers_count)
+    ]
+    # A saída das Lambdas (uma linha por invocação) é descartada durante a carga
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    elapsed_s = max(worker.last_done for worker in workers) - start_wall
+    records_sent = sum(worker.records_sent for worker in workers)
+    lags_s = np.concatenate([lag for worker in workers for lag in worker.lags_s] or [np.zeros(0)])
+    return {
+        "turbines": args.turbines,
+        "workers": workers_count,
+        "speedup": speedup,
+        "aggregate": args.aggregate,
+        "batch_interval_s": args.batch_interval_s,
+        "firehose_latency_ms": args.firehose_latency_ms,
+        "target_rate_per_s": target_rate,
+        "achieved_rate_per_s": records_sent / elapsed_s if elapsed_s > 0 else None,
+        "elapsed_s": elapsed_s,
+        "records_sent": records_sent,
+        "records_expected": args.turbines * total_points,
+        "firehose_records": sum(worker.firehose_records for worker in workers),
+        "firehose_calls": firehose_client.calls,
+        "invocations": sum(len(worker.latencies_s) for worker in workers),
+        "invocation_errors": sum(worker.errors for worker in workers),
+        "timestamp_inversions": sum(worker.timestamp_inversions for worker in workers),
+        "invocation_latency_ms": percentiles_ms([s for worker in workers for s in worker.latencies_s]),
+        "end_to_end_lag_ms": percentiles_ms(lags_s),
+    }
+
+
+def print_report(results):
+    achieved = results["achieved_rate_per_s"] or 0.0
+    print(f"vazão: {achieved:,.1f} leituras/s atingidas / {results['target_rate_per_s']:,.1f} pedidas "
+          f"({achieved / results['target_rate_per_s']:.1%})")
+    print(f"leituras: {results['records_sent']:,} de {results['records_expected']:,} em {results['elapsed_s']:.1f}s, "
+          f"{results['firehose_records']:,} registros do Firehose em {results['firehose_calls']:,} chamadas, "
+          f"{results['invocations']:,} invocações ({results['invocation_errors']} com erro)")
+    print(f"timestamps fora de ordem por turbina: {results['timestamp_inversions']}")
+    for name in ("invocation_latency_ms", "end_to_end_lag_ms"):
+        latency = results[name]
+        if latency:
+            print(f"{name}: p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+                  f"p99 {latency['p99']:.1f}  max {latency['max']:.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Gerador de carga com reprodução em tempo real para a lambda_ingest_data.")
+    parser.add_argument("--turbines", type=int, default=10)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--speedup", type=float, default=60.0,
+                       help="Aceleração do relógio simulado (1 = tempo real, 60 = um minuto por segundo).")
+    group.add_argument("--rate", type=float, default=None,
+                       help="Vazão total alvo em leituras/s (define a aceleração do relógio).")
+    parser.add_argument("--duration-s", type=float, default=30.0, help="Duração da carga em segundos de relógio.")
+    parser.add_argument("--workers", type=int, default=8, help="Threads que emitem as leituras.")
+    parser.add_argument("--batch-interval-s", type=float, default=1.0,
+                        help="Intervalo entre invocações de cada thread.")
+    parser.add_argument("--firehose-latency-ms", type=float, default=20.0,
+                        help="Latência simulada de cada chamada PutRecordBatch.")
+    parser.add_argument("--aggregate", action="store_true",
+                        help="Agrega as leituras em registros colunares (AGGREGATE_RECORDS).")
+    parser.add_argument("--start-time", default=None,
+                        help="Timestamp da primeira leitura (padrão: agora, em UTC, no minuto).")
+    parser.add_argument("--seed", type=int, default=simulate_turbine_data.DEFAULT_SEED)
+    parser.add_argument("--chunk-points", type=int, default=1440,
+                        help="Leituras geradas por vez para cada turbina.")
+    parser.add_argument("--output", default=None, help="Arquivo JSON com os resultados.")
+    args = parser.parse_args()
+    if args.start_time is None:
+        args.start_time = datetime.now(timezone.utc).replace(tzinfo=None, second=0, microsecond=0).isoformat()
+    return args
+
+
+def main():
+    args = parse_args()
+    results = run_replay(args)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"resultados gravados em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+"""
+Benchmark de ponta a ponta do pipeline, executado localmente:
+simulação → ingestão (Firehose) → processamento (features e rollups) → consulta do histórico → treino → predição.
+
+O S3 é substituído por um diretório local (local_aws.LocalS3Client/LocalWrangler) e o
+Kinesis Data Firehose por local_aws.FakeFirehoseClient, então não são necessárias
+credenciais AWS. Para cada etapa são medidos tempo total, vazão, percentis de latência
+por invocação e pico de memória (RSS). O resultado é gravado em JSON para comparar
+execuções entre commits (--compare).
+
+Uso:
+    python benchmarks/bench_pipeline.py --turbines 5 --days 7
+    python benchmarks/bench_pipeline.py --turbines 5 --days 7 --compare benchmarks/results/pipeline-abc1234.json
+    python benchmarks/bench_pipeline.py --turbines 5 --days 7 --aggregate
+    python benchmarks/bench_pipeline.py --turbines 3 --days 5 --buffer-mb 0.05 --compact
+    python benchmarks/bench_pipeline.py --turbines 3 --days 30 --buffer-mb 1 --backfill
+    python benchmarks/bench_pipeline.py --turbines 10 --days 7 --fleet-state
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT_DIR, "aws_lambda_functions"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "data_simulation"))
+
+RAW_BUCKET = "bench-raw"
+PROCESSED_BUCKET = "bench-processed"
+ARTIFACTS_BUCKET = "bench-artifacts"
+STREAM_NAME = "bench-stream"
+SIMULATION_END_TIME = "2025-05-01 00:00:00"
+DEFAULT_RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+# Configuração lida pelas Lambdas na importação: buckets e stream do benchmark
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ["RAW_DATA_BUCKET_NAME"] = RAW_BUCKET
+os.environ["PROCESSED_DATA_BUCKET_NAME"] = PROCESSED_BUCKET
+os.environ["MODEL_ARTIFACTS_BUCKET_NAME"] = ARTIFACTS_BUCKET
+os.environ["FIREHOSE_STREAM_NAME"] = STREAM_NAME
+
+import joblib  # noqa: E402
+
+import lambda_fleet_state  # noqa: E402
+import lambda_history_query  # noqa: E402
+import lambda_ingest_data  # noqa: E402
+import lambda_predict_failure  # noqa: E402
+import lambda_process_data  # noqa: E402
+import simulate_turbine_data  # noqa: E402
+from artifact_cache import ArtifactCache, S3ArtifactStore  # noqa: E402
+from feature_backfill import FeatureBackfill  # noqa: E402
+from feature_compaction import FeatureCompactor  # noqa: E402
+from fleet_state import SQLiteFleetStateStore  # noqa: E402
+from local_aws import FakeFirehoseClient, LocalS3Client, LocalWrangler  # noqa: E402
+from rollup_store import S3RollupStore  # noqa: E402
+from window_state import S3WindowStateStore  # noqa: E402
+
+
+def current_rss_bytes():
+    """RSS atual do processo (Linux: /proc/self/status); 0 se indisponível."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler:
+    """Amostra o RSS em uma thread durante uma etapa e guarda o pico."""
+
+    def __init__(self, interval_s=0.005):
+        self.interval_s = interval_s
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+            self._stop.wait(self.interval_s)
+
+    def __enter__(self):
+        self.peak_bytes = current_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+        return False
+
+
+class Stage:
+    """Mede uma etapa: tempo total, latência por invocação, itens processados e pico de RSS."""
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.latencies_s = []
+        self.wall_s = 0.0
+        self.peak_rss_bytes = 0
+        self.extra = {}
+
+    @contextlib.contextmanager
+    def run(self):
+        sampler = RssSampler()
+        start = time.perf_counter()
+        with sampler:
+            yield self
+        self.wall_s = time.perf_counter() - start
+        self.peak_rss_bytes = sampler.peak_bytes
+
+    def invoke(self, func, *args, **kwargs):
+        """Executa uma invocação (com a saída das Lambdas descartada) e registra sua latência."""
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = func(*args, **kwargs)
+        self.latencies_s.append(time.perf_counter() - start)
+        return result
+
+    def to_dict(self):
+        latencies_ms = np.asarray(self.latencies_s) * 1000.0
+        latency = None
+        if len(latencies_ms):
+            latency = {
+                "p50": float(np.percentile(latencies_ms, 50)),
+                "p95": float(np.percentile(latencies_ms, 95)),
+                "p99": float(np.percentile(latencies_ms, 99)),
+                "max": float(latencies_ms.max()),
+            }
+        return {
+            "wall_s": self.wall_s,
+            "items": self.items,
+            "unit": self.unit,
+            "throughput_per_s": self.items / self.wall_s if self.wall_s > 0 else None,
+            "invocations": len(self.latencies_s),
+            "latency_ms": latency,
+            "peak_rss_mb": self.peak_rss_bytes / (1024 * 1024),
+            **self.extra,
+        }
+
+
+def s3_event(bucket, key):
+    return {"Records": [{"s3": {"bucket": {"name": bucket}, "object": {"key": key}}}]}
+
+
+def check_response(stage, response):
+    if response.get("statusCode") != 200:
+        raise RuntimeError(f"Etapa {stage.name} falhou: {response}")
+    return json.loads(response["body"])
+
+
+def run_simulate(args, sim_dir):
+    stage = Stage("simulate", "records")
+    with stage.run():
+        stage.items = stage.invoke(
+            simulate_turbine_data.run_simulation,
+            num_turbines=args.turbines, simulation_hours=args.days * 24, output_dir=sim_dir, seed=args.seed,
+            workers=args.workers, output_format="ndjson", end_time=SIMULATION_END_TIME,
+        )
+    return stage
+
+
+def run_ingest(args, sim_dir, firehose_client):
+    lambda_ingest_data.SIMULATION_DATA_DIR = sim_dir
+    lambda_ingest_data.firehose_client = firehose_client
+    lambda_ingest_data.AGGREGATE_RECORDS = args.aggregate
+    stage = Stage("ingest", "records")
+    with stage.run():
+        for file_name in sorted(os.listdir(sim_dir)):
+            body = check_response(stage, stage.invoke(lambda_ingest_data.lambda_handler, {"simulation_file": file_name}, None))
+            stage.items += body["stats"]["records_read"]
+            stage.extra["firehose_records"] = stage.extra.get("firehose_records", 0) + body["stats"]["records_sent"]
+    return stage
+
+
+def run_delivery(args, firehose_client, s3_client):
+    stage = Stage("firehose_delivery", "objects")
+    with stage.run():
+        keys = stage.invoke(firehose_client.deliver_to_s3, STREAM_NAME, s3_client, RAW_BUCKET,
+                            buffer_bytes=int(args.buffer_mb * 1024 * 1024))
+    stage.items = len(keys)
+    stage.extra["raw_bytes"] = sum(s3_client.head_object(Bucket=RAW_BUCKET, Key=key)["ContentLength"] for key in keys)
+    return stage, keys
+
+
+def run_process(args, s3_client, raw_keys, num_records):
+    lambda_process_data.wr = LocalWrangler(s3_client)
+    lambda_process_data.window_state_store = S3WindowStateStore(s3_client, PROCESSED_BUCKET)
+    lambda_process_data.rollup_store = S3RollupStore(s3_client, PROCESSED_BUCKET)
+    lambda_process_data.PROCESSING_WORKERS = args.workers
+    stage = Stage("process", "records")
+    with stage.run():
+        for key in raw_keys:
+            check_response(stage, stage.invoke(lambda_process_data.lambda_handler, s3_event(RAW_BUCKET, key), None))
+    stage.items = num_records
+    features = LocalWrangler(s3_client).s3.read_parquet(lambda_process_data.FEATURES_BASE_PATH, dataset=True)
+    stage.extra["windows"] = len(features)
+    stage.extra["windows_per_s"] = len(features) / stage.wall_s if stage.wall_s > 0 else None
+    return stage, features
+
+
+def run_compact(args, s3_client):
+    """Compacta as features e compara o número de arquivos e o tempo de leitura antes e depois."""
+    wrangler = LocalWrangler(s3_client)
+    features_prefix = "features/"
+
+    def snapshot():
+        files = s3_client.list_objects_v2(Bucket=PROCESSED_BUCKET, Prefix=features_prefix)["KeyCount"]
+        start = time.perf_counter()
+        features = wrangler.s3.read_parquet(lambda_process_data.FEATURES_BASE_PATH, dataset=True)
+        return files, time.perf_counter() - start, features
+
+    files_before, read_before_s, before = snapshot()
+    stage = Stage("compact", "files")
+    compactor = FeatureCompactor(s3_client, PROCESSED_BUCKET, features_prefix)
+    with stage.run():
+        checkpoint = stage.invoke(compactor.run)
+    files_after, read_after_s, after = snapshot()
+    stage.items = checkpoint.stats.get("files_read", 0)
+
+    # Mesmas janelas antes e depois (a compactação só reorganiza os arquivos)
+    key = ["turbine_id", "window_end_timestamp"]
+    same = len(before) == len(after) and before.sort_values(key).reset_index(drop=True)[after.columns].astype(str).equals(
+        after.sort_values(key).reset_index(drop=True).astype(str))
+    stage.extra.update(files_before=files_before, files_after=files_after, read_before_s=read_before_s,
+                       read_after_s=read_after_s, same_windows=bool(same))
+    print(f"compactação: {files_before} -> {files_after} arquivos, leitura {read_before_s:.3f}s -> {read_after_s:.3f}s, "
+          f"mesmas janelas: {same}")
+    return stage
+
+
+def run_backfill(args, s3_client, num_records):
+    """Reconstrói as features de todos os objetos brutos em um prefixo separado (feature_backfill.py)."""
+    stage = Stage("backfill", "records")
+    backfill = FeatureBackfill(s3_client, RAW_BUCKET, "raw/", f"s3://{PROCESSED_BUCKET}/features_backfill/",
+                               manifest_bucket=PROCESSED_BUCKET, workers=args.workers)
+    with stage.run():
+        stats = stage.invoke(backfill.run)
+    stage.items = num_records
+    stage.extra.update(objects=stats["objects"], windows=stats["windows"], failed_shards=stats["failed_shards"])
+    return stage
+
+
+def run_history(args, s3_client, features):
+    """Consultas do dashboard sobre os rollups: último dia, última semana e todo o histórico de cada turbina."""
+    lambda_history_query.rollup_store = S3RollupStore(s3_client, PROCESSED_BUCKET)
+    end = features["window_end_timestamp"].max()
+    first = features["window_end_timestamp"].min()
+    ranges = [end - np.timedelta64(1, "D"), end - np.timedelta64(7, "D"), first]
+    stage = Stage("history_query", "queries")
+    stage.extra["points"] = 0
+    with stage.run():
+        for turbine_id in sorted(features["turbine_id"].astype(str).unique()):
+            for start in ranges:
+                params = {"turbine_id": turbine_id, "sensor": "gearbox_temperature_c,vibration_x_g",
+                          "start": start.isoformat(), "end": end.isoformat(), "max_points": "500"}
+                body = check_response(stage, stage.invoke(lambda_history_query.lambda_handler,
+                                                          {"queryStringParameters": params}, None))
+                stage.items += 1
+                stage.extra["points"] += body["count"]
+    return stage
+
+
+def run_fleet_state(args, fleet_state_store):
+    """Leituras do estado atual da frota pelo dashboard (todas as turbinas em uma chamada)."""
+    lambda_fleet_state.fleet_state_store = fleet_state_store
+    stage = Stage("fleet_state", "requests")
+    with stage.run():
+        for _ in range(args.requests):
+            body = check_response(stage, stage.invoke(lambda_fleet_state.lambda_handler,
+                                                      {"queryStringParameters": {"features": "false"}}, None))
+            stage.items += 1
+    stage.extra.update(turbines=body["count"], max_freshness_lag_s=body["max_freshness_lag_s"])
+    return stage
+
+
+def run_train(args, s3_client, features):
+    """Treina um modelo pequeno sobre as features processadas e publica os artefatos no bucket local."""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import StandardScaler
+
+    stage = Stage("train", "windows")
+    with stage.run():
+        X = features.drop(columns=["window_end_timestamp", "turbine_id", "date", "label"], errors="ignore")
+        X = X.select_dtypes(include=np.number)
+        X = X.fillna(X.mean())
+        y = features["label"]
+        scaler = StandardScaler().fit(X)
+        model = LogisticRegression(solver="liblinear", random_state=args.seed, class_weight="balanced")
+        stage.invoke(model.fit, scaler.transform(X), y)
+        with tempfile.TemporaryDirectory() as tmp:
+            for key, obj in ((lambda_predict_failure.MODEL_KEY, model), (lambda_predict_failure.SCALER_KEY, scaler)):
+                path = os.path.join(tmp, "artifact.joblib")
+                joblib.dump(obj, path)
+                with open(path, "rb") as f:
+                    s3_client.put_object(Bucket=ARTIFACTS_BUCKET, Key=key, Body=f.read())
+        s3_client.put_object(Bucket=ARTIFACTS_BUCKET, Key=lambda_predict_failure.COLUMNS_KEY,
+                             Body=json.dumps(list(X.columns)))
+    stage.items = len(X)
+    return stage, X
+
+
+def run_predict(args, s3_client, X, cache_dir):
+    lambda_predict_failure.artifact_cache = ArtifactCache(
+        S3ArtifactStore(s3_client, ARTIFACTS_BUCKET),
+        {
+            "model": (lambda_predict_failure.MODEL_KEY, lambda_predict_failure.load_joblib_file),
+            "scaler": (lambda_predict_failure.SCALER_KEY, lambda_predict_failure.load_joblib_file),
+            "model_columns": (lambda_predict_failure.COLUMNS_KEY, lambda_predict_failure.load_json_file),
+        },
+        lambda_predict_failure.build_inference_state,
+        cache_dir=cache_dir,
+        refresh_interval_s=-1,
+    )
+    rng = np.random.default_rng(args.seed)
+    rows = X.iloc[rng.integers(0, len(X), size=max(args.requests, args.batch_size))]
+    records = rows.to_dict(orient="records")
+
+    # A primeira requisição carrega os artefatos (partida a frio): medida à parte
+    cold = Stage("predict_cold_start", "requests")
+    with cold.run():
+        check_response(cold, cold.invoke(lambda_predict_failure.lambda_handler, {"body": json.dumps(records[0])}, None))
+    cold.items = 1
+
+    single = Stage("predict_single", "requests")
+    with single.run():
+        for record in records[:args.requests]:
+            check_response(single, single.invoke(lambda_predict_failure.lambda_handler, {"body": json.dumps(record)}, None))
+    single.items = args.requests
+
+    batch = Stage("predict_batch", "windows")
+    payload = json.dumps(records[:args.batch_size])
+    with batch.run():
+        for _ in range(args.batch_requests):
+            body = check_response(batch, batch.invoke(lambda_predict_failure.lambda_handler, {"body": payload}, None))
+            batch.items += body["count"]
+    return [cold, single, batch]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Imprime a variação por etapa em relação a um resultado anterior; devolve as regressões."""
+    regressions = []
+    print(f"\ncomparação com {baseline.get('git_commit')} ({baseline.get('timestamp')}):")
+    if baseline.get("config") != results["config"]:
+        print("  atenção: configurações diferentes, a comparação pode não ser significativa")
+    for name, stage in results["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if not old or not old.get("throughput_per_s") or not stage.get("throughput_per_s"):
+            continue
+        ratio = stage["throughput_per_s"] / old["throughput_per_s"]
+        line = f"  {name:<20} vazão {ratio:6.2f}x"
+        if stage.get("latency_ms") and old.get("latency_ms"):
+            line += f"  p50 {stage['latency_ms']['p50'] / old['latency_ms']['p50']:6.2f}x"
+        if ratio < 1.0 - tolerance:
+            line += "  <- regressão"
+            regressions.append(name)
+        print(line)
+    return regressions
+
+
+def print_report(results):
+    print(f"\n{'etapa':<20} {'tempo (s)':>10} {'vazão':>18} {'p50 (ms)':>10} {'p99 (ms)':>10} {'RSS (MB)':>9}")
+    for name, stage in results["stages"].items():
+        latency = stage["latency_ms"] or {}
+        throughput = f"{stage['throughput_per_s']:,.0f} {stage['unit']}/s" if stage["throughput_per_s"] else "-"
+        print(f"{name:<20} {stage['wall_s']:>10.3f} {throughput:>18} {latency.get('p50', float('nan')):>10.2f} "
+              f"{latency.get('p99', float('nan')):>10.2f} {stage['peak_rss_mb']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turbines", type=int, default=3)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=simulate_turbine_data.DEFAULT_SEED)
+    parser.add_argument("--workers", type=int, default=None, help="Processos da simulação e do processamento.")
+    parser.add_argument("--buffer-mb", type=float, default=5, help="Tamanho dos objetos entregues pelo Firehose.")
+    parser.add_argument("--fleet-state", action="store_true",
+                        help="Mantém o estado atual da frota no processamento e mede a sua leitura (fleet_state.py).")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Reconstrói as features em lote a partir dos objetos brutos (feature_backfill.py).")
+    parser.add_argument("--compact", action="store_true",
+                        help="Compacta as features depois do processamento (feature_compaction.py).")
+    parser.add_argument("--aggregate", action="store_true",
+                        help="Agrega as leituras em registros colunares com gzip na ingestão (AGGREGATE_RECORDS).")
+    parser.add_argument("--requests", type=int, default=500, help="Requisições de predição de uma janela.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Janelas por requisição em batch.")
+    parser.add_argument("--batch-requests", type=int, default=10)
+    parser.add_argument("--work-dir", default=None, help="Diretório de trabalho (padrão: temporário, removido ao final).")
+    parser.add_argument("--output", default=None, help="Arquivo JSON de resultados (padrão: benchmarks/results/pipeline-<commit>.json).")
+    parser.add_argument("--compare", default=None, help="JSON de uma execução anterior para comparação.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Queda de vazão tolerada antes de acusar regressão.")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        work_dir = args.work_dir or stack.enter_context(tempfile.TemporaryDirectory(prefix="bench_pipeline_"))
+        sim_dir = os.path.join(work_dir, "simulation")
+        s3_client = LocalS3Client(os.path.join(work_dir, "s3"))
+        firehose_client = FakeFirehoseClient(seed=args.seed)
+        print(f"{args.turbines} turbina(s) x {args.days} dia(s); diretório de trabalho: {work_dir}")
+
+        stages = [run_simulate(args, sim_dir)]
+        stages.append(run_ingest(args, sim_dir, firehose_client))
+        delivery, raw_keys = run_delivery(args, firehose_client, s3_client)
+        stages.append(delivery)
+        fleet_state_store = None
+        if args.fleet_state:
+            fleet_state_store = SQLiteFleetStateStore(os.path.join(work_dir, "fleet_state.db"))
+        lambda_process_data.fleet_state_store = fleet_state_store
+        process, features = run_process(args, s3_client, raw_keys, stages[1].items)
+        stages.append(process)
+        if args.backfill:
+            stages.append(run_backfill(args, s3_client, stages[1].items))
+        if args.compact:
+            stages.append(run_compact(args, s3_client))
+        stages.append(run_history(args, s3_client, features))
+        if fleet_state_store is not None:
+            stages.append(run_fleet_state(args, fleet_state_store))
+        train, X = run_train(args, s3_client, features)
+        stages.append(train)
+        stages.extend(run_predict(args, s3_client, X, os.path.join(work_dir, "artifact_cache")))
+
+    commit = git_commit()
+    results = {
+        "benchmark": "pipeline",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "work_dir")},
+        "stages": {stage.name: stage.to_dict() for stage in stages},
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_rss_children_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+    print_report(results)
+
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"pipeline-{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresultados gravados em {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
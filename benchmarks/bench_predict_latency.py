@@ -0,0 +1,113 @@
+"""
+Latência (p50/p99) da predição de uma única janela na lambda_predict_failure:
+caminho original (DataFrame + reindex + fillna + scaler.transform + predict/predict_proba)
+contra o caminho rápido sem pandas (predict_single_fast).
+
+Um modelo pequeno é treinado localmente sobre features sintéticas, então não é
+necessário acesso ao S3.
+
+Uso:
+    python benchmarks/bench_predict_latency.py --iterations 2000 --model random_forest
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "aws_lambda_functions"))
+
+import lambda_predict_failure  # noqa: E402
+from bench_feature_engine import make_turbine_frame  # noqa: E402
+from feature_engine import compute_window_features  # noqa: E402
+
+
+def train_artifacts(model_name):
+    """Treina scaler e modelo como no notebook, sobre alguns dias de dados sintéticos."""
+    from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import StandardScaler
+
+    features = pd.concat(
+        [compute_window_features(make_turbine_frame(3 * 24 * 60, seed), 10, 5) for seed in range(3)],
+        ignore_index=True,
+    )
+    X = features.drop(columns=["window_end_timestamp", "label"]).select_dtypes(include=np.number)
+    X = X.fillna(X.mean())
+    y = features["label"]
+
+    scaler = StandardScaler().fit(X)
+    models = {
+        "logistic_regression": LogisticRegression(solver="liblinear", random_state=42, class_weight="balanced"),
+        "random_forest": RandomForestClassifier(n_estimators=100, random_state=42, class_weight="balanced"),
+        "gradient_boosting": GradientBoostingClassifier(random_state=42),
+    }
+    model = models[model_name].fit(scaler.transform(X), y)
+    return model, scaler, list(X.columns), X
+
+
+def legacy_predict(model, scaler, model_columns, input_data):
+    """Reprodução do caminho original da lambda_predict_failure para uma janela."""
+    df_input = pd.DataFrame([input_data])
+    for col in model_columns:
+        if col not in df_input.columns:
+            df_input[col] = np.nan
+    df_input = df_input[model_columns]
+    if df_input.isnull().values.any():
+        df_input.fillna(0, inplace=True)
+    input_scaled = scaler.transform(df_input)
+    prediction = model.predict(input_scaled)
+    prediction_proba = model.predict_proba(input_scaled)
+    return int(prediction[0]), prediction_proba[0].tolist()
+
+
+def measure(func, payloads):
+    latencies = np.empty(len(payloads))
+    for i, payload in enumerate(payloads):
+        start = time.perf_counter()
+        func(payload)
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1e6
+
+
+def report(name, latencies_us):
+    p50, p99 = np.percentile(latencies_us, [50, 99])
+    print(f"{name:<16} p50={p50:8.1f}us  p99={p99:8.1f}us")
+    return p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--model", choices=["logistic_regression", "random_forest", "gradient_boosting"],
+                        default="random_forest")
+    args = parser.parse_args()
+
+    model, scaler, model_columns, X = train_artifacts(args.model)
+    state = lambda_predict_failure.InferenceState(model, scaler, model_columns)
+
+    def fast_predict(payload):
+        return lambda_predict_failure.predict_single_fast(state, payload)
+
+    payloads = X.sample(n=args.iterations, replace=True, random_state=0).to_dict(orient="records")
+
+    # Aquecimento
+    for payload in payloads[:50]:
+        legacy_predict(model, scaler, model_columns, payload)
+        fast_predict(payload)
+
+    legacy_p50, legacy_p99 = report("original", measure(lambda p: legacy_predict(model, scaler, model_columns, p), payloads))
+    fast_p50, fast_p99 = report("caminho rápido", measure(fast_predict, payloads))
+    print(f"ganho: p50 {legacy_p50 / fast_p50:.1f}x, p99 {legacy_p99 / fast_p99:.1f}x")
+
+    mismatches = sum(
+        legacy_predict(model, scaler, model_columns, p)[0] != fast_predict(p)["predicted_label"]
+        for p in payloads
+    )
+    print(f"labels divergentes entre os caminhos: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@ import pandas as pd
 import numpy as np
 import time
 import json
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 
 # Parâmetros da simulação
@@ -10,6 +13,11 @@ DATA_POINTS_PER_HOUR = 60 # 1 ponto por minuto
 SIMULATION_HOURS = 24 * 30 # Simular por 30 dias
 OUTPUT_DIR = "/home/ubuntu/tcc_kelly_castro/data_simulation/"
 
+# Parâmetros do modo em blocos (chunked): cada turbina é gerada em blocos de tamanho fixo
+# e escrita em disco à medida que é gerada, de modo que a memória não cresce com a duração.
+CHUNK_POINTS = 24 * 60 * 7 # Uma semana de dados por bloco
+DEFAULT_SEED = 42
+
 # Características normais de operação (exemplo)
 NORMAL_WIND_SPEED_AVG = 7.0  # m/s
 NORMAL_WIND_SPEED_STD = 2.0
@@ -31,76 +39,203 @@ ANOMALY_GEARBOX_TEMP_INCREASE_RATE = 0.1 # °C por ponto de dado
 # Anomalia 2: Aumento de vibração (aumento súbito)
 ANOMALY_VIBRATION_INCREASE_FACTOR = 5.0
 
+SENSOR_PARAMS = [
+    ("wind_speed_m_s", NORMAL_WIND_SPEED_AVG, NORMAL_WIND_SPEED_STD),
+    ("rotation_speed_rpm", NORMAL_ROTATION_SPEED_AVG, NORMAL_ROTATION_SPEED_STD),
+    ("gearbox_temperature_c", NORMAL_GEARBOX_TEMP_AVG, NORMAL_GEARBOX_TEMP_STD),
+    ("generator_power_kw", NORMAL_GENERATOR_POWER_AVG, NORMAL_GENERATOR_POWER_STD),
+    ("vibration_x_g", NORMAL_VIBRATION_X_AVG, NORMAL_VIBRATION_X_STD),
+    ("vibration_y_g", NORMAL_VIBRATION_Y_AVG, NORMAL_VIBRATION_Y_STD),
+]
+
 def generate_normal_data(num_points):
     data = pd.DataFrame()
-    data["timestamp"] = [datetime.now() - timedelta(minutes=i) for i in range(num_points)][::-1]
-    data["wind_speed_m_s"] = np.random.normal(NORMAL_WIND_SPEED_AVG, NORMAL_WIND_SPEED_STD, num_points)
-    data["rotation_speed_rpm"] = np.random.normal(NORMAL_ROTATION_SPEED_AVG, NORMAL_ROTATION_SPEED_STD, num_points)
-    data["gearbox_temperature_c"] = np.random.normal(NORMAL_GEARBOX_TEMP_AVG, NORMAL_GEARBOX_TEMP_STD, num_points)
-    data["generator_power_kw"] = np.random.normal(NORMAL_GENERATOR_POWER_AVG, NORMAL_GENERATOR_POWER_STD, num_points)
-    data["vibration_x_g"] = np.random.normal(NORMAL_VIBRATION_X_AVG, NORMAL_VIBRATION_X_STD, num_points)
-    data["vibration_y_g"] = np.random.normal(NORMAL_VIBRATION_Y_AVG, NORMAL_VIBRATION_Y_STD, num_points)
+    # Timestamps gerados de forma vetorizada: um ponto por minuto terminando em "agora"
+    minutes_before_now = np.arange(num_points - 1, -1, -1)
+    data["timestamp"] = pd.Timestamp(datetime.now()) - pd.to_timedelta(minutes_before_now, unit="min")
+    for column, avg, std in SENSOR_PARAMS:
+        data[column] = np.random.normal(avg, std, num_points)
     data["label"] = 0 # 0 para normal
     return data
 
+def _anomaly_slice(start_index, duration_points, length, offset=0):
+    """
+    Interseção entre a anomalia [start_index, start_index + duration_points) e o bloco
+    [offset, offset + length). Devolve (slice local ao bloco, passos da rampa 1..N) ou None.
+    """
+    begin = max(start_index, offset)
+    end = min(start_index + duration_points, offset + length)
+    if begin >= end:
+        return None
+    ramp_steps = np.arange(begin - start_index + 1, end - start_index + 1)
+    return slice(begin - offset, end - offset), ramp_steps
+
+def _apply_gearbox_overheating(df, start_index, duration_points, offset=0):
+    overlap = _anomaly_slice(start_index, duration_points, len(df), offset)
+    if overlap is None:
+        return
+    rows, ramp_steps = overlap
+    col = df.columns.get_loc("gearbox_temperature_c")
+    df.iloc[rows, col] = df.iloc[rows, col].to_numpy() + ANOMALY_GEARBOX_TEMP_INCREASE_RATE * ramp_steps
+    df.iloc[rows, df.columns.get_loc("label")] = 1 # 1 para falha na caixa de engrenagens
+
+def _apply_vibration(df, start_index, duration_points, offset=0):
+    overlap = _anomaly_slice(start_index, duration_points, len(df), offset)
+    if overlap is None:
+        return
+    rows, _ = overlap
+    for column in ("vibration_x_g", "vibration_y_g"):
+        col = df.columns.get_loc(column)
+        df.iloc[rows, col] = df.iloc[rows, col].to_numpy() * ANOMALY_VIBRATION_INCREASE_FACTOR
+    df.iloc[rows, df.columns.get_loc("label")] = 2 # 2 para falha de vibração
+
 def introduce_gearbox_overheating_anomaly(df, start_index, duration_points):
     df_anomaly = df.copy()
-    for i in range(duration_points):
-        if start_index + i < len(df_anomaly):
-            df_anomaly.loc[start_index + i, "gearbox_temperature_c"] += ANOMALY_GEARBOX_TEMP_INCREASE_RATE * (i + 1)
-            df_anomaly.loc[start_index + i, "label"] = 1 # 1 para falha na caixa de engrenagens
+    _apply_gearbox_overheating(df_anomaly, start_index, duration_points)
     return df_anomaly
 
 def introduce_vibration_anomaly(df, start_index, duration_points):
     df_anomaly = df.copy()
-    for i in range(duration_points):
-        if start_index + i < len(df_anomaly):
-            df_anomaly.loc[start_index + i, "vibration_x_g"] *= ANOMALY_VIBRATION_INCREASE_FACTOR
-            df_anomaly.loc[start_index + i, "vibration_y_g"] *= ANOMALY_VIBRATION_INCREASE_FACTOR
-            df_anomaly.loc[start_index + i, "label"] = 2 # 2 para falha de vibração
+    _apply_vibration(df_anomaly, start_index, duration_points)
     return df_anomaly
 
-if __name__ == "__main__":
-    total_data_points = SIMULATION_HOURS * DATA_POINTS_PER_HOUR
-
-    for turbine_id in range(1, NUM_TURBINES + 1):
-        print(f"Gerando dados para a turbina {turbine_id}...")
-        df_turbine = generate_normal_data(total_data_points)
-
-        # Introduzir anomalias em momentos aleatórios
-        if turbine_id == 1: # Turbina 1 com superaquecimento
-            anomaly_start = np.random.randint(total_data_points // 2, total_data_points - (DATA_POINTS_PER_HOUR * 5)) # Pelo menos 5h antes do fim
-            anomaly_duration = DATA_POINTS_PER_HOUR * 3 # Anomalia dura 3 horas
-            df_turbine = introduce_gearbox_overheating_anomaly(df_turbine, anomaly_start, anomaly_duration)
-            print(f"Anomalia de superaquecimento introduzida na turbina {turbine_id} a partir do ponto {anomaly_start}")
-
-        elif turbine_id == 2: # Turbina 2 com problema de vibração
-            anomaly_start = np.random.randint(total_data_points // 3, total_data_points - (DATA_POINTS_PER_HOUR * 6))
-            anomaly_duration = DATA_POINTS_PER_HOUR * 2 # Anomalia dura 2 horas
-            df_turbine = introduce_vibration_anomaly(df_turbine, anomaly_start, anomaly_duration)
-            print(f"Anomalia de vibração introduzida na turbina {turbine_id} a partir do ponto {anomaly_start}")
-        
-        # Turbina 3 permanece normal para ter dados de referência
-
-        # Arredondar valores para um número razoável de casas decimais
-        for col in df_turbine.columns:
-            if df_turbine[col].dtype == float:
-                df_turbine[col] = df_turbine[col].round(4)
-
-        # Salvar dados em formato JSON (simulando o que seria enviado para S3/Kinesis)
-        # Em um cenário real, cada ponto de dado ou pequenos batches seriam enviados.
-        # Aqui, salvamos um arquivo por turbina para simplificar.
-        output_filename = f"{OUTPUT_DIR}turbine_{turbine_id}_data.json"
-        
-        # Converter timestamps para string ISO format para serialização JSON
-        df_turbine["timestamp"] = df_turbine["timestamp"].astype(str)
-        
-        data_to_save = df_turbine.to_dict(orient="records")
-        
-        with open(output_filename, "w") as f:
-            json.dump(data_to_save, f, indent=4)
-        
-        print(f"Dados da turbina {turbine_id} salvos em {output_filename}")
-
-    print("Simulação de dados concluída.")
+# ---- MODO EM BLOCOS (CHUNKED) E MULTIPROCESSO ----
+
+def turbine_rng(seed, turbine_id, stream):
+    """
+    Gerador aleatório próprio de cada turbina e de cada fluxo (sensor ou anomalia).
+    Depende apenas de (seed, turbine_id, stream), então o resultado é o mesmo
+    independentemente do número de processos ou do tamanho do bloco.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(turbine_id, stream)))
+
+def plan_turbine_anomaly(turbine_id, total_points, seed):
+    """
+    Escolhe o tipo e a posição da anomalia da turbina, seguindo o mesmo padrão do script
+    original: turbinas 1, 4, 7... superaquecimento; 2, 5, 8... vibração; as demais normais.
+    Devolve (tipo, início, duração) ou None.
+    """
+    rng = turbine_rng(seed, turbine_id, len(SENSOR_PARAMS))
+    if turbine_id % 3 == 1:
+        kind, duration = "gearbox_overheating", DATA_POINTS_PER_HOUR * 3 # Anomalia dura 3 horas
+        low, high = total_points // 2, total_points - (DATA_POINTS_PER_HOUR * 5) # Pelo menos 5h antes do fim
+    elif turbine_id % 3 == 2:
+        kind, duration = "vibration", DATA_POINTS_PER_HOUR * 2 # Anomalia dura 2 horas
+        low, high = total_points // 3, total_points - (DATA_POINTS_PER_HOUR * 6)
+    else:
+        return None
+    if high <= low:
+        high = low + 1
+    return kind, int(rng.integers(low, high)), duration
+
+def generate_turbine_chunks(turbine_id, total_points, end_time, seed=DEFAULT_SEED, chunk_points=CHUNK_POINTS):
+    """
+    Gera os dados de uma turbina em blocos de até chunk_points linhas (DataFrames já
+    arredondados e com timestamp em string), aplicando a anomalia planejada a cada bloco.
+    """
+    sensor_rngs = [turbine_rng(seed, turbine_id, i) for i in range(len(SENSOR_PARAMS))]
+    anomaly = plan_turbine_anomaly(turbine_id, total_points, seed)
+    end_time = pd.Timestamp(end_time)
 
+    for offset in range(0, total_points, chunk_points):
+        length = min(chunk_points, total_points - offset)
+        chunk = pd.DataFrame()
+        minutes_before_end = np.arange(total_points - 1 - offset, total_points - 1 - offset - length, -1)
+        chunk["timestamp"] = end_time - pd.to_timedelta(minutes_before_end, unit="min")
+        for rng, (column, avg, std) in zip(sensor_rngs, SENSOR_PARAMS):
+            chunk[column] = rng.normal(avg, std, length)
+        chunk["label"] = 0
+
+        if anomaly is not None:
+            kind, start_index, duration = anomaly
+            if kind == "gearbox_overheating":
+                _apply_gearbox_overheating(chunk, start_index, duration, offset)
+            else:
+                _apply_vibration(chunk, start_index, duration, offset)
+
+        for column, _, _ in SENSOR_PARAMS:
+            chunk[column] = chunk[column].round(4)
+        chunk["timestamp"] = chunk["timestamp"].astype(str)
+        yield chunk
+
+def write_turbine_file(turbine_id, total_points, end_time, output_dir, seed=DEFAULT_SEED,
+                       chunk_points=CHUNK_POINTS, output_format="json"):
+    """
+    Gera e grava os dados de uma turbina bloco a bloco.
+    output_format="json" grava um array JSON (mesmo formato lido por lambda_ingest_data);
+    "ndjson" grava um registro JSON por linha.
+    """
+    extension = "json" if output_format == "json" else "ndjson"
+    output_filename = os.path.join(output_dir, f"turbine_{turbine_id}_data.{extension}")
+    records_written = 0
+    with open(output_filename, "w") as f:
+        if output_format == "json":
+            f.write("[")
+        for chunk in generate_turbine_chunks(turbine_id, total_points, end_time, seed, chunk_points):
+            if output_format == "json":
+                body = chunk.to_json(orient="records")[1:-1]
+                if records_written:
+                    f.write(",")
+                f.write(body)
+            else:
+                body = chunk.to_json(orient="records", lines=True)
+                f.write(body if body.endswith("\n") else body + "\n")
+            records_written += len(chunk)
+        if output_format == "json":
+            f.write("]")
+    return turbine_id, output_filename, records_written
+
+def run_simulation(num_turbines=NUM_TURBINES, simulation_hours=SIMULATION_HOURS, output_dir=OUTPUT_DIR,
+                   seed=DEFAULT_SEED, chunk_points=CHUNK_POINTS, workers=None, output_format="json",
+                   end_time=None):
+    """
+    Distribui as turbinas por um pool de processos. Cada processo mantém em memória
+    apenas um bloco por vez, então a memória total é limitada por workers x chunk_points.
+    """
+    total_points = simulation_hours * DATA_POINTS_PER_HOUR
+    # O horário final é fixado uma única vez para todas as turbinas
+    end_time = pd.Timestamp(end_time) if end_time is not None else pd.Timestamp(datetime.now())
+    os.makedirs(output_dir, exist_ok=True)
+
+    turbine_ids = list(range(1, num_turbines + 1))
+    start = time.perf_counter()
+    total_records = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(write_turbine_file, turbine_id, total_points, end_time, output_dir,
+                            seed, chunk_points, output_format)
+            for turbine_id in turbine_ids
+        ]
+        for future in futures:
+            turbine_id, output_filename, records_written = future.result()
+            total_records += records_written
+            print(f"Dados da turbina {turbine_id} salvos em {output_filename} ({records_written} registros)")
+    elapsed = time.perf_counter() - start
+    print(f"Simulação concluída: {total_records} registros em {elapsed:.1f}s "
+          f"({total_records / max(elapsed, 1e-9):,.0f} registros/s)")
+    return total_records
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Gera dados simulados de sensores de turbinas eólicas.")
+    parser.add_argument("--turbines", type=int, default=NUM_TURBINES)
+    parser.add_argument("--hours", type=int, default=SIMULATION_HOURS)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--chunk-points", type=int, default=CHUNK_POINTS)
+    parser.add_argument("--workers", type=int, default=None, help="Número de processos (padrão: núcleos da máquina).")
+    parser.add_argument("--format", choices=["json", "ndjson"], default="json")
+    parser.add_argument("--end-time", default=None, help="Timestamp final da simulação (padrão: agora).")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    run_simulation(
+        num_turbines=args.turbines,
+        simulation_hours=args.hours,
+        output_dir=args.output_dir,
+        seed=args.seed,
+        chunk_points=args.chunk_points,
+        workers=args.workers,
+        output_format=args.format,
+        end_time=args.end_time,
+    )
@@ -0,0 +1,328 @@
+"""
+Seleção de modelo e busca de hiperparâmetros para a predição de falhas, fora do notebook.
+
+Os candidatos (modelo + combinação de hiperparâmetros) são avaliados com validação cruzada
+temporal (TimeSeriesSplit sobre as janelas ordenadas por window_end_timestamp) em um pool de
+processos. As matrizes de cada fold (imputadas e escaladas com o scaler ajustado só no treino
+do fold) são calculadas uma única vez e gravadas em disco; os processos as abrem com mmap em vez
+de recalcular ou receber cópias a cada candidato. O cache é identificado por um hash dos dados
+e da configuração dos folds, então novas execuções sobre os mesmos dados o reaproveitam.
+
+Poda (successive halving): os folds são avaliados em ordem (os primeiros têm menos dados de
+treino e são mais baratos) e, a partir de --prune-after folds avaliados, apenas a melhor fração
+1/--eta das configurações segue para o próximo fold. Folds cujo treino tem uma única classe
+(sem falhas ainda) não recebem nota e não contam para a poda.
+
+A melhor configuração (maior F1 ponderado médio) é treinada com todos os dados e os artefatos
+carregados pela lambda_predict_failure são gravados em --output-dir:
+best_failure_prediction_model.joblib, feature_scaler.joblib e model_columns.json
+(mais cv_results.json com os resultados de todas as configurações). Com --compact, se o vencedor
+for um ensemble de árvores, também é gravado best_failure_prediction_model.trees (formato compacto
+do tree_ensemble.py, com o scaler embutido), para a Lambda carregar sem joblib/scikit-learn.
+
+Uso:
+    python training/train_model.py --features s3://tcc-kelly-processed-turbine-data-bucket/features/ --output-dir ./artifacts
+    python training/train_model.py --features ./features --models logistic_regression,random_forest --folds 5 --workers 4
+    python training/train_model.py --features ./features --start-date 2025-01-01 --upload s3://tcc-kelly-model-artifacts-bucket/notebooks/
+    python training/train_model.py --features ./features --models random_forest,gradient_boosting --compact
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "aws_lambda_functions"))
+import training_data  # noqa: E402
+from artifact_cache import PUBLISH_ID_METADATA  # noqa: E402
+from tree_ensemble import FILE_SUFFIX as TREE_ENSEMBLE_SUFFIX, export_tree_ensemble  # noqa: E402
+
+MODEL_FILE_NAME = "best_failure_prediction_model.joblib"
+COMPACT_MODEL_FILE_NAME = "best_failure_prediction_model" + TREE_ENSEMBLE_SUFFIX
+SCALER_FILE_NAME = "feature_scaler.joblib"
+COLUMNS_FILE_NAME = "model_columns.json"
+RESULTS_FILE_NAME = "cv_results.json"
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "train_model_cache")
+
+# Candidatos: classe, parâmetros fixos e grade de hiperparâmetros (os mesmos modelos do notebook)
+CANDIDATES = {
+    "logistic_regression": (
+        LogisticRegression,
+        {"solver": "liblinear", "random_state": 42, "class_weight": "balanced"},
+        {"C": [0.1, 1.0, 10.0]},
+    ),
+    "random_forest": (
+        RandomForestClassifier,
+        # n_jobs=1: o paralelismo é entre candidatos, no pool de processos
+        {"random_state": 42, "class_weight": "balanced", "n_jobs": 1},
+        {"n_estimators": [100, 200], "max_depth": [None, 10, 20], "min_samples_split": [2, 5], "min_samples_leaf": [1, 2]},
+    ),
+    "gradient_boosting": (
+        GradientBoostingClassifier,
+        {"random_state": 42},
+        {"n_estimators": [100, 200], "learning_rate": [0.05, 0.1], "max_depth": [3, 5]},
+    ),
+}
+
+
+def expand_grid(model_names):
+    """Lista de (modelo, parâmetros) com todas as combinações das grades."""
+    configs = []
+    for name in model_names:
+        _, _, grid = CANDIDATES[name]
+        keys = sorted(grid)
+        for values in itertools.product(*(grid[k] for k in keys)):
+            configs.append((name, dict(zip(keys, values))))
+    return configs
+
+
+def build_model(name, params):
+    model_class, fixed_params, _ = CANDIDATES[name]
+    return model_class(**fixed_params, **params)
+
+
+def load_training_frame(features_path, start_date=None, end_date=None, turbine_ids=None):
+    """
+    Lê apenas as features numéricas, o label e o timestamp das partições selecionadas e
+    ordena as janelas no tempo (pré-requisito do TimeSeriesSplit). Devolve (X, y, columns).
+    """
+    dataset = training_data.open_feature_dataset(features_path)
+    columns = training_data.feature_columns(dataset)
+    df = training_data.load_features(dataset, columns=columns + ["window_end_timestamp", "turbine_id", "label"],
+                                     start_date=start_date, end_date=end_date, turbine_ids=turbine_ids)
+    if df.empty:
+        raise ValueError("Nenhuma janela encontrada para os filtros informados.")
+    df = df.sort_values(["window_end_timestamp", "turbine_id"], kind="stable")
+    X = df[columns].to_numpy(dtype=np.float64)
+    y = df["label"].to_numpy()
+    return X, y, columns
+
+
+def fit_scaler(X_train, columns):
+    """
+    Ajusta o StandardScaler (que ignora NaN) e devolve (scaler, X_train escalado). Os valores
+    ausentes são imputados como na lambda_predict_failure (InferenceState.fill_values): *_std com 0,
+    demais com as médias do scaler.
+    """
+    scaler = StandardScaler().fit(X_train)
+    return scaler, scaler.transform(training_data.impute_batch(X_train.copy(), columns, scaler.mean_))
+
+
+def transform(scaler, X, columns):
+    return scaler.transform(training_data.impute_batch(X.copy(), columns, scaler.mean_))
+
+
+def data_fingerprint(X, y, columns, num_folds):
+    digest = hashlib.sha1()
+    digest.update(json.dumps([columns, num_folds, list(X.shape)]).encode())
+    digest.update(np.ascontiguousarray(X).tobytes())
+    digest.update(np.ascontiguousarray(y).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def prepare_folds(X, y, columns, num_folds, cache_dir):
+    """
+    Calcula (ou reaproveita do cache) as matrizes escaladas de cada fold.
+    Devolve uma lista de dicionários {"X_train", "y_train", "X_val", "y_val"} com caminhos .npy.
+    """
+    fold_dir = os.path.join(cache_dir, data_fingerprint(X, y, columns, num_folds))
+    folds = []
+    splits = list(TimeSeriesSplit(n_splits=num_folds).split(X))
+    for k, (train_index, val_index) in enumerate(splits):
+        paths = {part: os.path.join(fold_dir, f"fold_{k}_{part}.npy") for part in ("X_train", "y_train", "X_val", "y_val")}
+        if not all(os.path.exists(p) for p in paths.values()):
+            os.makedirs(fold_dir, exist_ok=True)
+            scaler, X_train = fit_scaler(X[train_index], columns)
+            arrays = {"X_train": X_train, "y_train": y[train_index],
+                      "X_val": transform(scaler, X[val_index], columns), "y_val": y[val_index]}
+            for part, array in arrays.items():
+                # Grava em um temporário e renomeia: um cache interrompido não fica pela metade
+                tmp_path = paths[part] + ".tmp.npy"
+                np.save(tmp_path, array)
+                os.replace(tmp_path, paths[part])
+        folds.append(paths)
+    print(f"Folds em cache: {fold_dir}")
+    return folds
+
+
+_worker_arrays = {}
+
+
+def _load_array(path):
+    # Cada processo abre as matrizes uma vez (mmap: as páginas são compartilhadas pelo cache de disco)
+    if path not in _worker_arrays:
+        _worker_arrays[path] = np.load(path, mmap_mode="r")
+    return _worker_arrays[path]
+
+
+def evaluate(config_index, name, params, fold_index, fold_paths):
+    """Treina a configuração no treino do fold e devolve (config_index, fold_index, F1 ponderado, segundos)."""
+    start = time.perf_counter()
+    y_train = _load_array(fold_paths["y_train"])
+    if len(np.unique(y_train)) < 2:
+        # Folds iniciais podem não ter falhas: não dá para treinar um classificador
+        return config_index, fold_index, None, 0.0
+    model = build_model(name, params)
+    model.fit(_load_array(fold_paths["X_train"]), y_train)
+    y_pred = model.predict(_load_array(fold_paths["X_val"]))
+    score = f1_score(_load_array(fold_paths["y_val"]), y_pred, average="weighted", zero_division=0)
+    return config_index, fold_index, float(score), time.perf_counter() - start
+
+
+def _evaluate_args(args):
+    return evaluate(*args)
+
+
+def mean_score(scores):
+    valid = [s for s in scores if s is not None]
+    return float(np.mean(valid)) if valid else -math.inf
+
+
+def run_search(configs, folds, workers=None, prune_after=2, eta=3):
+    """
+    Avalia as configurações fold a fold em um pool de processos, podando as piores.
+    Devolve uma lista de dicionários por configuração (scores por fold, média, se foi podada).
+    """
+    results = [{"model": name, "params": params, "fold_scores": [], "fit_seconds": 0.0, "pruned_at_fold": None}
+               for name, params in configs]
+    alive = list(range(len(configs)))
+    scored_folds = 0
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for fold_index, fold_paths in enumerate(folds):
+            tasks = [(i, configs[i][0], configs[i][1], fold_index, fold_paths) for i in alive]
+            outputs = executor.map(_evaluate_args, tasks) if executor else map(_evaluate_args, tasks)
+            fold_scored = False
+            for config_index, _, score, seconds in outputs:
+                results[config_index]["fold_scores"].append(score)
+                results[config_index]["fit_seconds"] += seconds
+                fold_scored = fold_scored or score is not None
+            # Folds sem nota (treino com uma única classe) não contam para a poda
+            scored_folds += fold_scored
+            is_last = fold_index == len(folds) - 1
+            if eta > 1 and scored_folds >= prune_after and not is_last and len(alive) > 1:
+                ranked = sorted(alive, key=lambda i: mean_score(results[i]["fold_scores"]), reverse=True)
+                keep = max(1, math.ceil(len(ranked) / eta))
+                for i in ranked[keep:]:
+                    results[i]["pruned_at_fold"] = fold_index
+                alive = ranked[:keep]
+            best = max(alive, key=lambda i: mean_score(results[i]["fold_scores"]))
+            summary = (f"melhor até aqui {results[best]['model']} {results[best]['params']} "
+                       f"(F1 médio {mean_score(results[best]['fold_scores']):.4f})" if scored_folds else "sem nota")
+            print(f"Fold {fold_index + 1}/{len(folds)}: {len(tasks)} configurações avaliadas, {len(alive)} seguem; {summary}")
+    finally:
+        if executor:
+            executor.shutdown()
+    for result in results:
+        result["mean_f1_weighted"] = mean_score(result["fold_scores"])
+    return results
+
+
+def select_best(results):
+    """Melhor configuração entre as que passaram por todos os folds."""
+    finalists = [r for r in results if r["pruned_at_fold"] is None and r["mean_f1_weighted"] > -math.inf]
+    if not finalists:
+        raise ValueError("Nenhuma configuração pôde ser avaliada (os folds de treino têm uma única classe?).")
+    return max(finalists, key=lambda r: r["mean_f1_weighted"])
+
+
+def write_artifacts(output_dir, model, scaler, columns, results, compact=False):
+    """Grava os artefatos e devolve os nomes dos arquivos que a Lambda pode carregar."""
+    os.makedirs(output_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(output_dir, MODEL_FILE_NAME))
+    joblib.dump(scaler, os.path.join(output_dir, SCALER_FILE_NAME))
+    with open(os.path.join(output_dir, COLUMNS_FILE_NAME), "w") as f:
+        json.dump(columns, f)
+    with open(os.path.join(output_dir, RESULTS_FILE_NAME), "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    file_names = [COLUMNS_FILE_NAME, SCALER_FILE_NAME, MODEL_FILE_NAME]
+    if compact:
+        try:
+            size = export_tree_ensemble(model, scaler, os.path.join(output_dir, COMPACT_MODEL_FILE_NAME))
+            file_names.append(COMPACT_MODEL_FILE_NAME)
+            print(f"Modelo compacto: {size / 1024:.1f} KiB "
+                  f"(joblib: {os.path.getsize(os.path.join(output_dir, MODEL_FILE_NAME)) / 1024:.1f} KiB)")
+        except ValueError as e:
+            print(f"Modelo compacto não gerado: {e}")
+    print(f"Artefatos gravados em {output_dir}")
+    return file_names
+
+
+def upload_artifacts(output_dir, s3_uri, file_names):
+    """Publica os artefatos no prefixo s3://bucket/prefixo/ lido pela lambda_predict_failure."""
+    import boto3
+
+    bucket, _, prefix = s3_uri[len("s3://"):].partition("/")
+    s3_client = boto3.client("s3")
+    # A Lambda verifica as versões dos artefatos a cada ARTIFACT_REFRESH_SECONDS e recarrega os
+    # alterados, desde que todos tragam o mesmo publish-id (não mistura artefatos de dois treinos)
+    publish_id = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{os.getpid()}"
+    for file_name in file_names:
+        key = f"{prefix.rstrip('/')}/{file_name}" if prefix else file_name
+        s3_client.upload_file(os.path.join(output_dir, file_name), bucket, key,
+                              ExtraArgs={"Metadata": {PUBLISH_ID_METADATA: publish_id}})
+        print(f"Enviado s3://{bucket}/{key} (publicação {publish_id})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--features", required=True, help="Diretório de features (local ou s3://bucket/features/).")
+    parser.add_argument("--output-dir", default="./artifacts")
+    parser.add_argument("--models", default=",".join(CANDIDATES), help=f"Modelos candidatos ({', '.join(CANDIDATES)}).")
+    parser.add_argument("--folds", type=int, default=5, help="Folds do TimeSeriesSplit.")
+    parser.add_argument("--workers", type=int, default=None, help="Processos de avaliação (padrão: núcleos disponíveis).")
+    parser.add_argument("--prune-after", type=int, default=2, help="Folds avaliados antes da primeira poda.")
+    parser.add_argument("--eta", type=int, default=3, help="Fração 1/eta das configurações mantida a cada poda (1 desativa).")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Cache das matrizes escaladas de cada fold.")
+    parser.add_argument("--start-date", default=None)
+    parser.add_argument("--end-date", default=None)
+    parser.add_argument("--turbines", default=None, help="Turbinas separadas por vírgula (padrão: todas).")
+    parser.add_argument("--upload", default=None, help="Prefixo s3://bucket/prefixo/ para publicar os artefatos.")
+    parser.add_argument("--compact", action="store_true", help=f"Também exporta o modelo no formato compacto ({TREE_ENSEMBLE_SUFFIX}).")
+    args = parser.parse_args()
+
+    model_names = [name.strip() for name in args.models.split(",") if name.strip()]
+    unknown = [name for name in model_names if name not in CANDIDATES]
+    if unknown:
+        parser.error(f"Modelos desconhecidos: {', '.join(unknown)}")
+    turbine_ids = args.turbines.split(",") if args.turbines else None
+
+    X, y, columns = load_training_frame(args.features, args.start_date, args.end_date, turbine_ids)
+    print(f"{len(X)} janelas, {len(columns)} features, classes: {np.unique(y).tolist()}")
+
+    folds = prepare_folds(X, y, columns, args.folds, args.cache_dir)
+    configs = expand_grid(model_names)
+    print(f"{len(configs)} configurações candidatas em {len(folds)} folds")
+    start = time.perf_counter()
+    results = run_search(configs, folds, args.workers, args.prune_after, args.eta)
+    print(f"Busca concluída em {time.perf_counter() - start:.1f} s")
+
+    best = select_best(results)
+    print(f"Melhor configuração: {best['model']} {best['params']} (F1 ponderado médio {best['mean_f1_weighted']:.4f})")
+
+    # Modelo final: scaler e modelo ajustados com todas as janelas selecionadas
+    scaler, X_scaled = fit_scaler(X, columns)
+    model = build_model(best["model"], best["params"]).fit(X_scaled, y)
+    results.sort(key=lambda r: r["mean_f1_weighted"], reverse=True)
+    file_names = write_artifacts(args.output_dir, model, scaler, columns, results, args.compact)
+    if args.upload:
+        upload_artifacts(args.output_dir, args.upload, file_names)
+
+
+if __name__ == "__main__":
+    main()
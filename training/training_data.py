@@ -0,0 +1,170 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+# Leitura out-of-core das features para treinamento.
+# As features gravadas pela lambda_process_data ficam em Parquet particionado no formato Hive
+# (features/turbine_id=<id>/date=<AAAA-MM-DD>/*.parquet). Em vez de carregar todos os arquivos
+# em um único DataFrame, os dados são lidos como um dataset do pyarrow:
+# - projeção de colunas: só as features usadas pelo modelo e o label são lidos do Parquet;
+# - filtros aplicados na leitura: intervalo de datas e turbinas descartam partições inteiras
+#   (sem abrir os arquivos) e o restante é filtrado por row group;
+# - os dados chegam em lotes de tamanho limitado, então a memória não cresce com o histórico.
+# Os lotes alimentam estimadores com partial_fit (ex: SGDClassifier) e o StandardScaler,
+# também ajustado de forma incremental.
+
+PARTITIONING = ds.partitioning(pa.schema([("turbine_id", pa.string()), ("date", pa.string())]), flavor="hive")
+NON_FEATURE_COLUMNS = ("window_end_timestamp", "turbine_id", "date", "label")
+# Estatísticas da coluna label por janela (label_mean, label_max, ...), calculadas pelo
+# feature_engine como as dos sensores: derivadas do alvo, vazariam o label para o modelo
+LABEL_FEATURE_PREFIX = "label_"
+# Features de desvio padrão: ausentes (janelas com um ponto) são imputadas com 0
+ZERO_FILL_SUFFIX = "_std"
+# Predições gravadas pela lambda_process_data com INLINE_SCORING (não são features)
+PREDICTION_COLUMN_PREFIX = "prediction_"
+LABEL_COLUMN = "label"
+DEFAULT_BATCH_SIZE = 65536
+
+
+def open_feature_dataset(path, filesystem=None):
+    """
+    Abre o diretório de features (caminho local ou s3://bucket/prefixo/) como dataset particionado.
+    Só a listagem dos arquivos e os metadados são lidos aqui.
+    """
+    if filesystem is None and "://" in path:
+        filesystem, path = pafs.FileSystem.from_uri(path)
+    return ds.dataset(path, format="parquet", partitioning=PARTITIONING, filesystem=filesystem)
+
+
+def feature_columns(dataset, exclude=NON_FEATURE_COLUMNS):
+    """Colunas numéricas do dataset que são features (na ordem do schema), sem o label e as suas estatísticas."""
+    return [
+        field.name for field in dataset.schema
+        if field.name not in exclude and not field.name.startswith((PREDICTION_COLUMN_PREFIX, LABEL_FEATURE_PREFIX))
+        and (pa.types.is_integer(field.type) or pa.types.is_floating(field.type))
+    ]
+
+
+def build_filter(start_date=None, end_date=None, turbine_ids=None):
+    """
+    Expressão de filtro sobre as colunas de partição (datas inclusivas, "AAAA-MM-DD").
+    Partições fora do filtro não são abertas. Devolve None se não houver filtro.
+    """
+    expression = None
+
+    def combine(condition):
+        return condition if expression is None else expression & condition
+
+    if start_date is not None:
+        expression = combine(ds.field("date") >= str(start_date)[:10])
+    if end_date is not None:
+        expression = combine(ds.field("date") <= str(end_date)[:10])
+    if turbine_ids is not None:
+        expression = combine(ds.field("turbine_id").isin([str(t) for t in turbine_ids]))
+    return expression
+
+
+def iter_batches(dataset, columns, label_column=LABEL_COLUMN, start_date=None, end_date=None, turbine_ids=None,
+                 batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Gera (X, y) em lotes de até batch_size janelas: X float64 (janelas, len(columns)) na ordem de
+    columns e y com o label. Apenas columns e o label são lidos dos arquivos.
+    """
+    if isinstance(dataset, str):
+        dataset = open_feature_dataset(dataset)
+    scanner = dataset.scanner(
+        columns=list(columns) + [label_column],
+        filter=build_filter(start_date, end_date, turbine_ids),
+        batch_size=batch_size,
+        # Poucos arquivos e lotes lidos à frente: limita a memória usada pela leitura em paralelo
+        batch_readahead=2,
+        fragment_readahead=2,
+    )
+    for batch in scanner.to_batches():
+        if batch.num_rows == 0:
+            continue
+        X = np.column_stack([
+            pc.cast(batch.column(i), pa.float64()).to_numpy(zero_copy_only=False) for i in range(len(columns))
+        ]) if columns else np.empty((batch.num_rows, 0))
+        y = batch.column(len(columns)).to_numpy(zero_copy_only=False)
+        yield X, y
+
+
+def load_features(dataset, columns=None, start_date=None, end_date=None, turbine_ids=None):
+    """
+    Carrega em um DataFrame apenas as colunas pedidas (padrão: todas) das partições selecionadas.
+    Para subconjuntos que cabem em memória (análise exploratória, conjunto de teste).
+    """
+    if isinstance(dataset, str):
+        dataset = open_feature_dataset(dataset)
+    table = dataset.to_table(columns=columns, filter=build_filter(start_date, end_date, turbine_ids))
+    return table.to_pandas()
+
+
+def impute_batch(X, columns, fill_values):
+    """
+    Trata valores ausentes como no notebook e na lambda_predict_failure (InferenceState.fill_values):
+    features *_std ausentes (janelas com um ponto) viram 0 e as demais recebem fill_values (as médias do scaler).
+    """
+    missing = np.isnan(X)
+    if missing.any():
+        fill = np.where([col.endswith(ZERO_FILL_SUFFIX) for col in columns], 0.0, fill_values)
+        X[missing] = np.broadcast_to(fill, X.shape)[missing]
+    return X
+
+
+def fit_scaler_incremental(dataset, columns, scaler=None, **filters):
+    """
+    Ajusta um StandardScaler com partial_fit em uma passada pelos lotes (NaN são ignorados).
+    Devolve (scaler, classes encontradas no label, número de janelas).
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = scaler if scaler is not None else StandardScaler()
+    classes = set()
+    num_rows = 0
+    for X, y in iter_batches(dataset, columns, **filters):
+        scaler.partial_fit(X)
+        classes.update(np.unique(y).tolist())
+        num_rows += len(y)
+    if num_rows == 0:
+        raise ValueError("Nenhuma janela encontrada para os filtros informados.")
+    return scaler, np.array(sorted(classes)), num_rows
+
+
+def fit_incremental(model, dataset, columns=None, epochs=1, shuffle_seed=None, scaler=None, **filters):
+    """
+    Treina model (um estimador com partial_fit) sobre todo o histórico selecionado, lote a lote.
+    Primeira passada: scaler e classes; passadas seguintes: imputação, escala e partial_fit.
+    filters: start_date, end_date, turbine_ids e batch_size (ver iter_batches).
+    Devolve (model, scaler, columns), os três artefatos usados pela lambda_predict_failure.
+    """
+    if not hasattr(model, "partial_fit"):
+        raise ValueError(f"{type(model).__name__} não suporta partial_fit; use um estimador incremental "
+                         "(ex: SGDClassifier) ou load_features para treinar em memória.")
+    if isinstance(dataset, str):
+        dataset = open_feature_dataset(dataset)
+    columns = list(columns) if columns is not None else feature_columns(dataset)
+
+    scaler, classes, num_rows = fit_scaler_incremental(dataset, columns, scaler, **filters)
+    print(f"Scaler ajustado com {num_rows} janelas e {len(columns)} features; classes: {classes.tolist()}")
+
+    rng = np.random.default_rng(shuffle_seed) if shuffle_seed is not None else None
+    for epoch in range(epochs):
+        for X, y in iter_batches(dataset, columns, **filters):
+            X = scaler.transform(impute_batch(X, columns, scaler.mean_))
+            if rng is not None:
+                # Os lotes chegam agrupados por turbina e data: embaralhar ajuda o SGD
+                order = rng.permutation(len(y))
+                X, y = X[order], y[order]
+            model.partial_fit(X, y, classes=classes)
+        print(f"Época {epoch + 1}/{epochs} concluída")
+    return model, scaler, columns
+
+
+def predict_batches(model, scaler, dataset, columns, **filters):
+    """Gera (y verdadeiro, y previsto) por lote, para avaliar um modelo sem carregar o histórico."""
+    for X, y in iter_batches(dataset, columns, **filters):
+        yield y, model.predict(scaler.transform(impute_batch(X, columns, scaler.mean_)))